@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Generates synthetic (but valid) dusk stencils to benchmark the front end.
+
+The generated stencils are deterministic for a given set of parameters & seed:
+
+    python benchmarks/generate.py --statements 64 --reduction-depth 2 > stencil.py
+"""
+import typing as t
+from argparse import ArgumentParser
+from random import Random
+
+locations = ["Vertex", "Edge", "Cell"]
+# every neighbor chain follows this cycle, e.g., `Vertex > Edge > Cell > Vertex`
+next_location = {"Vertex": "Edge", "Edge": "Cell", "Cell": "Vertex"}
+
+math_functions = ["sin", "cos", "exp", "sqrt", "abs", "floor"]
+operators = ["+", "-", "*"]
+reductions = ["sum_over", "min_over", "max_over", "reduce_over"]
+max_chain_length = 8
+
+default_parameters = {
+    "fields": 6,
+    "statements": 8,
+    "vertical_regions": 1,
+    "reduction_depth": 1,
+    "chain_length": 2,
+    "expression_size": 4,
+    "seed": 0,
+}
+
+
+class StencilGenerator:
+    """
+    Parameters:
+        * `fields`: number of dense fields (distributed over all location types)
+        * `statements`: number of assignments per vertical region
+        * `vertical_regions`: number of `with levels_upward/levels_downward` blocks
+        * `reduction_depth`: nesting depth of reductions in every statement
+        * `chain_length`: number of location types in every neighbor chain
+        * `expression_size`: number of terms of every (sub)expression
+    """
+
+    def __init__(
+        self,
+        fields: int = default_parameters["fields"],
+        statements: int = default_parameters["statements"],
+        vertical_regions: int = default_parameters["vertical_regions"],
+        reduction_depth: int = default_parameters["reduction_depth"],
+        chain_length: int = default_parameters["chain_length"],
+        expression_size: int = default_parameters["expression_size"],
+        seed: int = default_parameters["seed"],
+    ) -> None:
+        if fields < len(locations):
+            raise ValueError(f"Need at least {len(locations)} fields!")
+        if vertical_regions < 1 or statements < 1:
+            raise ValueError("Need at least one vertical region & statement!")
+        if chain_length < 2:
+            raise ValueError("Neighbor chains need at least 2 location types!")
+        if expression_size < 1:
+            raise ValueError("Expressions need at least one term!")
+
+        self.statements = statements
+        self.vertical_regions = vertical_regions
+        self.reduction_depth = reduction_depth
+        self.chain_length = chain_length
+        self.expression_size = expression_size
+        self.random = Random(seed)
+
+        self.dense_fields: t.Dict[str, t.List[str]] = {
+            location: [] for location in locations
+        }
+        for i in range(fields):
+            location = locations[i % len(locations)]
+            self.dense_fields[location].append(f"{location.lower()}_{i}")
+        # sparse fields are only declared once they are used
+        self.sparse_fields: t.Dict[t.Tuple[str, ...], str] = {}
+
+    def chain(self, start: str) -> t.Tuple[str, ...]:
+        chain = [start]
+        while len(chain) < self.chain_length:
+            chain.append(next_location[chain[-1]])
+        return tuple(chain)
+
+    def sparse_field(self, chain: t.Tuple[str, ...]) -> str:
+        if chain not in self.sparse_fields:
+            self.sparse_fields[chain] = f"sparse_{len(self.sparse_fields)}"
+        return self.sparse_fields[chain]
+
+    def term(self, location: str, index: t.Optional[str]) -> str:
+        kind = self.random.random()
+        field = self.random.choice(self.dense_fields[location])
+        if index is not None:
+            field += f"[{index}]"
+        if kind < 0.2:
+            return f"{self.random.randint(1, 99) / 10}"
+        elif kind < 0.4:
+            return f"{self.random.choice(math_functions)}({field})"
+        else:
+            return field
+
+    def expression(
+        self, location: str, depth: int, index: t.Optional[str] = None
+    ) -> str:
+        terms = [self.term(location, index) for _ in range(self.expression_size)]
+        if 0 < depth:
+            terms[self.random.randrange(len(terms))] = self.reduction(location, depth)
+
+        return self.join(terms)
+
+    def join(self, terms: t.List[str]) -> str:
+        # operator chains are nested as deep as they are long (in the SIR as well),
+        # so long expressions are split into parenthesized groups
+        if max_chain_length < len(terms):
+            terms = [
+                f"({self.join(terms[i : i + max_chain_length])})"
+                for i in range(0, len(terms), max_chain_length)
+            ]
+            return self.join(terms)
+
+        expression = terms[0]
+        for term in terms[1:]:
+            expression += f" {self.random.choice(operators)} {term}"
+        return expression
+
+    def reduction(self, location: str, depth: int) -> str:
+        chain = self.chain(location)
+        sparse_field = self.sparse_field(chain)
+        # the body is evaluated on the last location type of the chain,
+        # dense fields need an explicit index if the chain starts there as well
+        index = " > ".join(chain) if chain[0] == chain[-1] else None
+        body = f"{sparse_field} * ({self.expression(chain[-1], depth - 1, index)})"
+        chain = " > ".join(chain)
+
+        reduction = self.random.choice(reductions)
+        if reduction == "reduce_over":
+            return f"reduce_over({chain}, {body}, mul, init=1.0)"
+        else:
+            return f"{reduction}({chain}, {body})"
+
+    def statement(self) -> str:
+        location = self.random.choice(locations)
+        field = self.random.choice(self.dense_fields[location])
+        return f"{field} = {self.expression(location, self.reduction_depth)}"
+
+    def stencil(self, name: str = "generated") -> str:
+        regions = []
+        for region in range(self.vertical_regions):
+            direction = "levels_upward" if region % 2 == 0 else "levels_downward"
+            regions.append(
+                f"    with {direction}:\n"
+                + "".join(
+                    f"        {self.statement()}\n" for _ in range(self.statements)
+                )
+            )
+
+        parameters = [
+            f"    {field}: Field[{location}, K],\n"
+            for location, fields in self.dense_fields.items()
+            for field in fields
+        ] + [
+            f"    {field}: Field[{' > '.join(chain)}, K],\n"
+            for chain, field in self.sparse_fields.items()
+        ]
+
+        return (
+            "from dusk.script import *\n"
+            "\n"
+            "\n"
+            "@stencil\n"
+            f"def {name}(\n" + "".join(parameters) + "):\n" + "\n".join(regions)
+        )
+
+
+def generate_stencil(name: str = "generated", **parameters) -> str:
+    return StencilGenerator(**parameters).stencil(name)
+
+
+def add_parameter_arguments(argparser: ArgumentParser) -> None:
+    for parameter, default in default_parameters.items():
+        argparser.add_argument(
+            "--" + parameter.replace("_", "-"),
+            type=int,
+            dest=parameter,
+            default=default,
+            help=f"default: {default}",
+        )
+
+
+def main() -> None:
+    argparser = ArgumentParser(
+        description="Generates a synthetic dusk stencil to benchmark the front end.",
+    )
+    argparser.add_argument("--name", type=str, default="generated")
+    add_parameter_arguments(argparser)
+    args = vars(argparser.parse_args())
+
+    print(generate_stencil(**args), end="")
+
+
+if __name__ == "__main__":
+    main()
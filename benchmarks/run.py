@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Benchmarks how the phases of dusk's front end scale on synthetic stencils.
+
+Reports the time & peak memory of `str_to_pyast`, `pyast_to_sir` & `sir_to_json`
+for every benchmark as JSON. Peak memory only covers allocations through Python's
+allocator (`tracemalloc`), e.g., not the protobuf messages of the SIR:
+
+    python benchmarks/run.py -o results.json
+    python benchmarks/run.py --benchmark statements --benchmark reduction_depth
+    python benchmarks/run.py --sweep expression_size=4,16,64,256 --statements 4
+"""
+import json
+import platform
+import sys
+import tracemalloc
+import typing as t
+from argparse import ArgumentParser
+from statistics import median
+from time import perf_counter
+
+from generate import default_parameters, generate_stencil, add_parameter_arguments
+from dusk.transpile import str_to_pyast, pyast_to_sir, sir_to_json
+
+# every benchmark varies a single parameter (starting from `default_parameters`)
+suite = {
+    "fields": [6, 24, 96, 384],
+    "statements": [8, 32, 128, 512],
+    "vertical_regions": [1, 4, 16, 64],
+    "reduction_depth": [0, 1, 2, 3, 4],
+    "chain_length": [2, 3, 4, 6],
+    "expression_size": [4, 16, 64, 256],
+}
+
+
+def phases(source: str, filename: str) -> t.Iterator[t.Tuple[str, t.Callable]]:
+    # every phase consumes the result of the previous one
+    pyast = yield "str_to_pyast", lambda: str_to_pyast(source, filename=filename)
+    sir = yield "pyast_to_sir", lambda: pyast_to_sir(pyast, filename=filename)
+    yield "sir_to_json", lambda: sir_to_json(sir)
+
+
+def run_phases(source: str, filename: str, measure: t.Callable) -> t.Dict[str, t.Any]:
+    results = {}
+    generator = phases(source, filename)
+    name, phase = next(generator)
+    while True:
+        result, results[name] = measure(phase)
+        try:
+            name, phase = generator.send(result)
+        except StopIteration:
+            return results
+
+
+def measure_time(phase: t.Callable) -> t.Tuple[t.Any, float]:
+    start = perf_counter()
+    result = phase()
+    return result, perf_counter() - start
+
+
+def measure_memory(phase: t.Callable) -> t.Tuple[t.Any, int]:
+    # only allocations of this phase are traced
+    tracemalloc.start()
+    try:
+        result = phase()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def benchmark(parameters: t.Dict[str, int], repeat: int) -> t.Dict[str, t.Any]:
+    source = generate_stencil(**parameters)
+    filename = "<benchmark>"
+
+    times = [run_phases(source, filename, measure_time) for _ in range(repeat)]
+    # tracing allocations is slow, so memory is measured separately
+    memory = run_phases(source, filename, measure_memory)
+
+    return {
+        "parameters": parameters,
+        "source_lines": source.count("\n"),
+        "phases": {
+            phase: {
+                "time_min": min(run[phase] for run in times),
+                "time_median": median(run[phase] for run in times),
+                "peak_memory": memory[phase],
+            }
+            for phase in memory
+        },
+    }
+
+
+def parse_sweep(sweep: str) -> t.Tuple[str, t.List[int]]:
+    parameter, _, values = sweep.partition("=")
+    if parameter not in default_parameters or not values:
+        raise ValueError(f"Invalid sweep '{sweep}', expected <parameter>=<v1>,<v2>,...")
+    return parameter, [int(value) for value in values.split(",")]
+
+
+def main() -> None:
+    argparser = ArgumentParser(
+        description="Benchmarks dusk's front end on synthetic stencils.",
+    )
+    argparser.add_argument(
+        "-o",
+        type=str,
+        dest="out_file",
+        help="Output file (JSON), default: stdout",
+    )
+    argparser.add_argument(
+        "--benchmark",
+        action="append",
+        choices=suite.keys(),
+        help="Benchmark of the suite to run (can be repeated), default: all",
+    )
+    argparser.add_argument(
+        "--sweep",
+        type=str,
+        help="Runs '<parameter>=<v1>,<v2>,...' instead of the suite",
+    )
+    argparser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of timed runs per benchmark, default: 5",
+    )
+    add_parameter_arguments(argparser)
+    args = argparser.parse_args()
+
+    base_parameters = {
+        parameter: getattr(args, parameter) for parameter in default_parameters
+    }
+    if args.sweep is not None:
+        sweeps = dict([parse_sweep(args.sweep)])
+    else:
+        sweeps = {name: suite[name] for name in (args.benchmark or suite.keys())}
+
+    results = []
+    for parameter, values in sweeps.items():
+        for value in values:
+            result = benchmark({**base_parameters, parameter: value}, args.repeat)
+            results.append({"name": f"{parameter}={value}", **result})
+            print(f"{results[-1]['name']}: done", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "benchmarks": results,
+    }
+    if args.out_file is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.out_file, "w") as out_file:
+            json.dump(report, out_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
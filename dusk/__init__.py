@@ -0,0 +1 @@
+__version__ = "0.6.0-dev"
@@ -0,0 +1,228 @@
+from __future__ import annotations
+import typing as t
+
+import ast
+import os
+from glob import glob
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+
+from dusk import __version__
+
+if t.TYPE_CHECKING:
+    from dawn4py.serialization.SIR import SIR, Stencil
+
+
+default_max_size = 256 * 1024 * 1024
+
+# modules which define how stencils are translated (see `grammar_version`),
+# besides the passes
+grammar_modules = [
+    "grammar.py",
+    "semantics.py",
+    "match.py",
+    "errors.py",
+    "script/__init__.py",
+    "script/internal.py",
+    "script/math.py",
+    "script/stubs.py",
+]
+_grammar_version: t.Optional[str] = None
+
+
+def grammar_version() -> str:
+    # derived from the sources, so nobody has to remember bumping a version
+    global _grammar_version
+    if _grammar_version is None:
+        _grammar_version = compute_grammar_version()
+    return _grammar_version
+
+
+def compute_grammar_version() -> str:
+    # reads the sources again (e.g., to detect changes while running)
+    directory = os.path.dirname(__file__)
+    # every pass changes the translation as well
+    passes = glob(os.path.join(directory, "passes", "*.py"))
+    modules = grammar_modules + sorted(os.path.relpath(p, directory) for p in passes)
+    return source_digest(modules)
+
+
+def source_digest(modules: t.List[str]) -> str:
+    # hashes the sources of modules of dusk (paths relative to the package)
+    directory = os.path.dirname(__file__)
+    digest = sha256()
+    for module in modules:
+        with open(os.path.join(directory, module), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def dawn4py_version() -> str:
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        return version("dawn4py")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class DiskCache:
+    """
+    A persistent, size-bounded key-value store of bytes (one file per entry).
+
+    Entries are written atomically, so multiple processes can share a cache.
+    Once the total size exceeds `max_size`, the least recently used entries are
+    evicted (reads update the modification time of an entry).
+    """
+
+    def __init__(self, directory: str, max_size: int = default_max_size) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        # total size of all entries (only scanned once something is stored)
+        self.size: t.Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> t.Optional[bytes]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                value = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # might also have been evicted by another process in the meantime
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        # readers never see partially written entries
+        file = NamedTemporaryFile(
+            dir=self.directory, prefix=".", suffix=".tmp", delete=False
+        )
+        try:
+            with file:
+                file.write(value)
+            # an overwritten entry doesn't count anymore
+            try:
+                replaced = os.stat(self.path(key)).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(file.name, self.path(key))
+        except BaseException:
+            os.remove(file.name)
+            raise
+
+        if self.size is None:
+            self.size = sum(size for _, _, size in self.entries())
+        else:
+            self.size += len(value) - replaced
+        if self.max_size < self.size:
+            self.evict()
+
+    def discard(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> t.List[t.Tuple[float, str, int]]:
+        # (modification time, path, size) for every entry
+        entries = []
+        with os.scandir(self.directory) as dir_entries:
+            for entry in dir_entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def evict(self) -> None:
+        self.size = 0
+        entries = sorted(self.entries(), reverse=True)
+        for _, path, size in entries:
+            if self.size + size <= self.max_size:
+                self.size += size
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> t.Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class StencilCache(DiskCache):
+    """
+    Caches the translation of single stencils (Python AST -> `Stencil` of the SIR).
+
+    The key of a stencil is its normalized AST (without source locations),
+    dusk's version, the version of the grammar, the passes & dawn4py's version.
+    """
+
+    def __init__(self, directory: str, max_size: int = default_max_size) -> None:
+        super().__init__(os.path.join(directory, "stencils"), max_size)
+
+    def key(self, stencil: ast.FunctionDef, passes: t.Sequence[t.Callable] = ()) -> str:
+        digest = sha256()
+        digest.update(
+            f"{__version__}\n{grammar_version()}\n{dawn4py_version()}\n".encode()
+        )
+        digest.update(f"{' '.join(p.__name__ for p in passes)}\n".encode())
+        digest.update(ast.dump(stencil).encode())
+        return digest.hexdigest()
+
+    def load(self, key: str) -> t.Optional[Stencil]:
+        from dawn4py.serialization.SIR import Stencil
+        from google.protobuf.message import DecodeError
+
+        value = self.get(key)
+        if value is None:
+            return None
+        stencil = Stencil()
+        try:
+            stencil.ParseFromString(value)
+        except DecodeError:
+            # e.g., written by an incompatible version of dawn4py
+            self.hits -= 1
+            self.misses += 1
+            self.discard(key)
+            return None
+        return stencil
+
+    def store(self, key: str, stencil: Stencil) -> None:
+        self.put(key, stencil.SerializeToString())
+
+
+class CodegenCache(DiskCache):
+    """
+    Caches the code generated by Dawn for a SIR.
+
+    The key is the serialized SIR, the backend, the pass groups & dawn4py's version.
+    """
+
+    def __init__(self, directory: str, max_size: int = default_max_size) -> None:
+        super().__init__(os.path.join(directory, "codegen"), max_size)
+
+    def key(self, sir: SIR, backend: str, groups: t.List) -> str:
+        digest = sha256()
+        digest.update(f"{dawn4py_version()}\n{backend}\n".encode())
+        digest.update(f"{[str(group) for group in groups]}\n".encode())
+        digest.update(sir.SerializeToString(deterministic=True))
+        return digest.hexdigest()
+
+    def load(self, key: str) -> t.Optional[str]:
+        value = self.get(key)
+        return value.decode() if value is not None else None
+
+    def store(self, key: str, code: str) -> None:
+        self.put(key, code.encode())
@@ -1,7 +1,233 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
-from dusk.transpile import transpile, backend_map, default_backend
-from os import path
+from dusk.outputs import (
+    backend_map,
+    default_backend,
+    sir_formats,
+    default_sir_format,
+    binary_sir_formats,
+    streaming_sir_formats,
+)
+from dusk.profiling import profile_matchers, profile_phases
+from dusk.cache import StencilCache, CodegenCache
+from dusk.errors import DuskSyntaxError, DuskStencilErrors
+from contextlib import nullcontext
+from filecmp import cmp
+from glob import glob, has_magic
+from io import StringIO, BytesIO
+from os import path, makedirs, walk, remove, replace
+from tempfile import NamedTemporaryFile
+import typing as t
+import traceback
+import sys
+
+
+class FileJob(t.NamedTuple):
+    in_file: str
+    # backend -> output file (generated code), an output directory if `per_stencil`
+    out_files: t.Dict[str, str]
+    sir_file: t.Optional[str]
+    per_stencil: bool = False
+
+
+class FileStatus(t.NamedTuple):
+    in_file: str
+    status: str  # "ok", "failed" or "skipped"
+    message: str = ""
+    cache_stats: t.Tuple[int, int, int, int] = (0, 0, 0, 0)
+    # the outputs (see `write_outputs`), the SIR is `bytes` for binary formats (&
+    # `None` if it was streamed to its file already)
+    sir: t.Union[str, bytes, None] = None
+    code: t.Optional[t.Dict[str, str]] = None  # output file -> generated code
+
+
+def expand_inputs(inputs: t.List[str]) -> t.List[t.Tuple[str, str]]:
+    # returns `(file, name)` pairs, where `name` is used to derive the outputs
+    # (the path relative to a given directory, otherwise the basename)
+    files = []
+    for input in inputs:
+        for match in (
+            sorted(glob(input, recursive=True)) if has_magic(input) else [input]
+        ):
+            if path.isdir(match):
+                for root, _, filenames in sorted(walk(match)):
+                    files.extend(
+                        (
+                            path.join(root, filename),
+                            path.relpath(path.join(root, filename), match),
+                        )
+                        for filename in sorted(filenames)
+                        if filename.endswith(".py")
+                    )
+            else:
+                files.append((match, path.basename(match)))
+    return files
+
+
+def transpile_file(
+    job: FileJob,
+    verbose: bool,
+    cache_dir: t.Optional[str],
+    optimize: bool = False,
+    jobs: t.Optional[int] = 1,
+    sir_format: str = default_sir_format,
+    stream_sir: bool = False,
+) -> FileStatus:
+    # only generates the outputs which `job` asks for, but doesn't write them
+    # (except for a SIR in a streaming format if `stream_sir`: it's written to its
+    # file while the stencils are translated, but only kept if transpiling succeeds)
+    binary = sir_format in binary_sir_formats
+    if (
+        job.sir_file is None
+        or not stream_sir
+        or sir_format not in streaming_sir_formats
+    ):
+        sir_stream = None
+        if job.sir_file is not None:
+            sir_stream = BytesIO() if binary else StringIO()
+        return transpile_outputs(
+            job, sir_stream, verbose, cache_dir, optimize, jobs, sir_format
+        )
+
+    sir_dir = path.dirname(job.sir_file) or "."
+    makedirs(sir_dir, exist_ok=True)
+    sir_file = NamedTemporaryFile(
+        "wb" if binary else "w", dir=sir_dir, prefix=".", suffix=".tmp", delete=False
+    )
+    try:
+        with sir_file:
+            status = transpile_outputs(
+                job, sir_file, verbose, cache_dir, optimize, jobs, sir_format
+            )
+    except BaseException:
+        remove(sir_file.name)
+        raise
+    if status.status == "ok":
+        replace_if_changed(job.sir_file, sir_file.name)
+    else:
+        remove(sir_file.name)
+    return status
+
+
+def transpile_outputs(
+    job: FileJob,
+    sir_stream: t.Optional[t.IO],
+    verbose: bool,
+    cache_dir: t.Optional[str],
+    optimize: bool,
+    jobs: t.Optional[int],
+    sir_format: str,
+) -> FileStatus:
+    # the SIR is written to `sir_stream`, & only returned if it's a buffer
+    # (imported here, so forwarding to a server doesn't need to load the grammar)
+    from dusk.transpile import transpile, transpile_per_stencil
+    from dusk.passes import optimization_passes
+
+    passes = optimization_passes if optimize else ()
+
+    out_streams = {backend: StringIO() for backend in job.out_files}
+    codes: t.Dict[str, str] = {}
+    sir_output = None
+
+    stencil_cache, codegen_cache = None, None
+    if cache_dir is not None:
+        stencil_cache = StencilCache(cache_dir)
+        codegen_cache = CodegenCache(cache_dir)
+
+    try:
+        if job.per_stencil:
+            stencil_codes = transpile_per_stencil(
+                job.in_file,
+                sir_stream,
+                list(job.out_files),
+                verbose=verbose,
+                stencil_cache=stencil_cache,
+                codegen_cache=codegen_cache,
+                jobs=jobs,
+                sir_format=sir_format,
+                passes=passes,
+            )
+            stencils = len(stencil_codes)
+            for stencil, backend_codes in stencil_codes.items():
+                for backend, code in backend_codes.items():
+                    out_dir = job.out_files[backend]
+                    codes[path.join(out_dir, f"{stencil}_{backend}.cpp")] = code
+        else:
+            stencils = transpile(
+                job.in_file,
+                sir_stream,
+                out_streams,
+                verbose=verbose,
+                stencil_cache=stencil_cache,
+                codegen_cache=codegen_cache,
+                jobs=jobs,
+                sir_format=sir_format,
+                passes=passes,
+            )
+            for backend, stream in out_streams.items():
+                codes[job.out_files[backend]] = stream.getvalue()
+    except (DuskSyntaxError, DuskStencilErrors) as error:
+        return FileStatus(job.in_file, "failed", str(error))
+    except Exception:
+        return FileStatus(job.in_file, "failed", traceback.format_exc())
+
+    cache_stats = (0, 0, 0, 0)
+    if cache_dir is not None:
+        cache_stats = (
+            stencil_cache.hits,
+            stencil_cache.misses,
+            codegen_cache.hits,
+            codegen_cache.misses,
+        )
+    if isinstance(sir_stream, (StringIO, BytesIO)):
+        sir_output = sir_stream.getvalue()
+    if not stencils:
+        return FileStatus(
+            job.in_file, "skipped", "no stencils", cache_stats, sir=sir_output
+        )
+
+    return FileStatus(
+        job.in_file,
+        "ok",
+        ", ".join(codes.keys()),
+        cache_stats,
+        sir=sir_output,
+        code=codes,
+    )
+
+
+def write_outputs(job: FileJob, status: FileStatus) -> None:
+    # outputs are only written if transpiling succeeded
+    if status.status != "ok":
+        return
+    outputs = list(status.code.items())
+    outputs.append((job.sir_file, status.sir))
+    for out_file, output in outputs:
+        if out_file is not None and output is not None:
+            write_if_changed(out_file, output)
+
+
+def write_if_changed(out_file: str, output: t.Union[str, bytes]) -> None:
+    # unchanged outputs keep their modification time (so build systems don't
+    # rebuild them)
+    data = output if isinstance(output, bytes) else output.encode()
+    try:
+        with open(out_file, "rb") as file:
+            if file.read() == data:
+                return
+    except FileNotFoundError:
+        pass
+    makedirs(path.dirname(out_file) or ".", exist_ok=True)
+    with open(out_file, "wb") as file:
+        file.write(data)
+
+
+def replace_if_changed(out_file: str, new_file: str) -> None:
+    # like `write_if_changed`, but the output is already written to `new_file`
+    if path.exists(out_file) and cmp(out_file, new_file, shallow=False):
+        remove(new_file)
+    else:
+        replace(new_file, out_file)
 
 
 def main() -> None:
@@ -9,26 +235,72 @@ def main() -> None:
     argparser = ArgumentParser(
         description="Transforms the Python embedded DSL to generated code through Dawn.",
     )
-    argparser.add_argument("in_file", type=str, help="Input file (dusk stencil)")
+    argparser.add_argument(
+        "in_files",
+        type=str,
+        nargs="+",
+        help="Input files (dusk stencils), directories or globs",
+    )
     argparser.add_argument(
         "-o",
         type=str,
         dest="out_file",
-        help="Output file (generated code), default: <base_in_file>_<backend>.cpp",
+        help="Output file (generated code) for a single input file, "
+        "default: <out_dir>/<base_in_file>_<backend>.cpp",
+    )
+    argparser.add_argument(
+        "--out-dir",
+        type=str,
+        dest="out_dir",
+        default=".",
+        help="Output directory (relative paths of files in input directories are kept)",
+    )
+    argparser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        dest="jobs",
+        default=1,
+        help="Number of worker processes (for a single input file, its stencils are "
+        "translated in parallel), default: 1",
     )
     argparser.add_argument(
         "-b",
         type=str,
-        dest="backend",
-        choices=set(backend_map.keys()),
+        dest="backends",
         default=default_backend,
-        help="Backend to use to generate code",
+        help="Backend to use to generate code, can be multiple ones separated by "
+        "commas (the sir is optimized only once for all of them), "
+        f"choices: {', '.join(backend_map.keys())}, default: %(default)s",
     )
     argparser.add_argument(
         "--dump-sir",
         default=False,
         action="store_true",
-        help="Dumps (also) sir to <base_in_file>.json",
+        help="Dumps (also) sir to <out_dir>/<base_in_file>.json "
+        "(or the extension of --sir-format)",
+    )
+    argparser.add_argument(
+        "--sir-format",
+        type=str,
+        dest="sir_format",
+        choices=list(sir_formats.keys()),
+        default=default_sir_format,
+        help="Format of the dumped sir, default: %(default)s",
+    )
+    argparser.add_argument(
+        "--per-stencil",
+        dest="per_stencil",
+        default=False,
+        action="store_true",
+        help="Generates the code of every stencil separately (unaffected by the "
+        "other stencils) to <out_dir>/<base_in_file>/<stencil>_<backend>.cpp",
+    )
+    argparser.add_argument(
+        "--optimize",
+        default=False,
+        action="store_true",
+        help="Runs dusk's optimization passes over the sir (see `dusk.passes`)",
     )
     argparser.add_argument(
         "-v",
@@ -38,30 +310,169 @@ def main() -> None:
         action="store_true",
         help="Enables verbosity of dawn",
     )
+    argparser.add_argument(
+        "--profile-matchers",
+        default=False,
+        action="store_true",
+        help="Reports statistics about the grammar rules & matchers to stderr",
+    )
+    argparser.add_argument(
+        "--profile",
+        type=str,
+        dest="profile_file",
+        help="Writes a timeline of the phases (Chrome trace format) to this file",
+    )
+    argparser.add_argument(
+        "--cache-dir",
+        type=str,
+        dest="cache_dir",
+        help="Caches translated stencils & generated code in this directory",
+    )
+    argparser.add_argument(
+        "--cache-stats",
+        default=False,
+        action="store_true",
+        help="Reports cache hits & misses to stderr",
+    )
+    argparser.add_argument(
+        "--no-server",
+        dest="server",
+        default=True,
+        action="store_false",
+        help="Doesn't forward to a running server (see `dusk-serve`)",
+    )
 
     args = argparser.parse_args()
 
-    in_filename = path.splitext(path.basename(args.in_file))[0]
+    in_files = expand_inputs(args.in_files)
+    if not in_files:
+        argparser.error("no input files found")
+    if args.out_file is not None and len(in_files) != 1:
+        argparser.error("-o is only supported for a single input file")
+    backends = args.backends.split(",")
+    for backend in backends:
+        if backend not in backend_map:
+            argparser.error(
+                f"invalid backend '{backend}' (choose from "
+                f"{', '.join(backend_map.keys())})"
+            )
+    if len(set(backends)) != len(backends):
+        argparser.error("backends are given multiple times")
+    if args.out_file is not None and len(backends) != 1:
+        argparser.error("-o is only supported for a single backend")
+    if args.out_file is not None and args.per_stencil:
+        argparser.error("-o is not supported with --per-stencil")
+    profiling = args.profile_matchers or args.profile_file is not None
+    # the stencils of a single file are translated in workers with -j as well
+    if profiling and args.jobs != 1:
+        argparser.error("profiling is only supported with -j 1")
 
-    if args.out_file is None:
-        args.out_file = in_filename + "_" + args.backend + ".cpp"
-    out_stream = open(args.out_file, "w")
+    jobs = []
+    for in_file, name in in_files:
+        base_name = path.join(args.out_dir, path.splitext(name)[0])
+        if args.per_stencil:
+            out_files = {backend: base_name for backend in backends}
+        else:
+            out_files = {
+                backend: args.out_file or base_name + "_" + backend + ".cpp"
+                for backend in backends
+            }
+        sir_file = base_name + sir_formats[args.sir_format] if args.dump_sir else None
+        jobs.append(FileJob(in_file, out_files, sir_file, args.per_stencil))
+    out_files = [out for job in jobs for out in set(job.out_files.values())]
+    if len(set(out_files)) != len(out_files):
+        argparser.error(
+            "multiple input files would be written to the same output file "
+            "(pass their directory instead to keep their relative paths)"
+        )
 
-    sir_stream = None
-    if args.dump_sir:
-        sir_stream = open(in_filename + ".json", "w")
+    options = (args.verbose, args.cache_dir, args.optimize)
+    client = None
+    if args.server and not profiling:
+        from dusk.server import Client
 
-    transpile(
-        args.in_file,
-        sir_stream,
-        out_stream,
-        backend=args.backend,
-        verbose=args.verbose,
-    )
+        client = Client.connect()
+
+    if client is not None:
+        try:
+            statuses = client.transpile(jobs, *options, sir_format=args.sir_format)
+        finally:
+            client.close()
+
+    elif len(jobs) == 1 or args.jobs == 1:
+        # the stencils of a single file are translated in parallel instead
+        stencil_jobs = args.jobs if len(jobs) == 1 else 1
+        with (
+            profile_matchers() if args.profile_matchers else nullcontext()
+        ) as profile:
+            with (
+                profile_phases() if args.profile_file is not None else nullcontext()
+            ) as phases:
+                try:
+                    statuses = [
+                        transpile_file(
+                            job,
+                            *options,
+                            jobs=stencil_jobs,
+                            sir_format=args.sir_format,
+                            stream_sir=True,
+                        )
+                        for job in jobs
+                    ]
+                finally:
+                    if phases is not None:
+                        phases.write_chrome_trace(args.profile_file)
+        if profile is not None:
+            sys.stderr.write(profile.report())
+
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # workers are reused, so dawn4py & the grammar are only loaded once per worker
+        with ProcessPoolExecutor(args.jobs) as pool:
+            futures = [
+                pool.submit(
+                    transpile_file,
+                    job,
+                    *options,
+                    sir_format=args.sir_format,
+                    stream_sir=True,
+                )
+                for job in jobs
+            ]
+            statuses = [future.result() for future in futures]
+
+    for job, status in zip(jobs, statuses):
+        write_outputs(job, status)
+
+    report(statuses, verbose=1 < len(jobs))
+    if args.cache_stats and args.cache_dir is not None:
+        stats = [sum(counts) for counts in zip(*(s.cache_stats for s in statuses))]
+        sys.stderr.write(f"stencil cache: {stats[0]} hits, {stats[1]} misses\n")
+        sys.stderr.write(f"codegen cache: {stats[2]} hits, {stats[3]} misses\n")
+
+    if any(status.status == "failed" for status in statuses):
+        sys.exit(1)
+
+
+def report(statuses: t.List[FileStatus], verbose: bool) -> None:
+    for status in statuses:
+        if status.status == "failed":
+            sys.stderr.write(f"FAILED {status.in_file}:\n{status.message}\n")
+        elif verbose:
+            sys.stderr.write(
+                f"{status.status.upper()} {status.in_file}: {status.message}\n"
+            )
 
-    out_stream.close()
-    if sir_stream is not None:
-        sir_stream.close()
+    if verbose:
+        counts = {
+            kind: sum(status.status == kind for status in statuses)
+            for kind in ("ok", "failed", "skipped")
+        }
+        sys.stderr.write(
+            f"{len(statuses)} files: {counts['ok']} ok, {counts['failed']} failed, "
+            f"{counts['skipped']} skipped\n"
+        )
 
 
 if __name__ == "__main__":
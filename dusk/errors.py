@@ -8,6 +8,10 @@ class DuskInternalError(Exception):
     def __init__(self, message):
         self.message = message
 
+    def __reduce__(self):
+        # errors are pickled when stencils are translated in worker processes
+        return type(self), (self.message,)
+
 
 class LocationInfo:
     def __init__(
@@ -47,5 +51,22 @@ class DuskSyntaxError(Exception):
         if self.loc is None:
             self.loc = LocationInfo.from_node(node)
 
+    def __reduce__(self):
+        return type(self), (self.text, self.node, self.loc)
+
     def __str__(self):
         return f"DuskSyntaxError: {self.text}\nat {self.loc}\n({self.node})"
+
+
+class DuskStencilErrors(Exception):
+    # errors of multiple stencils, which were translated independently
+    def __init__(self, errors: t.List[t.Tuple[str, Exception]]) -> None:
+        self.errors = errors
+
+    def __reduce__(self):
+        return type(self), (self.errors,)
+
+    def __str__(self):
+        return "\n\n".join(
+            f"In stencil '{stencil}':\n{error}" for stencil, error in self.errors
+        )
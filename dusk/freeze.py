@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Freezes the compiled matchers of the grammar.
+
+Compiling the grammar's matchers (see `dusk.match.compile_matcher`) dominates
+the time it takes to import `dusk.grammar`. Like Python's bytecode, the generated
+functions are stored in `dusk/__pycache__` once per interpreter, so later imports
+only have to load them. A frozen matcher refers to its constants by their position
+in the matcher graph (see `dusk.match.FrozenMatcher`), so no source is generated
+either. The frozen matchers are keyed by the interpreter (e.g., the `ast` module
+differs between Python versions) & the sources of the grammar. Matchers which
+aren't frozen are still compiled at import time.
+
+`dusk.grammar` freezes its matchers when it's imported for the first time, run
+`python -m dusk.freeze` to do so ahead of time (e.g., before installing dusk into
+a read-only location).
+"""
+import typing as t
+import builtins
+import marshal
+import os
+import sys
+from argparse import ArgumentParser
+from glob import glob
+from tempfile import NamedTemporaryFile
+from textwrap import indent
+
+from dusk.cache import grammar_modules, source_digest
+from dusk.match import (
+    CompiledMatcher,
+    FrozenMatcher,
+    generate_matcher,
+    matcher_graph,
+    constant_reference,
+    frozen_matchers,
+    shared_namespace,
+)
+
+
+def frozen_path() -> t.Optional[str]:
+    # `None` if the interpreter doesn't cache any bytecode
+    tag = sys.implementation.cache_tag
+    if tag is None:
+        return None
+    version = source_digest(grammar_modules)[:16]
+    return os.path.join(
+        os.path.dirname(__file__),
+        "__pycache__",
+        f"_frozen_matchers.{tag}.{version}.bin",
+    )
+
+
+def grammar_matchers() -> t.List[CompiledMatcher]:
+    from dusk.grammar import Grammar, DispatchTable, stencil_recognizer
+
+    matchers = [stencil_recognizer]
+    for attribute in vars(Grammar).values():
+        if isinstance(attribute, DispatchTable):
+            matchers.extend(
+                recognizer
+                for _, (recognizer, _) in attribute.rules.entries
+                if recognizer is not None
+            )
+        elif isinstance(getattr(attribute, "matcher", None), CompiledMatcher):
+            matchers.append(attribute.matcher)
+    return matchers
+
+
+def freeze(matchers: t.List[CompiledMatcher]) -> bytes:
+    # matchers are frozen by name, matchers whose constants
+    # can't be found in their matcher graph are skipped
+    factories = []
+    entries = []
+    names = set()
+    for matcher in matchers:
+        if matcher.name is None or matcher.name in names:
+            continue
+        names.add(matcher.name)
+
+        source, namespace, test, diagnose = generate_matcher(
+            matcher.matcher, matcher.frame
+        )
+        graph = matcher_graph(matcher.matcher, matcher.frame)
+        references = []
+        for parameter, value in namespace.items():
+            reference = None
+            if parameter not in shared_namespace:
+                reference = constant_reference(value, graph)
+                if reference is None:
+                    break
+            references.append(reference)
+        else:
+            factory = f"factory_{len(factories)}"
+            factories.append(
+                f"def {factory}({', '.join(namespace)}):\n"
+                + indent(source, "    ")
+                + f"    return {test}, {diagnose}\n"
+            )
+            entries.append(
+                f"    {matcher.name!r}: "
+                f"({factory}, {tuple(namespace)!r}, {tuple(references)!r}, {len(graph)}),\n"
+            )
+
+    source = (
+        "".join(f"{factory}\n\n" for factory in factories)
+        + "matchers = {\n"
+        + "".join(entries)
+        + "}\n"
+    )
+    return marshal.dumps(builtins.compile(source, "<dusk frozen matchers>", "exec"))
+
+
+def load(path: t.Optional[str] = None) -> t.Dict[str, FrozenMatcher]:
+    if path is None:
+        path = frozen_path()
+    if path is None:
+        return {}
+    try:
+        with open(path, "rb") as file:
+            code = marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    namespace = {}
+    exec(code, namespace)
+    return {
+        name: FrozenMatcher(*entry) for name, entry in namespace["matchers"].items()
+    }
+
+
+def store(frozen: bytes, path: str) -> None:
+    # written atomically, so concurrent imports never see a partial file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    file = NamedTemporaryFile(
+        dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp", delete=False
+    )
+    try:
+        with file:
+            file.write(frozen)
+        os.replace(file.name, path)
+    except BaseException:
+        os.remove(file.name)
+        raise
+
+
+def update(matchers: t.List[CompiledMatcher]) -> None:
+    # freezes the matchers for later imports if none could be loaded
+    if sys.dont_write_bytecode or frozen_matchers():
+        return
+    if all(matcher.frozen for matcher in matchers):
+        return
+    path = frozen_path()
+    if path is None:
+        return
+    try:
+        store(freeze(matchers), path)
+        # the frozen matchers of older versions of the grammar
+        prefix = os.path.basename(path).rsplit(".", 2)[0]
+        for stale in glob(os.path.join(os.path.dirname(path), f"{prefix}.*.bin")):
+            if stale != path:
+                os.remove(stale)
+    except OSError:
+        # e.g., dusk is installed into a read-only location
+        pass
+
+
+def main() -> None:
+    argparser = ArgumentParser(
+        description="Freezes the compiled matchers of dusk's grammar "
+        "for the running interpreter.",
+    )
+    argparser.add_argument(
+        "-o",
+        type=str,
+        dest="out_file",
+        default=frozen_path(),
+        help="Output file, default: %(default)s",
+    )
+    args = argparser.parse_args()
+    if args.out_file is None:
+        argparser.error("The interpreter doesn't cache bytecode, pass `-o`!")
+
+    store(freeze(grammar_matchers()), args.out_file)
+
+
+if __name__ == "__main__":
+    main()
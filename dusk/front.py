@@ -1,7 +1,16 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
-from dusk.transpile import transpile
-from sys import stdout
+from dusk.outputs import (
+    sir_formats,
+    default_sir_format,
+    streaming_sir_formats,
+    binary_sir_formats,
+)
+from dusk.profiling import profile_phases
+from dusk.cache import StencilCache
+from dusk.cli import FileJob
+from contextlib import nullcontext
+import sys
 
 
 def main() -> None:
@@ -10,10 +19,93 @@ def main() -> None:
         description="Transforms the Python embedded DSL to SIR.",
     )
     argparser.add_argument("in_file", type=str, help="Input file (dusk stencil)")
+    argparser.add_argument(
+        "--profile",
+        type=str,
+        dest="profile_file",
+        help="Writes a timeline of the phases (Chrome trace format) to this file",
+    )
+    argparser.add_argument(
+        "--cache-dir",
+        type=str,
+        dest="cache_dir",
+        help="Caches the translation of unchanged stencils in this directory",
+    )
+    argparser.add_argument(
+        "--format",
+        type=str,
+        dest="sir_format",
+        choices=list(sir_formats.keys()),
+        default=default_sir_format,
+        help="Format of the sir (stencils are written as soon as they are translated "
+        f"for {' & '.join(streaming_sir_formats)}), default: %(default)s",
+    )
+    argparser.add_argument(
+        "--optimize",
+        default=False,
+        action="store_true",
+        help="Runs dusk's optimization passes over the sir (see `dusk.passes`)",
+    )
+    argparser.add_argument(
+        "--no-server",
+        dest="server",
+        default=True,
+        action="store_false",
+        help="Doesn't forward to a running server (see `dusk-serve`)",
+    )
 
     args = argparser.parse_args()
+    binary = args.sir_format in binary_sir_formats
+    out_file = sys.stdout.buffer if binary else sys.stdout
+
+    # streaming formats are written locally, so consumers can start early
+    if (
+        args.server
+        and args.profile_file is None
+        and args.sir_format not in streaming_sir_formats
+    ):
+        from dusk.server import Client
+
+        client = Client.connect()
+        if client is not None:
+            try:
+                # only the SIR is generated
+                job = FileJob(args.in_file, {}, "-")
+                (status,) = client.transpile(
+                    [job], False, args.cache_dir, args.optimize, args.sir_format
+                )
+            finally:
+                client.close()
+            if status.status == "failed":
+                sys.stderr.write(status.message + "\n")
+                sys.exit(1)
+            out_file.write(status.sir or (b"" if binary else ""))
+            return
+
+    # only imported without a server, which saves loading the grammar & dawn4py
+    from dusk.transpile import transpile
+    from dusk.passes import optimization_passes
+
+    stencil_cache = None
+    if args.cache_dir is not None:
+        stencil_cache = StencilCache(args.cache_dir)
 
-    transpile(args.in_file, stdout, None)  # don't need to codegenerate
+    with (
+        profile_phases() if args.profile_file is not None else nullcontext()
+    ) as phases:
+        try:
+            # don't need to codegenerate
+            transpile(
+                args.in_file,
+                out_file,
+                None,
+                stencil_cache=stencil_cache,
+                sir_format=args.sir_format,
+                passes=optimization_passes if args.optimize else (),
+            )
+        finally:
+            if phases is not None:
+                phases.write_chrome_trace(args.profile_file)
 
 
 if __name__ == "__main__":
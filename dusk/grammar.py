@@ -1,6 +1,7 @@
 from __future__ import annotations
 import typing as t
 from ast import *
+from inspect import signature, Parameter
 
 import dawn4py.serialization.AST as ast_ser
 from dawn4py.serialization.utils import (
@@ -33,6 +34,9 @@ from dawn4py.serialization.utils import (
 from dusk.match import (
     match,
     does_match,
+    compile_matcher,
+    first_types,
+    TypeIndex,
     Ignore as _,
     Optional,
     OneOf,
@@ -40,6 +44,10 @@ from dusk.match import (
     Repeat,
     FixedList,
     BreakPoint,
+    MatchMemo,
+    CaptureFrame,
+    capture_names,
+    MISSING,
 )
 from dusk.semantics import (
     Symbol,
@@ -56,6 +64,7 @@ from dusk.script.stubs import (
     BINARY_MATH_FUNCTIONS,
 )
 from dusk.errors import DuskInternalError, DuskSyntaxError
+from dusk import profiling, freeze
 from dusk.util import pprint_matcher as pprint
 
 
@@ -70,40 +79,150 @@ def name(id, ctx=Load) -> Name:
 
 def transform(matcher) -> t.Callable:
     def decorator(transformer: t.Callable) -> t.Callable:
+        rule_name = transformer.__qualname__
+
+        # every capture is passed as the parameter of the same name: the slots are
+        # in the order of the parameters, so if the captures are consecutive
+        # parameters, they are passed positionally after the rule's other
+        # positional arguments
+        capture_set = set(capture_names(matcher))
+        parameters = dict(list(signature(transformer).parameters.items())[1:])
+        if not capture_set <= parameters.keys():
+            raise DuskInternalError(
+                f"The captures {sorted(capture_set)} of '{rule_name}' have to be "
+                "parameters of the rule!"
+            )
+        order = list(parameters)
+        names = [parameter for parameter in order if parameter in capture_set]
+        start = order.index(names[0]) if names else 0
+        # the number of positional arguments which precede the captures
+        leading = start if order[start : start + len(names)] == names else None
+        layout = CaptureFrame(
+            names,
+            [
+                MISSING
+                if parameters[capture].default is Parameter.empty
+                else parameters[capture].default
+                for capture in names
+            ],
+        )
+        has_required = MISSING in layout.defaults
+
+        # the matcher is compiled once, when the grammar is constructed
+        compiled = compile_matcher(matcher, name=rule_name, frame=layout)
+
+        def apply_rule(self, node, *args, **kwargs):
+            # dispatching may have matched the node already
+            outcome = self.memo.outcome(compiled, node)
+            if outcome is not None:
+                captures = outcome[1]
+                if captures is None:
+                    compiled.raise_error(node)
+            else:
+                # every grammar reuses a frame per rule: the captures are copied
+                # into the arguments before the rule can be applied again
+                captures = self.frames.get(rule_name)
+                if captures is None:
+                    captures = self.frames[rule_name] = layout.new()
+                else:
+                    captures[:] = layout.defaults
+                if not compiled.test(node, captures):
+                    compiled.raise_error(node)
+
+            if has_required and MISSING in captures:
+                raise DuskInternalError(
+                    f"Rule '{rule_name}' is missing captures for node '{node}'!"
+                )
+            if len(args) == leading:
+                return transformer(self, *args, *captures, **kwargs)
+            return transformer(
+                self, *args, **dict(zip(layout.names, captures)), **kwargs
+            )
+
         def transformer_with_matcher(self, node, *args, **kwargs):
-            captures = {}
-            match(matcher, node, capturer=captures)
-            return transformer(self, *args, **captures, **kwargs)
+            if profiling.active_profile is None:
+                return apply_rule(self, node, *args, **kwargs)
+            return profiling.active_profile.call_rule(
+                rule_name, apply_rule, self, node, *args, **kwargs
+            )
 
+        # allows to use the rule's matcher as recognizer (see `DispatchTable`)
+        transformer_with_matcher.matcher = compiled
         return transformer_with_matcher
 
     return decorator
 
 
-def dispatch(rules: t.Dict[t.Any, t.Callable], node):
-    for recognizer, rule in rules.items():
-        if does_match(recognizer, node):
-            return rule(node)
+class DispatchTable:
+    # maps recognizers to the names of the rules which handle the recognized nodes,
+    # the rules are indexed by the type of the nodes they can recognize
+    # (if a rule's own matcher is used as recognizer, the node is only matched once)
+    def __init__(self, rules: t.Dict[t.Any, str]) -> None:
+        self.rules = TypeIndex(
+            [
+                (
+                    first_types(recognizer),
+                    # a type is already recognized by the index itself
+                    (
+                        None
+                        if isinstance(recognizer, type)
+                        else compile_matcher(recognizer, name=f"{rule} (recognizer)"),
+                        rule,
+                    ),
+                )
+                for recognizer, rule in rules.items()
+            ]
+        )
+
+
+def dispatch(rules: DispatchTable, grammar, node):
+    for recognizer, rule in rules.rules[type(node)]:
+        if recognizer is None or grammar.memo.captures(recognizer, node) is not None:
+            return getattr(grammar, rule)(node)
     raise DuskSyntaxError(f"Unrecognized node: '{node}'!", node)
 
 
+def make_binary_operator_chain(
+    first: ast_ser.Expr, operands: t.List[t.Tuple[str, ast_ser.Expr]]
+) -> ast_ser.Expr:
+    # builds `((first op_1 operand_1) op_2 operand_2) ...` top-down by filling in
+    # the nested messages in place (`make_binary_operator` would copy the whole,
+    # growing left operand again for every operator)
+    expr = ast_ser.Expr()
+    binop = expr.binary_operator
+    for i, (op, operand) in enumerate(reversed(operands)):
+        if 0 < i:
+            binop = binop.left.binary_operator
+        binop.op = op
+        binop.right.CopyFrom(operand)
+    binop.left.CopyFrom(first)
+    return expr
+
+
+stencil_recognizer = compile_matcher(
+    FunctionDef(
+        name=_,
+        args=_,
+        body=_,
+        decorator_list=FixedList(name(stencil_decorator.__name__)),
+        returns=_,
+        type_comment=_,
+    ),
+    name="Grammar.is_stencil",
+)
+
+
 class Grammar:
     @staticmethod
     def is_stencil(node) -> bool:
-        return does_match(
-            FunctionDef(
-                name=_,
-                args=_,
-                body=_,
-                decorator_list=FixedList(name(stencil_decorator.__name__)),
-                returns=_,
-                type_comment=_,
-            ),
-            node,
-        )
+        return stencil_recognizer.does_match(node)
 
     def __init__(self):
         self.ctx = DuskContextHelper()
+        self.memo = MatchMemo()
+        # the capture frames of the rules (see `transform`), so a grammar can only
+        # be used by one thread at a time
+        self.frames: t.Dict[str, t.List] = {}
 
     @transform(
         FunctionDef(
@@ -133,6 +252,8 @@ class Grammar:
                 for symbol in self.ctx.scope.current_scope
                 if isinstance(symbol, (DuskField, DuskIndexField))
             ]
+        # the memo is only valid during the translation of a stencil
+        self.memo.clear()
         return make_stencil(name, body, fields)
 
     @transform(
@@ -247,29 +368,7 @@ class Grammar:
                 self.temporary_field_declaration(stmt)
                 continue
 
-            # TODO: bad hardcoded strings
-            stmt = dispatch(
-                {
-                    OneOf(Assign, AugAssign): self.assign,
-                    If: self.if_stmt,
-                    With(
-                        items=FixedList(
-                            withitem(
-                                context_expr=Subscript(
-                                    value=name("sparse"), slice=_, ctx=_
-                                ),
-                                optional_vars=_,
-                            )
-                        ),
-                        body=_,
-                        type_comment=_,
-                    ): self.loop_stmt,
-                    # assume a vertical region by default
-                    With: self.vertical_loop,
-                    Pass: lambda pass_node: None,
-                },
-                stmt,
-            )
+            stmt = dispatch(self.statement_rules, self, stmt)
             if stmt is not None:
                 sir_stmts.append(stmt)
         return sir_stmts
@@ -322,6 +421,10 @@ class Grammar:
 
         return make_assignment_stmt(self.expression(lhs), self.expression(rhs), op)
 
+    @transform(Pass)
+    def pass_stmt(self):
+        return None
+
     @transform(
         If(
             test=Capture(expr).to("condition"),
@@ -431,24 +534,46 @@ class Grammar:
 
         return make_loop_stmt(body, neighborhood, include_center)
 
+    # TODO: bad hardcoded strings
+    statement_rules = DispatchTable(
+        {
+            OneOf(Assign, AugAssign): "assign",
+            If: "if_stmt",
+            loop_stmt.matcher: "loop_stmt",
+            # still dispatch malformed loop statements for a detailed error
+            With(
+                items=FixedList(
+                    withitem(
+                        context_expr=Subscript(value=name("sparse"), slice=_, ctx=_),
+                        optional_vars=_,
+                    )
+                ),
+                body=_,
+                type_comment=_,
+            ): "loop_stmt",
+            # assume a vertical region by default
+            With: "vertical_loop",
+            Pass: "pass_stmt",
+        }
+    )
+
+    expression_rules = DispatchTable(
+        {
+            Constant: "constant",
+            Name: "var",
+            Subscript: "subscript",
+            UnaryOp: "unop",
+            BinOp: "binop",
+            BoolOp: "boolop",
+            Compare: "compare",
+            IfExp: "ifexp",
+            Call: "funcall",
+        }
+    )
+
     @transform(Capture(expr).to("expr"))
     def expression(self, expr: expr):
-        return make_expr(
-            dispatch(
-                {
-                    Constant: self.constant,
-                    Name: self.var,
-                    Subscript: self.subscript,
-                    UnaryOp: self.unop,
-                    BinOp: self.binop,
-                    BoolOp: self.boolop,
-                    Compare: self.compare,
-                    IfExp: self.ifexp,
-                    Call: self.funcall,
-                },
-                expr,
-            )
-        )
+        return make_expr(dispatch(self.expression_rules, self, expr))
 
     @transform(Constant(value=Capture(_).to("value"), kind=None))
     def constant(self, value):
@@ -503,7 +628,7 @@ class Grammar:
                 f"Invalid field access {name} outside of a vertical region!"
             )
         return make_unstructured_field_access_expr(
-            field.sir.name, *self.field_index(index, field=field)
+            field.sir.name, *self.field_index(index, field)
         )
 
     @transform(
@@ -662,10 +787,20 @@ class Grammar:
         }
 
         if type(op) in py_binops_to_sir_binops.keys():
-            op = py_binops_to_sir_binops[type(op)]
-            return make_binary_operator(
-                self.expression(left), op, self.expression(right)
-            )
+            # long sums, polynomials, etc. are deeply nested, left-leaning chains
+            # of binary operators, so we walk down the chain iteratively instead
+            # of recursing for every operator
+            chain = [(op, right)]
+            while isinstance(left, BinOp) and type(left.op) in py_binops_to_sir_binops:
+                chain.append((left.op, left.right))
+                left = left.left
+
+            left = self.expression(left)
+            operands = [
+                (py_binops_to_sir_binops[type(op)], self.expression(right))
+                for op, right in reversed(chain)
+            ]
+            return make_binary_operator_chain(left, operands)
 
         elif isinstance(op, Pow):
             return make_fun_call_expr(
@@ -686,13 +821,19 @@ class Grammar:
         py_boolops_to_sir_boolops = {And: "&&", Or: "||"}
         op = py_boolops_to_sir_boolops[type(op)]
 
-        *remainder, last = values
-        binop = self.expression(last)
+        *remainder, last = [self.expression(value) for value in values]
 
-        for value in reversed(remainder):
-            binop = make_binary_operator(self.expression(value), op, binop)
+        # `a and b and c` is translated to `a && (b && c)`, again top-down
+        expr = ast_ser.Expr()
+        binop = expr.binary_operator
+        for i, value in enumerate(remainder):
+            if 0 < i:
+                binop = binop.right.binary_operator
+            binop.left.CopyFrom(value)
+            binop.op = op
+        binop.right.CopyFrom(last)
 
-        return binop
+        return expr
 
     @transform(
         Compare(
@@ -899,3 +1040,7 @@ class Grammar:
         return make_reduction_over_neighbor_expr(
             op, expr, init, neighborhood, weights, include_center
         )
+
+
+# later imports load the compiled matchers instead (see `dusk.freeze`)
+freeze.update(freeze.grammar_matchers())
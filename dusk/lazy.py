@@ -0,0 +1,128 @@
+from __future__ import annotations
+import typing as t
+
+import ast
+import os
+from functools import update_wrapper, lru_cache
+from hashlib import sha256
+from inspect import getsource, getsourcefile
+
+from dusk.outputs import default_backend
+
+if t.TYPE_CHECKING:
+    from dawn4py.serialization.SIR import SIR
+
+
+class LazyStencil:
+    """
+    What `@stencil` returns: the stencil is only translated once it's needed
+    (`.sir`, `.to_json()`, `.generate(backend)`) & the results are memoized.
+
+    The results are discarded once the source file of the stencil changes (its
+    modification time & hash), the stencil is then translated from the new
+    definition in the file.
+    """
+
+    def __init__(self, function: t.Callable) -> None:
+        update_wrapper(self, function)
+        self.function = function
+        self.source_file = getsourcefile(function)
+        # `None` if there is no (readable) source file, e.g., in notebooks
+        self.stamp = self.current_stamp(None)
+        # the function's source is only valid as long as the file didn't change
+        self.original_digest = digest(self.stamp)
+        self.results: t.Dict[t.Any, t.Any] = {}
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"<stencil {self.__qualname__}>"
+
+    def current_stamp(
+        self, stamp: t.Optional[t.Tuple[int, str]]
+    ) -> t.Optional[t.Tuple[int, str]]:
+        # (modification time, hash), the file is only hashed if its mtime changed
+        if self.source_file is None:
+            return None
+        try:
+            mtime = os.stat(self.source_file).st_mtime_ns
+            if stamp is not None and stamp[0] == mtime:
+                return stamp
+            return mtime, file_digest(self.source_file, mtime)
+        except OSError:
+            return None
+
+    def memoized(self, key: t.Any, compute: t.Callable[[], t.Any]) -> t.Any:
+        stamp = self.current_stamp(self.stamp)
+        if digest(stamp) != digest(self.stamp):
+            self.results.clear()
+        self.stamp = stamp
+        if key not in self.results:
+            self.results[key] = compute()
+        return self.results[key]
+
+    def source(self) -> str:
+        if self.stamp is None or digest(self.stamp) == self.original_digest:
+            return getsource(self.function)
+        # the function object is outdated, so the definition is looked up again
+        with open(self.source_file, "r") as file:
+            source = find_definition(file.read(), self.__name__)
+        if source is None:
+            raise RuntimeError(
+                f"Stencil '{self.__name__}' isn't defined in '{self.source_file}' "
+                "anymore!"
+            )
+        return source
+
+    @property
+    def pyast(self) -> ast.FunctionDef:
+        from dusk.transpile import source_to_pyast
+
+        return self.memoized("pyast", lambda: source_to_pyast(self.source()))
+
+    @property
+    def sir(self) -> SIR:
+        from dusk.transpile import pyast_to_sir
+
+        return self.memoized(
+            "sir",
+            lambda: pyast_to_sir(
+                [self.pyast], filename=self.source_file or "<unknown>"
+            ),
+        )
+
+    def to_json(self) -> str:
+        from dusk.transpile import sir_to_json
+
+        return self.memoized("json", lambda: sir_to_json(self.sir))
+
+    def generate(self, backend: str = default_backend, verbose: bool = False) -> str:
+        from dusk.transpile import sir_to_cpp
+
+        return self.memoized(
+            ("code", backend),
+            lambda: sir_to_cpp(self.sir, backend=backend, verbose=verbose),
+        )
+
+
+@lru_cache(maxsize=256)
+def file_digest(path: str, mtime: int) -> str:
+    # all stencils of a module share the digest of its file
+    with open(path, "rb") as file:
+        return sha256(file.read()).hexdigest()
+
+
+def digest(stamp: t.Optional[t.Tuple[int, str]]) -> t.Optional[str]:
+    return stamp[1] if stamp is not None else None
+
+
+def find_definition(source: str, name: str) -> t.Optional[str]:
+    # the source of the (first) function `name` including its decorators, just as
+    # `inspect.getsource` returns it
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            lines = source.splitlines(keepends=True)
+            return "".join(lines[start - 1 : node.end_lineno])
+    return None
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import ast
+import builtins
+import typing as t
+import weakref
 from abc import ABC, abstractmethod
 from ast import AST, stmt, expr
+from itertools import count
 
 from dusk.errors import DuskSyntaxError
 from dusk.util import pprint_matcher as pprint
@@ -10,6 +15,13 @@ from dusk.util import pprint_matcher as pprint
 __all__ = [
     "match",
     "does_match",
+    "compile_matcher",
+    "CompiledMatcher",
+    "TypeIndex",
+    "first_types",
+    "MatchMemo",
+    "CaptureFrame",
+    "capture_names",
     "Ignore",
     "Repeat",
     "OneOf",
@@ -41,12 +53,10 @@ class FixedList(Matcher):
     def match(self, nodes, **kwargs):
 
         if not isinstance(nodes, list):
-            raise DuskSyntaxError(f"Expected a list, but got '{type(nodes)}'!", nodes)
+            raise list_error(nodes)
 
         if len(nodes) != len(self.matchers):
-            raise DuskSyntaxError(
-                f"Expected a list of length {len(self.matchers)}'!", nodes
-            )
+            raise fixed_length_error(len(self.matchers), nodes)
 
         for matcher, node in zip(self.matchers, nodes):
             match(matcher, node, **kwargs)
@@ -63,14 +73,11 @@ class Repeat(Matcher):
     def match(self, nodes, **kwargs) -> None:
 
         if not isinstance(nodes, list):
-            raise DuskSyntaxError(f"Expected a list, but got '{type(nodes)}'!", nodes)
+            raise list_error(nodes)
 
         elif isinstance(self.n, int):
             if len(nodes) != self.n:
-                raise DuskSyntaxError(
-                    f"Expected a list of length {self.n}, but got list of length {len(nodes)}!",
-                    nodes,
-                )
+                raise repeat_length_error(self.n, nodes)
             elif self.n == 0:
                 return
 
@@ -105,7 +112,7 @@ class OneOf(Matcher):
                 pass
 
         if not matched:
-            raise DuskSyntaxError(f"Encountered unrecognized node '{node}'!", node)
+            raise one_of_error(node)
 
 
 def Optional(matcher) -> Matcher:
@@ -159,6 +166,134 @@ class BreakPoint(Matcher):
         match(self.matcher, node, **kwargs)
 
 
+class _Missing:
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+# marks capture slots which weren't captured and don't have a default
+MISSING = _Missing()
+
+
+class CaptureFrame:
+    """
+    A fixed layout for the captures of a matcher.
+
+    Every capture name gets a slot, so captures can be stored in a list
+    (a frame) and passed positionally. `defaults` holds the initial value of
+    every slot. List captures (`Capture.append`) start a new list if their slot
+    still holds the default.
+    """
+
+    def __init__(self, names: t.List[str], defaults: t.List) -> None:
+        assert len(names) == len(defaults)
+        self.names = names
+        self.defaults = defaults
+        self.slots = {name: slot for slot, name in enumerate(names)}
+
+    def new(self) -> t.List:
+        return list(self.defaults)
+
+
+def capture_names(matcher) -> t.List[str]:
+    # all capture names of a matcher, in order of their first occurrence
+    names = []
+
+    def collect(matcher) -> None:
+        if isinstance(matcher, Capture) and matcher.name not in (None, *names):
+            names.append(matcher.name)
+        if isinstance(matcher, (FixedList, OneOf)):
+            submatchers = matcher.matchers
+        elif isinstance(matcher, (Capture, Repeat, BreakPoint, CompiledMatcher)):
+            submatchers = [matcher.matcher]
+        elif isinstance(matcher, AST):
+            submatchers = [getattr(matcher, field) for field in matcher._fields]
+        else:
+            submatchers = []
+        for submatcher in submatchers:
+            collect(submatcher)
+
+    collect(matcher)
+    return names
+
+
+class CompiledMatcher(Matcher):
+    # generated by `compile_matcher` (see `generate_matcher`), both functions have
+    # the signature `(node, capturer=None)`:
+    #   * `test` returns whether the node matches, without raising any errors
+    #   * `diagnose` raises a detailed `DuskSyntaxError` if the node doesn't match
+    # if the matcher was compiled with a `CaptureFrame`, `capturer` must be a
+    # frame (see `CaptureFrame.new`), otherwise it's a dictionary
+    _fields = ("matcher",)
+
+    def __init__(
+        self,
+        matcher,
+        test: t.Callable,
+        diagnose: t.Callable,
+        name: t.Optional[str] = None,
+        frame: t.Optional[CaptureFrame] = None,
+        frozen: bool = False,
+    ) -> None:
+        self.matcher = matcher
+        self.test = test
+        self.diagnose = diagnose
+        # used to identify the matcher, e.g., in profiles
+        self.name = name
+        self.frame = frame
+        # whether the functions were loaded from the frozen matchers
+        # instead of being compiled (see `dusk.freeze`)
+        self.frozen = frozen
+        compiled_matchers.add(self)
+
+    def match(self, node, capturer=None, **kwargs) -> None:
+        if not self.test(node, capturer):
+            self.raise_error(node)
+
+    def does_match(self, node) -> bool:
+        return self.test(node)
+
+    def raise_error(self, node) -> t.NoReturn:
+        # errors are only built once we know that the node doesn't match
+        self.diagnose(node)
+        raise MatcherError(f"Matcher failed without diagnosing node '{node}'!")
+
+
+# all compiled matchers which are alive (e.g., to instrument them in `dusk.profiling`)
+compiled_matchers: t.MutableSet[CompiledMatcher] = weakref.WeakSet()
+
+
+class MatchMemo:
+    """
+    Remembers the outcome of compiled matchers per node (packrat style).
+
+    Matching is a pure function of the matcher & the node, so each pair
+    only needs to be evaluated once. Entries keep their node alive, because
+    they are keyed by node identity.
+    """
+
+    def __init__(self) -> None:
+        self.outcomes = {}
+
+    def captures(self, matcher: CompiledMatcher, node) -> t.Optional[t.Sequence]:
+        # returns `None` if `node` doesn't match, otherwise the captures
+        key = (matcher, id(node))
+        outcome = self.outcomes.get(key)
+        if outcome is None:
+            captures = matcher.frame.new() if matcher.frame is not None else {}
+            if not matcher.test(node, captures):
+                captures = None
+            outcome = self.outcomes[key] = (node, captures)
+        return outcome[1]
+
+    def outcome(self, matcher: CompiledMatcher, node) -> t.Optional[t.Tuple]:
+        # returns `(node, captures)` if the outcome is already known, otherwise `None`
+        return self.outcomes.get((matcher, id(node)))
+
+    def clear(self) -> None:
+        self.outcomes.clear()
+
+
 def match(matcher, node, **kwargs) -> None:
     # this should be probably more flexible than hardcoding all possibilities
     if isinstance(matcher, Matcher):
@@ -183,25 +318,20 @@ def does_match(matcher, node, **kwargs) -> bool:
 
 def match_ast(matcher: AST, node, **kwargs):
     if not isinstance(node, type(matcher)):
-        raise DuskSyntaxError(
-            f"Expected node type '{type(matcher)}', but got '{type(node)}'!", node
-        )
+        raise ast_error(type(matcher), node)
 
     for field in matcher._fields:
         try:
             match(getattr(matcher, field), getattr(node, field), **kwargs)
         except DuskSyntaxError as e:
-            if e.loc is None and isinstance(node, (stmt, expr)):
-                # add location info if possible
-                e.loc_from_node(node)
+            if isinstance(node, (stmt, expr)):
+                add_location(e, node)
             raise e
 
 
 def match_type(matcher: type, node, **kwargs):
     if not isinstance(node, matcher):
-        raise DuskSyntaxError(
-            f"Expected type '{matcher}', but got '{type(node)}'", node
-        )
+        raise type_error(matcher, node)
 
 
 PRIMITIVES = (str, int, type(None))
@@ -209,4 +339,515 @@ PRIMITIVES = (str, int, type(None))
 
 def match_primitives(matcher, node, **kwargs):
     if matcher != node:
-        raise DuskSyntaxError(f"Expected '{matcher}', but got '{node}'!", node)
+        raise primitive_error(matcher, node)
+
+
+# The errors are shared between the interpreting matchers above
+# and the code generated by `compile_matcher`
+
+
+def list_error(nodes) -> DuskSyntaxError:
+    return DuskSyntaxError(f"Expected a list, but got '{type(nodes)}'!", nodes)
+
+
+def fixed_length_error(length: int, nodes) -> DuskSyntaxError:
+    return DuskSyntaxError(f"Expected a list of length {length}'!", nodes)
+
+
+def repeat_length_error(length: int, nodes) -> DuskSyntaxError:
+    return DuskSyntaxError(
+        f"Expected a list of length {length}, but got list of length {len(nodes)}!",
+        nodes,
+    )
+
+
+def one_of_error(node) -> DuskSyntaxError:
+    return DuskSyntaxError(f"Encountered unrecognized node '{node}'!", node)
+
+
+def ast_error(node_type: type, node) -> DuskSyntaxError:
+    return DuskSyntaxError(
+        f"Expected node type '{node_type}', but got '{type(node)}'!", node
+    )
+
+
+def type_error(matcher: type, node) -> DuskSyntaxError:
+    return DuskSyntaxError(f"Expected type '{matcher}', but got '{type(node)}'", node)
+
+
+def primitive_error(matcher, node) -> DuskSyntaxError:
+    return DuskSyntaxError(f"Expected '{matcher}', but got '{node}'!", node)
+
+
+def add_location(error: DuskSyntaxError, node) -> None:
+    # add location info if possible
+    if error.loc is None:
+        error.loc_from_node(node)
+
+
+def first_types(matcher) -> t.Optional[t.Tuple[type, ...]]:
+    """
+    Returns the types a node must have to be possibly matched by `matcher`.
+
+    `None` means that the matcher can't be ruled out just by the type of a node.
+    """
+    if isinstance(matcher, (Capture, BreakPoint, CompiledMatcher)):
+        return first_types(matcher.matcher)
+    elif isinstance(matcher, (FixedList, Repeat)):
+        return (list,)
+    elif isinstance(matcher, OneOf):
+        types = ()
+        for alternative in matcher.matchers:
+            alternative_types = first_types(alternative)
+            if alternative_types is None:
+                return None
+            types += alternative_types
+        return types
+    elif isinstance(matcher, AST):
+        return (type(matcher),)
+    elif isinstance(matcher, type):
+        return (matcher,)
+    elif isinstance(matcher, (str, type(None))):
+        # numbers may compare equal to numbers of other types, strings & `None` don't
+        return (type(matcher),)
+    return None
+
+
+class TypeIndex(dict):
+    """
+    Maps node types to the values of all entries which can match nodes of that type.
+
+    `entries` is a list of `(types, value)` pairs, where `types` is computed by
+    `first_types`. The order of the candidates is preserved and the candidates
+    are computed once per node type.
+    """
+
+    def __init__(self, entries: t.List[t.Tuple[t.Optional[t.Tuple[type]], t.Any]]):
+        super().__init__()
+        self.entries = entries
+
+    def __missing__(self, node_type: type) -> t.Tuple:
+        candidates = tuple(
+            value
+            for types, value in self.entries
+            if types is None or issubclass(node_type, types)
+        )
+        self[node_type] = candidates
+        return candidates
+
+
+def compile_matcher(
+    matcher, name: t.Optional[str] = None, frame: t.Optional[CaptureFrame] = None
+) -> CompiledMatcher:
+    """
+    Translates a matcher into specialized Python functions.
+
+    The generated functions are equivalent to calling `match` with the matcher
+    (same captures, same errors), but instead of walking the matcher for every
+    node they perform a straight-line series of type, attribute & value checks.
+    The `test` function reports mismatches by returning `False`, so no errors are
+    allocated on the fast path. `diagnose` raises the detailed error instead.
+    With a `frame`, captures are stored in the slots of a list instead of a dict.
+    Named matchers are loaded from the frozen matchers if possible.
+    """
+    if isinstance(matcher, CompiledMatcher):
+        return matcher
+
+    functions = None
+    if name is not None:
+        frozen = frozen_matchers().get(name)
+        if frozen is not None:
+            functions = frozen.functions(matcher, frame)
+
+    if functions is None:
+        source, namespace, test, diagnose = generate_matcher(matcher, frame)
+        exec(builtins.compile(source, "<dusk matcher>", "exec"), namespace)
+        test, diagnose = namespace[test], namespace[diagnose]
+    else:
+        test, diagnose = functions
+
+    return CompiledMatcher(
+        matcher, test, diagnose, name=name, frame=frame, frozen=functions is not None
+    )
+
+
+def generate_matcher(
+    matcher, frame: t.Optional[CaptureFrame] = None
+) -> t.Tuple[str, t.Dict[str, t.Any], str, str]:
+    # returns the source of the functions of a compiled matcher, their globals
+    # and the names of the `test` & `diagnose` functions
+    compiler = MatcherCompiler(frame)
+    test = compiler.function(matcher)
+    compiler.diagnostic = True
+    diagnose = compiler.function(matcher)
+    return compiler.source(), dict(compiler.namespace), test, diagnose
+
+
+def matcher_graph(matcher, frame: t.Optional[CaptureFrame] = None) -> t.List:
+    """
+    Lists the objects a matcher consists of, in a deterministic order.
+
+    The constants of the generated functions are taken from these objects,
+    so frozen matchers can refer to their constants by position.
+    """
+    objects = []
+    pending = [matcher]
+    while pending:
+        matcher = pending.pop()
+        objects.append(matcher)
+        if isinstance(matcher, (FixedList, OneOf)):
+            submatchers = matcher.matchers
+        elif isinstance(matcher, (Capture, Repeat, BreakPoint, CompiledMatcher)):
+            submatchers = [matcher.matcher]
+        elif isinstance(matcher, AST):
+            submatchers = [getattr(matcher, field) for field in matcher._fields]
+        else:
+            submatchers = []
+        pending.extend(reversed(submatchers))
+    if frame is not None:
+        objects.extend(frame.defaults)
+    return objects
+
+
+class FrozenMatcher:
+    """
+    The generated functions of a matcher, stored ahead of time (see `dusk.freeze`).
+
+    `factory` takes the globals of the functions and returns the `test` &
+    `diagnose` functions. A global is either shared by all matchers (`None` in
+    `references`) or a constant. Constants are referenced by `(position, kind,
+    type name)` in the `matcher_graph`, where `kind` selects the object itself
+    (`None`), its type (`"type"`) or an attribute (e.g., `"test"`).
+    So loading a frozen matcher neither generates nor compiles any source.
+    """
+
+    def __init__(
+        self,
+        factory: t.Callable,
+        parameters: t.Tuple[str, ...],
+        references: t.Tuple[t.Optional[t.Tuple[int, t.Optional[str], str]], ...],
+        size: int,
+    ) -> None:
+        self.factory = factory
+        self.parameters = parameters
+        self.references = references
+        # the length of the matcher graph
+        self.size = size
+
+    def functions(
+        self, matcher, frame: t.Optional[CaptureFrame] = None
+    ) -> t.Optional[t.Tuple[t.Callable, t.Callable]]:
+        # returns `None` if the matcher was changed since it was frozen
+        graph = matcher_graph(matcher, frame)
+        if len(graph) != self.size:
+            return None
+        namespace = {}
+        for parameter, reference in zip(self.parameters, self.references):
+            if reference is None:
+                namespace[parameter] = shared_namespace[parameter]
+                continue
+            position, kind, type_name = reference
+            value = graph[position]
+            if kind == "type":
+                value = type(value)
+            elif kind is not None:
+                value = getattr(value, kind, None)
+            if type(value).__name__ != type_name:
+                return None
+            namespace[parameter] = value
+        return self.factory(**namespace)
+
+
+def constant_reference(
+    value, graph: t.List
+) -> t.Optional[t.Tuple[int, t.Optional[str], str]]:
+    # finds a constant of the generated functions in the matcher graph
+    # (see `FrozenMatcher`), `None` if it isn't part of the graph
+    for kind in (None, "type", "test", "diagnose"):
+        for position, candidate in enumerate(graph):
+            if kind == "type":
+                candidate = type(candidate)
+            elif kind is not None:
+                if not isinstance(candidate, CompiledMatcher):
+                    continue
+                candidate = getattr(candidate, kind)
+            if candidate is value:
+                return position, kind, type(value).__name__
+    return None
+
+
+# lazily loaded frozen matchers by name (see `dusk.freeze`)
+_frozen_matchers: t.Optional[t.Dict[str, FrozenMatcher]] = None
+
+
+def frozen_matchers() -> t.Dict[str, FrozenMatcher]:
+    global _frozen_matchers
+    if _frozen_matchers is None:
+        from dusk.freeze import load
+
+        _frozen_matchers = load()
+    return _frozen_matchers
+
+
+# the globals which all generated functions share
+shared_namespace = {
+    "ast": ast,
+    "pprint": pprint,
+    "DuskSyntaxError": DuskSyntaxError,
+    "list_error": list_error,
+    "fixed_length_error": fixed_length_error,
+    "repeat_length_error": repeat_length_error,
+    "one_of_error": one_of_error,
+    "ast_error": ast_error,
+    "type_error": type_error,
+    "primitive_error": primitive_error,
+    "add_location": add_location,
+    "does_match": does_match,
+    "TypeIndex": TypeIndex,
+}
+
+
+class MatcherCompiler:
+    # Python limits the number of statically nested blocks in a function,
+    # so deeply nested matchers are split into several functions
+    max_depth = 8
+
+    def __init__(self, frame: t.Optional[CaptureFrame] = None) -> None:
+        self.frame = frame
+        self.namespace = dict(shared_namespace)
+        # generates `test` functions by default and `diagnose` functions otherwise
+        self.diagnostic = False
+        self.functions = []
+        self.indices = []
+        self.function_ids = count()
+        self.index_ids = count()
+        self.constant_ids = count()
+
+    def source(self) -> str:
+        return (
+            "\n\n".join(self.functions)
+            + "\n\n"
+            + "".join(f"{index}\n" for index in self.indices)
+        )
+
+    def function(self, matcher) -> str:
+        prefix = "diagnose" if self.diagnostic else "test"
+        name = f"{prefix}_{next(self.function_ids)}"
+        lines = [f"def {name}(node, capturer=None):"]
+        self.emit(matcher, "node", lines, 1, count(1))
+        if not self.diagnostic:
+            lines.append("    return True")
+        elif len(lines) == 1:
+            lines.append("    pass")
+        self.functions.append("\n".join(lines))
+        return name
+
+    def type_index(self, matchers: t.List) -> str:
+        name = f"index_{next(self.index_ids)}"
+        entries = []
+        for matcher in matchers:
+            types = first_types(matcher)
+            if types is not None:
+                types = (
+                    "(" + "".join(f"{self.type_ref(type_)}, " for type_ in types) + ")"
+                )
+            entries.append(f"({types}, {self.function(matcher)})")
+        self.indices.append(f"{name} = TypeIndex([{', '.join(entries)}])")
+        return name
+
+    def constant(self, value) -> str:
+        name = f"constant_{next(self.constant_ids)}"
+        self.namespace[name] = value
+        return name
+
+    def type_ref(self, type_: type) -> str:
+        if type_ is type(None):
+            return "type(None)"
+        name = type_.__name__
+        if getattr(ast, name, None) is type_:
+            return f"ast.{name}"
+        if getattr(builtins, name, None) is type_:
+            return name
+        return self.constant(type_)
+
+    def literal(self, value) -> str:
+        if type(value) in (str, int, bool, type(None)):
+            return repr(value)
+        return self.constant(value)
+
+    @staticmethod
+    def is_check(matcher) -> bool:
+        # matchers without side effects which can be expressed as a condition
+        return isinstance(matcher, (type, *PRIMITIVES))
+
+    def condition(self, matchers: t.List, node: str) -> str:
+        types = [matcher for matcher in matchers if isinstance(matcher, type)]
+        conditions = [
+            f"{self.literal(matcher)} == {node}"
+            for matcher in matchers
+            if not isinstance(matcher, type)
+        ]
+        if len(types) == 1:
+            conditions.insert(0, f"isinstance({node}, {self.type_ref(types[0])})")
+        elif 1 < len(types):
+            type_refs = ", ".join(self.type_ref(type_) for type_ in types)
+            conditions.insert(0, f"isinstance({node}, ({type_refs}))")
+        return " or ".join(conditions)
+
+    def fail(self, error: str) -> str:
+        return f"raise {error}" if self.diagnostic else "return False"
+
+    def call(self, function: str, node: str) -> t.List[str]:
+        if self.diagnostic:
+            return [f"{function}({node}, capturer)"]
+        return [f"if not {function}({node}, capturer):", "    return False"]
+
+    def emit(self, matcher, node: str, lines: t.List[str], depth: int, ids) -> None:
+        indent = "    " * depth
+
+        if isinstance(matcher, _Ignore):
+            return
+
+        if depth > self.max_depth and isinstance(
+            matcher, (AST, OneOf, Repeat, FixedList)
+        ):
+            function = self.function(matcher)
+            lines.extend(indent + line for line in self.call(function, node))
+            return
+
+        if isinstance(matcher, CompiledMatcher):
+            function = self.constant(
+                matcher.diagnose if self.diagnostic else matcher.test
+            )
+            lines.extend(indent + line for line in self.call(function, node))
+
+        elif isinstance(matcher, Capture):
+            self.emit(matcher.matcher, node, lines, depth, ids)
+            if matcher.name is None:
+                return
+            lines.append(f"{indent}if capturer is not None:")
+            if self.frame is None:
+                if not matcher.is_list:
+                    lines.append(f"{indent}    capturer[{matcher.name!r}] = {node}")
+                else:
+                    lines.append(
+                        f"{indent}    capturer.setdefault({matcher.name!r}, []).append({node})"
+                    )
+            else:
+                slot = self.frame.slots[matcher.name]
+                if not matcher.is_list:
+                    lines.append(f"{indent}    capturer[{slot}] = {node}")
+                else:
+                    default = self.frame.defaults[slot]
+                    default = "None" if default is None else self.constant(default)
+                    lines.append(f"{indent}    if capturer[{slot}] is {default}:")
+                    lines.append(f"{indent}        capturer[{slot}] = [{node}]")
+                    lines.append(f"{indent}    else:")
+                    lines.append(f"{indent}        capturer[{slot}].append({node})")
+
+        elif isinstance(matcher, BreakPoint):
+            if matcher.active:
+                lines.append(f"{indent}breakpoint()")
+            self.emit(matcher.matcher, node, lines, depth, ids)
+
+        elif isinstance(matcher, FixedList):
+            lines.append(f"{indent}if not isinstance({node}, list):")
+            lines.append(f"{indent}    {self.fail(f'list_error({node})')}")
+            lines.append(f"{indent}if len({node}) != {len(matcher.matchers)}:")
+            lines.append(
+                f"{indent}    {self.fail(f'fixed_length_error({len(matcher.matchers)}, {node})')}"
+            )
+            for index, element_matcher in enumerate(matcher.matchers):
+                if isinstance(element_matcher, _Ignore):
+                    continue
+                element = f"node_{next(ids)}"
+                lines.append(f"{indent}{element} = {node}[{index}]")
+                self.emit(element_matcher, element, lines, depth, ids)
+
+        elif isinstance(matcher, Repeat):
+            lines.append(f"{indent}if not isinstance({node}, list):")
+            lines.append(f"{indent}    {self.fail(f'list_error({node})')}")
+            if isinstance(matcher.n, int):
+                lines.append(f"{indent}if len({node}) != {matcher.n}:")
+                lines.append(
+                    f"{indent}    {self.fail(f'repeat_length_error({matcher.n}, {node})')}"
+                )
+            if not isinstance(matcher.matcher, _Ignore) and matcher.n != 0:
+                element = f"node_{next(ids)}"
+                lines.append(f"{indent}for {element} in {node}:")
+                self.emit(matcher.matcher, element, lines, depth + 1, ids)
+
+        elif isinstance(matcher, OneOf):
+            if all(self.is_check(alternative) for alternative in matcher.matchers):
+                lines.append(
+                    f"{indent}if not ({self.condition(matcher.matchers, node)}):"
+                )
+                lines.append(f"{indent}    {self.fail(f'one_of_error({node})')}")
+            else:
+                # only the alternatives which can match the type of the node are tried
+                alternatives = self.type_index(matcher.matchers)
+                lines.append(
+                    f"{indent}for alternative in {alternatives}[type({node})]:"
+                )
+                if self.diagnostic:
+                    lines.append(f"{indent}    try:")
+                    lines.append(f"{indent}        alternative({node}, capturer)")
+                    lines.append(f"{indent}        break")
+                    lines.append(f"{indent}    except DuskSyntaxError:")
+                    lines.append(f"{indent}        pass")
+                else:
+                    lines.append(f"{indent}    if alternative({node}, capturer):")
+                    lines.append(f"{indent}        break")
+                lines.append(f"{indent}else:")
+                lines.append(f"{indent}    {self.fail(f'one_of_error({node})')}")
+
+        elif isinstance(matcher, Matcher):
+            # e.g. `BreakPoint`, fall back to interpreting the matcher
+            interpreted = self.constant(matcher)
+            if self.diagnostic:
+                lines.append(f"{indent}{interpreted}.match({node}, capturer=capturer)")
+            else:
+                lines.append(
+                    f"{indent}if not does_match({interpreted}, {node}, capturer=capturer):"
+                )
+                lines.append(f"{indent}    return False")
+
+        elif isinstance(matcher, AST):
+            node_type = self.type_ref(type(matcher))
+            lines.append(f"{indent}if not isinstance({node}, {node_type}):")
+            lines.append(f"{indent}    {self.fail(f'ast_error({node_type}, {node})')}")
+
+            fields = []
+            for field in matcher._fields:
+                field_matcher = getattr(matcher, field)
+                if isinstance(field_matcher, _Ignore):
+                    continue
+                element = f"node_{next(ids)}"
+                fields.append(f"{indent}    {element} = {node}.{field}")
+                self.emit(field_matcher, element, fields, depth + 1, ids)
+
+            if not fields:
+                return
+            if not self.diagnostic or not issubclass(type(matcher), (stmt, expr)):
+                lines.extend(line[4:] for line in fields)
+                return
+            lines.append(f"{indent}try:")
+            lines.extend(fields)
+            lines.append(f"{indent}except DuskSyntaxError as e:")
+            lines.append(f"{indent}    add_location(e, {node})")
+            lines.append(f"{indent}    raise e")
+
+        elif isinstance(matcher, type):
+            type_ref = self.type_ref(matcher)
+            lines.append(f"{indent}if not isinstance({node}, {type_ref}):")
+            lines.append(f"{indent}    {self.fail(f'type_error({type_ref}, {node})')}")
+
+        elif isinstance(matcher, PRIMITIVES):
+            literal = self.literal(matcher)
+            lines.append(f"{indent}if {literal} != {node}:")
+            lines.append(
+                f"{indent}    {self.fail(f'primitive_error({literal}, {node})')}"
+            )
+
+        else:
+            raise MatcherError(f"Invalid matcher '{matcher}'!")
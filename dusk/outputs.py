@@ -0,0 +1,21 @@
+# What dusk can output. These are only names, so the clis don't need to load dawn4py.
+
+# backends of dawn4py's `CodeGenBackend` (only resolved once code is generated,
+# so the front end doesn't need to load Dawn's compiler)
+backend_map = {
+    "ico-naive": "CXXNaiveIco",
+    "ico-cuda": "CUDAIco",
+}
+default_backend = "ico-naive"
+
+# formats of the SIR (see `dusk.transpile.write_sir`) & their file extensions
+sir_formats = {
+    "json": ".json",
+    "binary": ".pb",
+    "jsonl": ".jsonl",
+    "length-prefixed": ".pbs",
+}
+default_sir_format = "json"
+# formats which are written stencil by stencil (see `write_sir_stream`)
+streaming_sir_formats = ["jsonl", "length-prefixed"]
+binary_sir_formats = ["binary", "length-prefixed"]
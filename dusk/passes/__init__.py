@@ -0,0 +1,39 @@
+"""
+Passes over the SIR of a stencil, which run after the grammar translated it
+(e.g., optimizations which Dawn doesn't do).
+
+Every pass transforms a `Stencil` in place. Passes only run if they are asked
+for (e.g., `dusk --optimize` runs the `optimization_passes`).
+"""
+import typing as t
+
+from dawn4py.serialization.SIR import Stencil
+
+from dusk.profiling import phase
+from dusk.passes.folding import fold_constants
+from dusk.passes.subexpressions import eliminate_common_subexpressions
+from dusk.passes.reductions import fuse_reductions
+from dusk.passes.temporaries import (
+    inline_sparse_temporaries,
+    eliminate_dead_temporaries,
+    demote_temporaries,
+)
+
+
+Pass = t.Callable[[Stencil], None]
+
+optimization_passes: t.List[Pass] = [
+    fold_constants,
+    inline_sparse_temporaries,
+    eliminate_dead_temporaries,
+    demote_temporaries,
+    eliminate_common_subexpressions,
+    fuse_reductions,
+]
+
+
+def run_passes(stencil: Stencil, passes: t.Sequence[Pass]) -> Stencil:
+    for stencil_pass in passes:
+        with phase(stencil_pass.__name__, stencil=stencil.name):
+            stencil_pass(stencil)
+    return stencil
@@ -0,0 +1,261 @@
+"""
+Folds constant expressions & reduces the strength of `pow` calls.
+
+Literals are folded with the semantics of C++ (which is what they end up in):
+integers are 32 bit & their division truncates, mixed arithmetic is done in
+double precision. Expressions which would divide by zero, overflow or have
+non-finite results are kept as they are.
+
+Small integer powers are expanded into multiplications. Bases which aren't
+simple (e.g., `exp(x) ** 5`) are computed once into a local variable first, but
+only where the power is evaluated unconditionally & not per neighbor of a
+reduction (like in `eliminate_common_subexpressions`), elsewhere `pow` is kept.
+"""
+from __future__ import annotations
+import typing as t
+
+import math
+
+from dawn4py.serialization.AST import Expr, BuiltinType
+from dawn4py.serialization.SIR import Stencil
+from dawn4py.serialization.utils import (
+    make_stmt,
+    make_var_decl_stmt,
+    make_type,
+    make_expr,
+    make_literal_access_expr,
+    make_binary_operator,
+    make_fun_call_expr,
+    make_var_access_expr,
+)
+
+from dusk.passes.traversal import (
+    expressions,
+    replace,
+    fresh_names,
+    region_blocks,
+    nested_blocks,
+    evaluated_expressions,
+    unconditional_expressions,
+    set_statements,
+)
+
+
+Value = t.Union[bool, int, float]
+
+BOOLEAN = BuiltinType.TypeID.Value("Boolean")
+INTEGER = BuiltinType.TypeID.Value("Integer")
+DOUBLE = BuiltinType.TypeID.Value("Double")
+INT_MIN, INT_MAX = -(2**31), 2**31 - 1
+
+arithmetic_operators = {
+    "+": lambda left, right: left + right,
+    "-": lambda left, right: left - right,
+    "*": lambda left, right: left * right,
+}
+comparison_operators = {
+    "==": lambda left, right: left == right,
+    "!=": lambda left, right: left != right,
+    "<": lambda left, right: left < right,
+    "<=": lambda left, right: left <= right,
+    ">": lambda left, right: left > right,
+    ">=": lambda left, right: left >= right,
+}
+logical_operators = {
+    "&&": lambda left, right: left and right,
+    "||": lambda left, right: left or right,
+}
+
+# integer powers which are replaced by multiplications (at most 7)
+small_powers = set(range(2, 9))
+
+
+def math_function(name: str) -> str:
+    return f"gridtools::dawn::math::{name}"
+
+
+def fold_constants(stencil: Stencil) -> None:
+    for expr in expressions(stencil.ast):
+        folded = fold(expr)
+        if folded is not None:
+            replace(expr, folded)
+    bind_pow_bases(stencil)
+
+
+def fold(expr: Expr) -> t.Optional[Expr]:
+    # expects that the operands are folded already
+    kind = expr.WhichOneof("expr")
+
+    if kind == "unary_operator":
+        operand = literal_value(expr.unary_operator.operand)
+        if operand is None:
+            return None
+        return make_literal(fold_unary(expr.unary_operator.op, operand))
+
+    elif kind == "binary_operator":
+        left = literal_value(expr.binary_operator.left)
+        right = literal_value(expr.binary_operator.right)
+        if left is None or right is None:
+            return None
+        return make_literal(fold_binary(expr.binary_operator.op, left, right))
+
+    elif kind == "fun_call_expr":
+        return reduce_pow(expr.fun_call_expr)
+
+    return None
+
+
+def fold_unary(op: str, operand: Value) -> t.Optional[Value]:
+    if isinstance(operand, bool):
+        return (not operand) if op == "!" else None
+    elif op == "+":
+        return operand
+    elif op == "-":
+        return checked(-operand)
+    return None
+
+
+def fold_binary(op: str, left: Value, right: Value) -> t.Optional[Value]:
+    if isinstance(left, bool) or isinstance(right, bool):
+        if (
+            isinstance(left, bool)
+            and isinstance(right, bool)
+            and op in logical_operators
+        ):
+            return logical_operators[op](left, right)
+        return None
+    elif op in logical_operators:
+        return None
+
+    if isinstance(left, int) and isinstance(right, int):
+        if op == "/":
+            if right == 0:
+                return None
+            # C++ truncates towards zero
+            quotient = abs(left) // abs(right)
+            return checked(quotient if (left < 0) == (right < 0) else -quotient)
+    else:
+        left, right = float(left), float(right)
+        if op == "/":
+            return checked(left / right) if right != 0.0 else None
+
+    if op in arithmetic_operators:
+        return checked(arithmetic_operators[op](left, right))
+    elif op in comparison_operators:
+        return comparison_operators[op](left, right)
+    return None
+
+
+def checked(value: Value) -> t.Optional[Value]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value if INT_MIN <= value <= INT_MAX else None
+    return value if math.isfinite(value) else None
+
+
+def literal_value(expr: Expr) -> t.Optional[Value]:
+    if expr.WhichOneof("expr") != "literal_access_expr":
+        return None
+    literal = expr.literal_access_expr
+    try:
+        if literal.type.type_id == BOOLEAN:
+            return {"true": True, "false": False}[literal.value]
+        elif literal.type.type_id == INTEGER:
+            return checked(int(literal.value))
+        elif literal.type.type_id == DOUBLE:
+            return checked(float(literal.value))
+    except (KeyError, ValueError):
+        pass
+    # e.g., `Float`s, which dusk doesn't produce
+    return None
+
+
+def make_literal(value: t.Optional[Value]) -> t.Optional[Expr]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return make_expr(make_literal_access_expr(str(value).lower(), BOOLEAN))
+    if isinstance(value, int):
+        return make_expr(make_literal_access_expr(str(value), INTEGER))
+    # `repr` round-trips & always has a decimal point or an exponent
+    return make_expr(make_literal_access_expr(repr(value), DOUBLE))
+
+
+def reduce_pow(call) -> t.Optional[Expr]:
+    if call.callee != math_function("pow") or len(call.arguments) != 2:
+        return None
+    base, exponent = call.arguments
+    exponent = literal_value(exponent)
+    if exponent is None or isinstance(exponent, bool):
+        return None
+
+    if exponent == 0.5:
+        return make_expr(make_fun_call_expr(math_function("sqrt"), [base]))
+
+    if exponent in small_powers and is_simple(base):
+        return expand_power(base, int(exponent))
+
+    return None
+
+
+def expand_power(base: Expr, exponent: int) -> Expr:
+    product = base
+    for _ in range(exponent - 1):
+        product = make_expr(make_binary_operator(product, "*", base))
+        product = fold(product) or product
+    return product
+
+
+def bind_pow_bases(stencil: Stencil) -> None:
+    # the remaining small powers have bases which aren't simple
+    names = fresh_names(stencil, "pow_")
+    blocks = region_blocks(stencil)
+    while blocks:
+        block = blocks.pop()
+        new_statements = []
+        for stmt in block.statements:
+            for expr in evaluated_expressions(stmt):
+                # nested powers first, so their variables are declared before
+                for power in unconditional_expressions(expr):
+                    exponent = small_pow_exponent(power)
+                    if exponent is None:
+                        continue
+                    name = next(names)
+                    base = Expr()
+                    base.CopyFrom(power.fun_call_expr.arguments[0])
+                    new_statements.append(
+                        make_stmt(
+                            make_var_decl_stmt(make_type(DOUBLE), name, 0, "=", [base])
+                        )
+                    )
+                    variable = make_expr(make_var_access_expr(name))
+                    replace(power, expand_power(variable, exponent))
+            new_statements.append(stmt)
+        if len(new_statements) != len(block.statements):
+            set_statements(block, new_statements)
+        blocks.extend(nested_blocks(block))
+
+
+def small_pow_exponent(expr: Expr) -> t.Optional[int]:
+    if expr.WhichOneof("expr") != "fun_call_expr":
+        return None
+    call = expr.fun_call_expr
+    if call.callee != math_function("pow") or len(call.arguments) != 2:
+        return None
+    exponent = literal_value(call.arguments[1])
+    if exponent is None or isinstance(exponent, bool) or exponent not in small_powers:
+        return None
+    return int(exponent)
+
+
+def is_simple(expr: Expr) -> bool:
+    # cheap to evaluate multiple times & a double (integer literals aren't, as the
+    # product of integers would be an integer, unlike `pow`'s result)
+    kind = expr.WhichOneof("expr")
+    if kind in {"field_access_expr", "var_access_expr"}:
+        return True
+    return (
+        kind == "literal_access_expr"
+        and expr.literal_access_expr.type.type_id == DOUBLE
+    )
@@ -0,0 +1,161 @@
+"""
+Hash-consing of the SIR's expressions: structurally equal expressions get the
+same id, so repeated expressions are found by comparing integers.
+
+Accesses of fields & variables are keyed by their version (the number of writes
+before the access), so two expressions only get the same id if they're
+guaranteed to have the same value.
+"""
+from __future__ import annotations
+import typing as t
+
+from dataclasses import dataclass
+
+from dawn4py.serialization.AST import Expr
+
+from dusk.passes.folding import BOOLEAN, INTEGER, DOUBLE
+from dusk.passes.traversal import child_expressions, accessed_names
+
+
+# `+` & `*` are exactly commutative in IEEE 754 (unlike associative)
+commutative_operators = {"+", "*", "==", "!="}
+boolean_operators = {"==", "!=", "<", "<=", ">", ">=", "&&", "||"}
+integer_operators = {"%", "<<", ">>", "|", "^", "&"}
+pure_expressions = {
+    "unary_operator",
+    "binary_operator",
+    "ternary_operator",
+    "fun_call_expr",
+    "var_access_expr",
+    "field_access_expr",
+    "literal_access_expr",
+    "reduction_over_neighbor_expr",
+}
+
+
+@dataclass
+class Node:
+    expr: Expr
+    kind: str
+    id: int
+    children: t.List[Node]
+    # a `BuiltinType.TypeID`
+    type: int
+    # free of side effects (e.g., assignments)
+    pure: bool
+    # depends on the neighbor, if evaluated inside of a neighbor iteration
+    varying: bool
+
+
+class HashCons:
+    def __init__(self, sparse_fields: t.AbstractSet[str] = frozenset()) -> None:
+        self.ids: t.Dict[t.Hashable, int] = {}
+        self.sparse_fields = sparse_fields
+
+    def intern(self, key: t.Hashable) -> int:
+        return self.ids.setdefault(key, len(self.ids))
+
+    def node(self, expr: Expr, versions: t.Mapping[str, int]) -> Node:
+        # builds the nodes bottom-up (without recursion)
+        stack: t.List[t.Tuple[Expr, t.Optional[int]]] = [(expr, None)]
+        nodes: t.List[Node] = []
+        while stack:
+            current, child_count = stack.pop()
+            if child_count is None:
+                children = child_expressions(current)
+                stack.append((current, len(children)))
+                stack.extend((child, None) for child in reversed(children))
+            else:
+                children = nodes[len(nodes) - child_count :]
+                del nodes[len(nodes) - child_count :]
+                nodes.append(self.make_node(current, children, versions))
+        return nodes[0]
+
+    def make_node(
+        self, expr: Expr, children: t.List[Node], versions: t.Mapping[str, int]
+    ) -> Node:
+        kind = expr.WhichOneof("expr")
+        ids = tuple(child.id for child in children)
+        types = [child.type for child in children]
+        varying = False
+
+        if kind == "literal_access_expr":
+            literal = expr.literal_access_expr
+            key = (kind, literal.value, literal.type.type_id)
+            type = literal.type.type_id
+
+        elif kind == "field_access_expr":
+            access = expr.field_access_expr
+            key = (
+                kind,
+                access.SerializeToString(deterministic=True),
+                tuple(versions.get(name, 0) for name in accessed_names(access)),
+            ) + ids
+            type = DOUBLE
+            varying = (
+                access.WhichOneof("horizontal_offset") == "unstructured_offset"
+                and access.unstructured_offset.has_offset
+            ) or access.name in self.sparse_fields
+
+        elif kind == "var_access_expr":
+            access = expr.var_access_expr
+            key = (kind, access.name, versions.get(access.name, 0)) + ids
+            # dusk only declares variables of doubles
+            type = DOUBLE
+
+        elif kind == "unary_operator":
+            op = expr.unary_operator.op
+            key = (kind, op) + ids
+            type = BOOLEAN if op == "!" else types[0]
+
+        elif kind == "binary_operator":
+            op = expr.binary_operator.op
+            key = (kind, op) + (
+                tuple(sorted(ids)) if op in commutative_operators else ids
+            )
+            if op in boolean_operators:
+                type = BOOLEAN
+            elif op in integer_operators:
+                type = INTEGER
+            else:
+                type = DOUBLE if DOUBLE in types else INTEGER
+
+        elif kind == "ternary_operator":
+            key = (kind,) + ids
+            type = types[1] if types[1] == types[2] else DOUBLE
+
+        elif kind == "fun_call_expr":
+            key = (kind, expr.fun_call_expr.callee) + ids
+            # dusk only calls math functions
+            type = DOUBLE
+
+        elif kind == "reduction_over_neighbor_expr":
+            reduction = expr.reduction_over_neighbor_expr
+            iter_space = reduction.iter_space.SerializeToString(deterministic=True)
+            key = (kind, reduction.op, iter_space) + ids
+            type = DOUBLE
+            # a nested reduction starts at the neighbor of the outer one
+            varying = True
+
+        else:
+            key = object()
+            type = DOUBLE
+
+        return Node(
+            expr=expr,
+            kind=kind,
+            id=self.intern(key),
+            children=children,
+            type=type,
+            pure=kind in pure_expressions and all(child.pure for child in children),
+            varying=varying or any(child.varying for child in children),
+        )
+
+
+def sparse_fields(stencil) -> t.Set[str]:
+    return {
+        field.name
+        for field in stencil.fields
+        if 1
+        < len(field.field_dimensions.unstructured_horizontal_dimension.iter_space.chain)
+    }
@@ -0,0 +1,162 @@
+"""
+Fuses reductions over the same neighbors: independent reductions over the same
+location chain (with the same center inclusion) in a block of statements are
+lowered to a single sparse loop, which updates an accumulator per reduction.
+The neighbor table is then only traversed once for all of them.
+
+A reduction is moved up to the first reduction it's fused with, so it must not
+read anything written by the statements in between. Reductions with weights
+(which depend on the position of the neighbor) or nested reductions are kept.
+"""
+import typing as t
+
+from dataclasses import dataclass, field
+
+from dawn4py.serialization.AST import Expr, Stmt, BlockStmt
+from dawn4py.serialization.SIR import Stencil
+from dawn4py.serialization.utils import (
+    make_stmt,
+    make_var_decl_stmt,
+    make_type,
+    make_expr,
+    make_var_access_expr,
+    make_assignment_stmt,
+    make_fun_call_expr,
+    make_loop_stmt,
+)
+
+from dusk.passes.folding import DOUBLE, math_function
+from dusk.passes.traversal import (
+    expressions,
+    child_expressions,
+    region_blocks,
+    nested_blocks,
+    evaluated_expressions,
+    written_names,
+    read_names,
+    replace,
+    fresh_names,
+    set_statements,
+)
+
+
+# how an accumulator is updated with the value for a neighbor
+compound_assignments = {"+": "+=", "*": "*="}
+math_reductions = {"min", "max"}
+
+
+@dataclass
+class Group:
+    # index of the statement, before which the loop is placed
+    index: int
+    reductions: t.List[Expr] = field(default_factory=list)
+    # written since (& including) the statement at `index`
+    written: t.Set[str] = field(default_factory=set)
+
+
+def fuse_reductions(stencil: Stencil) -> None:
+    names = fresh_names(stencil, "acc_")
+    blocks = region_blocks(stencil)
+    while blocks:
+        block = blocks.pop()
+        fuse_in_block(block, names)
+        blocks.extend(nested_blocks(block))
+
+
+def fuse_in_block(block: BlockStmt, names: t.Iterator[str]) -> None:
+    groups: t.List[Group] = []
+    open_groups: t.Dict[t.Tuple, Group] = {}
+    for index, stmt in enumerate(block.statements):
+        for reduction in point_reductions(stmt):
+            if not is_fusable(reduction):
+                continue
+            iter_space = reduction.reduction_over_neighbor_expr.iter_space
+            key = (tuple(iter_space.chain), iter_space.include_center)
+            group = open_groups.get(key)
+            if group is None or read_names(reduction) & group.written:
+                group = open_groups[key] = Group(index)
+                groups.append(group)
+            group.reductions.append(reduction)
+        written = written_names(stmt)
+        for group in open_groups.values():
+            group.written |= written
+
+    loops: t.Dict[int, t.List[Stmt]] = {}
+    for group in groups:
+        if 1 < len(group.reductions):
+            loops.setdefault(group.index, []).extend(fuse(group.reductions, names))
+
+    if loops:
+        new_statements = []
+        for index, stmt in enumerate(block.statements):
+            new_statements.extend(loops.get(index, []))
+            new_statements.append(stmt)
+        set_statements(block, new_statements)
+
+
+def fuse(reductions: t.List[Expr], names: t.Iterator[str]) -> t.List[Stmt]:
+    # the declarations of the accumulators & the loop, replaces the reductions
+    # by their accumulators
+    declarations = []
+    body = []
+    for reduction in reductions:
+        name = next(names)
+        op = reduction.reduction_over_neighbor_expr.op
+        rhs = reduction.reduction_over_neighbor_expr.rhs
+        declarations.append(
+            make_stmt(
+                make_var_decl_stmt(
+                    make_type(DOUBLE),
+                    name,
+                    0,
+                    "=",
+                    [reduction.reduction_over_neighbor_expr.init],
+                )
+            )
+        )
+        accumulator = make_expr(make_var_access_expr(name))
+        if op in compound_assignments:
+            body.append(
+                make_assignment_stmt(accumulator, rhs, compound_assignments[op])
+            )
+        else:
+            update = make_fun_call_expr(math_function(op), [accumulator, rhs])
+            body.append(make_assignment_stmt(accumulator, update, "="))
+
+    iter_space = reductions[0].reduction_over_neighbor_expr.iter_space
+    loop = make_stmt(
+        make_loop_stmt(body, list(iter_space.chain), iter_space.include_center)
+    )
+
+    for declaration, reduction in zip(declarations, reductions):
+        name = declaration.var_decl_stmt.name
+        replace(reduction, make_expr(make_var_access_expr(name)))
+    return declarations + [loop]
+
+
+def point_reductions(stmt: Stmt) -> t.List[Expr]:
+    # the reductions which `stmt` evaluates exactly once (e.g., not nested ones)
+    reductions = []
+    stack = list(reversed(evaluated_expressions(stmt)))
+    while stack:
+        expr = stack.pop()
+        kind = expr.WhichOneof("expr")
+        if kind == "reduction_over_neighbor_expr":
+            reductions.append(expr)
+        elif kind == "ternary_operator":
+            stack.append(expr.ternary_operator.cond)
+        else:
+            stack.extend(reversed(child_expressions(expr)))
+    return reductions
+
+
+def is_fusable(reduction: Expr) -> bool:
+    reduction = reduction.reduction_over_neighbor_expr
+    return (
+        (reduction.op in compound_assignments or reduction.op in math_reductions)
+        and not reduction.weights
+        and not any(
+            expr.WhichOneof("expr") == "reduction_over_neighbor_expr"
+            for expr in expressions(reduction.rhs)
+        )
+    )
@@ -0,0 +1,168 @@
+"""
+Common subexpression elimination: expressions which are repeated in a block of
+statements are computed once into a local variable (of type `double`), just as
+the parts of reductions which don't depend on the neighbor (instead of once per
+neighbor).
+
+Fields & variables are versioned by the writes to them (see `HashCons`), so an
+expression is only reused as long as nothing it reads was written in between.
+
+Only expressions which are evaluated unconditionally are considered: the branches
+of `if` statements are blocks of their own, but neither the branches of ternary
+operators, the right operands of `&&` & `||`, nor the bodies of sparse loops
+(`with sparse[...]`) are searched.
+"""
+import typing as t
+
+from collections import Counter, defaultdict
+
+from dawn4py.serialization.AST import Expr, Stmt, BlockStmt
+from dawn4py.serialization.SIR import Stencil
+from dawn4py.serialization.utils import (
+    make_stmt,
+    make_var_decl_stmt,
+    make_type,
+    make_expr,
+    make_var_access_expr,
+)
+
+from dusk.passes.folding import DOUBLE
+from dusk.passes.hashcons import HashCons, Node, sparse_fields
+from dusk.passes.traversal import (
+    region_blocks,
+    nested_blocks,
+    evaluated_expressions,
+    written_names,
+    replace,
+    fresh_names,
+    set_statements,
+)
+
+
+# (index of the statement, node, inside of a reduction)
+Occurrence = t.Tuple[int, Node, bool]
+
+leaf_expressions = {"literal_access_expr", "field_access_expr", "var_access_expr"}
+# their right operands are only evaluated depending on the left ones
+short_circuit_operators = {"&&", "||"}
+
+
+def eliminate_common_subexpressions(stencil: Stencil) -> None:
+    names = fresh_names(stencil, "cse_")
+    sparse = sparse_fields(stencil)
+    blocks = region_blocks(stencil)
+    while blocks:
+        block = blocks.pop()
+        # the initializers of new variables can contain further repetitions
+        while eliminate_in_block(block, HashCons(sparse), names):
+            pass
+        blocks.extend(nested_blocks(block))
+
+
+def eliminate_in_block(
+    block: BlockStmt, table: HashCons, names: t.Iterator[str]
+) -> bool:
+    versions: t.Dict[str, int] = Counter()
+    roots: t.List[t.Tuple[int, Node]] = []
+    for index, stmt in enumerate(block.statements):
+        for expr in evaluated_expressions(stmt):
+            roots.append((index, table.node(expr, versions)))
+        for name in written_names(stmt):
+            versions[name] += 1
+
+    all_occurrences = occurrences(roots)
+    counts = Counter(node.id for _, node, _ in all_occurrences)
+    chosen = {
+        node.id
+        for _, node, in_reduction in all_occurrences
+        if in_reduction or 1 < counts[node.id]
+    }
+    # an occurrence is covered by a chosen expression containing it, which can
+    # leave too few (uncovered) occurrences to be worth a variable
+    while True:
+        uses: t.Dict[int, t.List[Occurrence]] = defaultdict(list)
+        for occurrence in occurrences(roots, chosen):
+            if occurrence[1].id in chosen:
+                uses[occurrence[1].id].append(occurrence)
+        unworthy = {id for id in chosen if not worth_variable(uses[id])}
+        if not unworthy:
+            break
+        chosen -= unworthy
+
+    if not chosen:
+        return False
+
+    declarations: t.Dict[int, t.List[Stmt]] = defaultdict(list)
+    # `uses` is ordered by the first use of an expression
+    for id, expr_uses in uses.items():
+        if id not in chosen:
+            continue
+        name = next(names)
+        index, first, _ = expr_uses[0]
+        init = Expr()
+        init.CopyFrom(first.expr)
+        declarations[index].append(
+            make_stmt(make_var_decl_stmt(make_type(DOUBLE), name, 0, "=", [init]))
+        )
+        access = make_expr(make_var_access_expr(name))
+        for _, use, _ in expr_uses:
+            replace(use.expr, access)
+
+    new_statements = []
+    for index, stmt in enumerate(block.statements):
+        new_statements.extend(declarations[index])
+        new_statements.append(stmt)
+    set_statements(block, new_statements)
+    return True
+
+
+def occurrences(
+    roots: t.List[t.Tuple[int, Node]], chosen: t.Optional[t.Set[int]] = None
+) -> t.List[Occurrence]:
+    # all candidates (pre-order), without those inside of `chosen` expressions
+    result = []
+    for index, root in roots:
+        stack = [(root, False)]
+        while stack:
+            node, in_reduction = stack.pop()
+            if is_candidate(node, in_reduction):
+                result.append((index, node, in_reduction))
+                if chosen is not None and node.id in chosen:
+                    continue
+            stack.extend(reversed(evaluated_children(node, in_reduction)))
+    return result
+
+
+def is_candidate(node: Node, in_reduction: bool) -> bool:
+    return (
+        node.pure
+        and node.type == DOUBLE
+        and node.kind not in leaf_expressions
+        and not (in_reduction and node.varying)
+    )
+
+
+def worth_variable(uses: t.List[Occurrence]) -> bool:
+    # anything inside of a reduction is evaluated once per neighbor
+    return 1 < len(uses) or any(in_reduction for _, _, in_reduction in uses)
+
+
+def evaluated_children(node: Node, in_reduction: bool) -> t.List[t.Tuple[Node, bool]]:
+    # the children which are evaluated whenever `node` is (& whether that happens
+    # once per neighbor)
+    if node.kind == "ternary_operator" or (
+        node.kind == "binary_operator"
+        and node.expr.binary_operator.op in short_circuit_operators
+    ):
+        return [(node.children[0], in_reduction)]
+    if node.kind == "reduction_over_neighbor_expr":
+        if in_reduction:
+            # a nested reduction iterates from the neighbor of the outer one
+            return []
+        rhs, init, *weights = node.children
+        return [(rhs, True), (init, False)] + [(weight, True) for weight in weights]
+    if node.kind == "assignment_expr":
+        return [(node.children[1], in_reduction)]
+    if node.kind in leaf_expressions:
+        return []
+    return [(child, in_reduction) for child in node.children]
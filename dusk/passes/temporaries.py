@@ -0,0 +1,312 @@
+"""
+Passes which get rid of temporary fields:
+
+* A sparse temporary which is filled in a sparse loop (`with sparse[...]`) & only
+  read once by a reduction over the same neighbors is replaced by its definition
+  inside of the reduction (`inline_sparse_temporaries`), which saves a temporary
+  of size locations x neighbors x levels.
+* Temporaries which are never read are removed together with their assignments
+  (`eliminate_dead_temporaries`).
+* Temporaries which are only accessed at the current point of a single vertical
+  region (& assigned before they're read) become local variables of type `double`
+  (`demote_temporaries`).
+"""
+import typing as t
+
+from collections import Counter, defaultdict
+
+from dawn4py.serialization.AST import Expr, Stmt, BlockStmt
+from dawn4py.serialization.SIR import Stencil
+from dawn4py.serialization.utils import (
+    make_stmt,
+    make_var_decl_stmt,
+    make_type,
+    make_expr,
+    make_var_access_expr,
+)
+
+from dusk.passes.folding import DOUBLE
+from dusk.passes.hashcons import sparse_fields
+from dusk.passes.reductions import point_reductions
+from dusk.passes.traversal import (
+    expressions,
+    child_expressions,
+    region_blocks,
+    nested_blocks,
+    written_names,
+    read_names,
+    accessed_names,
+    replace,
+    set_statements,
+)
+
+
+def inline_sparse_temporaries(stencil: Stencil) -> None:
+    sparse = sparse_fields(stencil)
+    if not any(field.is_temporary for field in stencil.fields if field.name in sparse):
+        return
+    accesses, writes = count_accesses(stencil)
+    # written exactly once & read exactly once (the write is an access too)
+    candidates = {
+        field.name
+        for field in stencil.fields
+        if field.is_temporary
+        and field.name in sparse
+        and writes[field.name] == ["="]
+        and accesses[field.name] == 2
+    }
+
+    inlined = set()
+    blocks = region_blocks(stencil)
+    while blocks and candidates - inlined:
+        block = blocks.pop()
+        for name in candidates - inlined:
+            if inline_in_block(block, name):
+                inlined.add(name)
+        blocks.extend(nested_blocks(block))
+
+    remove_fields(stencil, inlined)
+
+
+def inline_in_block(block: BlockStmt, name: str) -> bool:
+    found = find_definition(block, name)
+    if found is None:
+        return False
+    loop_index, definition_index = found
+    loop = block.statements[loop_index].loop_stmt
+    definition = loop.statements.statements[definition_index].expr_stmt.expr
+    value = definition.assignment_expr.right
+
+    descriptor = loop.loop_descriptor.loop_descriptor_chain
+    iter_space = (tuple(descriptor.chain), descriptor.include_center)
+    # the value must be the same at the reduction as in the loop
+    reads = read_names(value)
+    if reads & written_names(block.statements[loop_index]):
+        return False
+
+    for index in range(loop_index + 1, len(block.statements)):
+        stmt = block.statements[index]
+        for reduction in point_reductions(stmt):
+            reduction = reduction.reduction_over_neighbor_expr
+            if (
+                tuple(reduction.iter_space.chain),
+                reduction.iter_space.include_center,
+            ) != iter_space:
+                continue
+            access = find_access(reduction.rhs, name)
+            if access is not None:
+                replace(access, value)
+                remove_definition(block, loop_index, definition_index)
+                return True
+        if reads & written_names(stmt):
+            return False
+    return False
+
+
+def find_definition(block: BlockStmt, name: str) -> t.Optional[t.Tuple[int, int]]:
+    # (index of the loop, index of the assignment in the loop)
+    for loop_index, stmt in enumerate(block.statements):
+        if stmt.WhichOneof("stmt") != "loop_stmt":
+            continue
+        for index, nested in enumerate(stmt.loop_stmt.statements.statements):
+            if nested.WhichOneof("stmt") != "expr_stmt":
+                continue
+            expr = nested.expr_stmt.expr
+            if expr.WhichOneof("expr") == "assignment_expr" and is_plain_access(
+                expr.assignment_expr.left, name
+            ):
+                return loop_index, index
+    return None
+
+
+def find_access(rhs: Expr, name: str) -> t.Optional[Expr]:
+    # an access of `name` which isn't inside of a nested reduction (& isn't shifted)
+    stack = [rhs]
+    while stack:
+        expr = stack.pop()
+        if is_plain_access(expr, name):
+            return expr
+        if expr.WhichOneof("expr") != "reduction_over_neighbor_expr":
+            stack.extend(child_expressions(expr))
+    return None
+
+
+def is_plain_access(expr: Expr, name: str) -> bool:
+    if expr.WhichOneof("expr") != "field_access_expr":
+        return False
+    access = expr.field_access_expr
+    return (
+        access.name == name
+        and access.vertical_shift.offset == 0
+        and not access.vertical_shift.HasField("indirection")
+    )
+
+
+def remove_definition(block: BlockStmt, loop_index: int, index: int) -> None:
+    loop = block.statements[loop_index].loop_stmt
+    body = [stmt for i, stmt in enumerate(loop.statements.statements) if i != index]
+    if body:
+        set_statements(loop.statements, body)
+    else:
+        set_statements(
+            block, [stmt for i, stmt in enumerate(block.statements) if i != loop_index]
+        )
+
+
+def eliminate_dead_temporaries(stencil: Stencil) -> None:
+    # removing assignments can make further temporaries dead
+    while any(field.is_temporary for field in stencil.fields):
+        accesses, writes = count_accesses(stencil)
+        dead = {
+            field.name
+            for field in stencil.fields
+            if field.is_temporary and accesses[field.name] == len(writes[field.name])
+        }
+        if not dead:
+            return
+        remove_assignments(stencil, dead)
+        remove_fields(stencil, dead)
+
+
+def remove_assignments(stencil: Stencil, names: t.Set[str]) -> None:
+    # the assignments to `names` & the sparse loops & `if`s which become empty
+    blocks = []
+    pending = region_blocks(stencil)
+    while pending:
+        block = pending.pop()
+        blocks.append(block)
+        pending.extend(nested_blocks(block))
+        pending.extend(
+            stmt.loop_stmt.statements
+            for stmt in block.statements
+            if stmt.WhichOneof("stmt") == "loop_stmt"
+        )
+    # nested blocks first, so empty statements are recognized
+    for block in reversed(blocks):
+        kept = [stmt for stmt in block.statements if not is_removable(stmt, names)]
+        if len(kept) < len(block.statements):
+            set_statements(block, kept)
+
+
+def is_removable(stmt: Stmt, names: t.Set[str]) -> bool:
+    kind = stmt.WhichOneof("stmt")
+    if kind == "expr_stmt":
+        expr = stmt.expr_stmt.expr
+        if expr.WhichOneof("expr") != "assignment_expr":
+            return False
+        left = expr.assignment_expr.left
+        return (
+            left.WhichOneof("expr") == "field_access_expr"
+            and left.field_access_expr.name in names
+        )
+    if kind == "loop_stmt":
+        return not stmt.loop_stmt.statements.statements
+    if kind == "if_stmt":
+        # conditions don't have side effects
+        return not stmt.if_stmt.then_part.block_stmt.statements and not (
+            stmt.if_stmt.else_part.block_stmt.statements
+        )
+    return False
+
+
+def demote_temporaries(stencil: Stencil) -> None:
+    sparse = sparse_fields(stencil)
+    candidates = {
+        field.name
+        for field in stencil.fields
+        if field.is_temporary and field.name not in sparse
+    }
+    if not candidates:
+        return
+    accesses, _ = count_accesses(stencil)
+
+    demoted = set()
+    for block in region_blocks(stencil):
+        region_accesses: Counter = Counter()
+        shifted = set()
+        for expr in expressions(block):
+            if expr.WhichOneof("expr") == "field_access_expr":
+                names = accessed_names(expr.field_access_expr)
+                region_accesses.update(names)
+                if not is_point_access(expr):
+                    shifted.update(names)
+
+        first_accesses: t.Dict[str, int] = {}
+        for index, stmt in enumerate(block.statements):
+            for name in read_names(stmt):
+                first_accesses.setdefault(name, index)
+
+        for name in candidates - shifted:
+            if (
+                region_accesses[name] == accesses[name]
+                and 0 < accesses[name]
+                and is_definition(block.statements[first_accesses[name]], name)
+            ):
+                demote(block, first_accesses[name], name)
+                demoted.add(name)
+
+    remove_fields(stencil, demoted)
+
+
+def is_point_access(expr: Expr) -> bool:
+    access = expr.field_access_expr
+    return (
+        not (
+            access.WhichOneof("horizontal_offset") == "unstructured_offset"
+            and access.unstructured_offset.has_offset
+        )
+        and access.vertical_shift.offset == 0
+        and not access.vertical_shift.HasField("indirection")
+    )
+
+
+def is_definition(stmt: Stmt, name: str) -> bool:
+    # an assignment to `name`, which doesn't read `name`
+    if stmt.WhichOneof("stmt") != "expr_stmt":
+        return False
+    expr = stmt.expr_stmt.expr
+    return (
+        expr.WhichOneof("expr") == "assignment_expr"
+        and expr.assignment_expr.op == "="
+        and is_plain_access(expr.assignment_expr.left, name)
+        and name not in read_names(expr.assignment_expr.right)
+    )
+
+
+def demote(block: BlockStmt, index: int, name: str) -> None:
+    variable = make_expr(make_var_access_expr(name))
+    for expr in expressions(block):
+        if (
+            expr.WhichOneof("expr") == "field_access_expr"
+            and expr.field_access_expr.name == name
+        ):
+            replace(expr, variable)
+    definition = block.statements[index].expr_stmt.expr.assignment_expr
+    block.statements[index].CopyFrom(
+        make_stmt(
+            make_var_decl_stmt(make_type(DOUBLE), name, 0, "=", [definition.right])
+        )
+    )
+
+
+def count_accesses(stencil: Stencil) -> t.Tuple[Counter, t.Dict[str, t.List[str]]]:
+    # the number of accesses of every field & the assignment operators of its writes
+    accesses: Counter = Counter()
+    writes: t.Dict[str, t.List[str]] = defaultdict(list)
+    for expr in expressions(stencil.ast):
+        kind = expr.WhichOneof("expr")
+        if kind == "field_access_expr":
+            accesses.update(accessed_names(expr.field_access_expr))
+        elif kind == "assignment_expr":
+            left = expr.assignment_expr.left
+            if left.WhichOneof("expr") == "field_access_expr":
+                writes[left.field_access_expr.name].append(expr.assignment_expr.op)
+    return accesses, writes
+
+
+def remove_fields(stencil: Stencil, names: t.Set[str]) -> None:
+    if names:
+        # copies the remaining fields before clearing them
+        kept = Stencil(fields=[f for f in stencil.fields if f.name not in names])
+        del stencil.fields[:]
+        stencil.fields.extend(kept.fields)
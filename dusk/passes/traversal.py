@@ -0,0 +1,204 @@
+"""
+Generic traversals of the SIR's AST (protobuf messages).
+
+Expressions can be nested as deep as the operator chains of a stencil are long,
+so everything is traversed iteratively instead of recursively.
+"""
+import typing as t
+
+from itertools import count
+
+from google.protobuf.message import Message
+from dawn4py.serialization.AST import Expr, Stmt, BlockStmt
+from dawn4py.serialization.SIR import Stencil
+
+
+def sub_messages(message: Message) -> t.Iterator[Message]:
+    # the closest `Expr`s & `Stmt`s below `message` in order (looking through all
+    # other messages, e.g., the operator of an `Expr` or the block of a loop)
+    stack = [(message, True)]
+    while stack:
+        current, is_root = stack.pop()
+        if not is_root and isinstance(current, (Expr, Stmt)):
+            yield current
+            continue
+        children: t.List[Message] = []
+        for field, value in current.ListFields():
+            if field.message_type is None:
+                continue
+            children.extend([value] if isinstance(value, Message) else value)
+        stack.extend((child, False) for child in reversed(children))
+
+
+def child_expressions(message: Message) -> t.List[Expr]:
+    if isinstance(message, Expr):
+        # shortcuts for the most common expressions (`ListFields` is slow)
+        kind = message.WhichOneof("expr")
+        if kind == "binary_operator":
+            return [message.binary_operator.left, message.binary_operator.right]
+        elif kind == "unary_operator":
+            return [message.unary_operator.operand]
+        elif kind == "literal_access_expr":
+            return []
+        elif kind == "fun_call_expr":
+            return list(message.fun_call_expr.arguments)
+    return [child for child in sub_messages(message) if isinstance(child, Expr)]
+
+
+def expressions(message: Message) -> t.Iterator[Expr]:
+    # all expressions in `message` (also in nested statements), children are
+    # yielded before their parents, so they can be rewritten bottom-up
+    stack: t.List[t.Tuple[Message, bool]] = [(message, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            yield node
+            continue
+        if isinstance(node, Expr):
+            stack.append((node, True))
+            children = child_expressions(node)
+        else:
+            children = list(sub_messages(node))
+        stack.extend((child, False) for child in reversed(children))
+
+
+def unconditional_expressions(expr: Expr) -> t.List[Expr]:
+    # the expressions in `expr` which are evaluated exactly once whenever `expr` is
+    # (children before their parents), so neither the branches of ternary
+    # operators, the right operands of `&&` & `||`, nor anything that's evaluated
+    # per neighbor of a reduction
+    result = []
+    stack: t.List[t.Tuple[Expr, bool]] = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            result.append(node)
+            continue
+        stack.append((node, True))
+        kind = node.WhichOneof("expr")
+        if kind == "ternary_operator":
+            children = [node.ternary_operator.cond]
+        elif kind == "binary_operator" and node.binary_operator.op in {"&&", "||"}:
+            children = [node.binary_operator.left]
+        elif kind == "reduction_over_neighbor_expr":
+            children = [node.reduction_over_neighbor_expr.init]
+        elif kind == "assignment_expr":
+            children = [node.assignment_expr.right]
+        else:
+            children = child_expressions(node)
+        stack.extend((child, False) for child in reversed(children))
+    return result
+
+
+def statements(message: Message) -> t.Iterator[Stmt]:
+    # all statements in `message` (parents before their children)
+    stack = [message]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Stmt):
+            yield node
+        stack.extend(
+            child
+            for child in reversed(list(sub_messages(node)))
+            if isinstance(child, Stmt)
+        )
+
+
+def replace(expr: Expr, new: Expr) -> None:
+    # `new` might be part of `expr`, which `CopyFrom` would clear first
+    copy = Expr()
+    copy.CopyFrom(new)
+    expr.CopyFrom(copy)
+
+
+def fresh_names(stencil: Stencil, prefix: str) -> t.Iterator[str]:
+    # names which are neither fields nor variables of `stencil` yet
+    taken = {field.name for field in stencil.fields}
+    taken.update(
+        stmt.var_decl_stmt.name
+        for stmt in statements(stencil.ast)
+        if stmt.WhichOneof("stmt") == "var_decl_stmt"
+    )
+    for index in count():
+        name = f"{prefix}{index}"
+        if name not in taken:
+            yield name
+
+
+def set_statements(block: BlockStmt, stmts: t.List[Stmt]) -> None:
+    # `stmts` might be part of `block` (repeated fields can't be rearranged)
+    new_block = BlockStmt(statements=stmts, ID=block.ID)
+    block.CopyFrom(new_block)
+
+
+def region_blocks(stencil: Stencil) -> t.List[BlockStmt]:
+    # the bodies of all vertical regions
+    return [
+        stmt.vertical_region_decl_stmt.vertical_region.ast.root.block_stmt
+        for stmt in statements(stencil.ast)
+        if stmt.WhichOneof("stmt") == "vertical_region_decl_stmt"
+    ]
+
+
+def nested_blocks(block: BlockStmt) -> t.List[BlockStmt]:
+    blocks = []
+    for stmt in block.statements:
+        kind = stmt.WhichOneof("stmt")
+        if kind == "if_stmt":
+            blocks.append(stmt.if_stmt.then_part.block_stmt)
+            if stmt.if_stmt.HasField("else_part"):
+                blocks.append(stmt.if_stmt.else_part.block_stmt)
+        elif kind == "block_stmt":
+            blocks.append(stmt.block_stmt)
+    return blocks
+
+
+def evaluated_expressions(stmt: Stmt) -> t.List[Expr]:
+    # the expressions of `stmt` which are evaluated in the scope of its block
+    kind = stmt.WhichOneof("stmt")
+    if kind == "expr_stmt":
+        return [stmt.expr_stmt.expr]
+    if kind == "var_decl_stmt":
+        return list(stmt.var_decl_stmt.init_list)
+    if kind == "if_stmt":
+        return [stmt.if_stmt.cond_part.expr_stmt.expr]
+    return []
+
+
+def written_names(stmt: Stmt) -> t.Set[str]:
+    # fields & variables written anywhere in `stmt` (dusk only produces assignments
+    # as statements)
+    names = set()
+    for nested in statements(stmt):
+        kind = nested.WhichOneof("stmt")
+        if kind == "expr_stmt":
+            expr = nested.expr_stmt.expr
+            if expr.WhichOneof("expr") == "assignment_expr":
+                left = expr.assignment_expr.left
+                names.add(getattr(left, left.WhichOneof("expr")).name)
+        elif kind == "var_decl_stmt":
+            names.add(nested.var_decl_stmt.name)
+    return names
+
+
+def read_names(message: Message) -> t.Set[str]:
+    # fields & variables accessed anywhere in `message`
+    names = set()
+    for expr in expressions(message):
+        kind = expr.WhichOneof("expr")
+        if kind == "field_access_expr":
+            names.update(accessed_names(expr.field_access_expr))
+        elif kind == "var_access_expr":
+            names.add(expr.var_access_expr.name)
+    return names
+
+
+def accessed_names(access) -> t.List[str]:
+    # the field of a `FieldAccessExpr` & the index field of its vertical indirection
+    names = [access.name]
+    if access.vertical_shift.HasField("indirection"):
+        indirection = access.vertical_shift.indirection
+        if isinstance(indirection, Expr):
+            indirection = getattr(indirection, indirection.WhichOneof("expr"))
+        names.append(indirection.name)
+    return names
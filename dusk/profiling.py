@@ -0,0 +1,284 @@
+from __future__ import annotations
+import typing as t
+
+import json
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class Stats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.exceptions = Counter()
+        self.cumulative_time = 0.0
+        self.self_time = 0.0
+        # cumulative time is only accounted for the outermost recursive call
+        self.active_calls = 0
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "exceptions": dict(self.exceptions),
+            "cumulative_time": self.cumulative_time,
+            "self_time": self.self_time,
+        }
+
+
+class MatcherProfile:
+    """
+    Statistics about the grammar rules (`transform`) and compiled matchers.
+
+    Use `profile_matchers` to collect them.
+    """
+
+    def __init__(self) -> None:
+        self.rules: t.Dict[str, Stats] = {}
+        self.matchers: t.Dict[str, Stats] = {}
+        # start time & time spent in children for every active call
+        self.stack: t.List[t.List[float]] = []
+
+    def stats(self, table: t.Dict[str, Stats], name: str) -> Stats:
+        if name not in table:
+            table[name] = Stats(name)
+        return table[name]
+
+    def enter(self, stats: Stats) -> None:
+        stats.calls += 1
+        stats.active_calls += 1
+        self.stack.append([perf_counter(), 0.0])
+
+    def exit(self, stats: Stats, success: bool, exception=None) -> None:
+        start, children_time = self.stack.pop()
+        elapsed = perf_counter() - start
+
+        stats.active_calls -= 1
+        if stats.active_calls == 0:
+            stats.cumulative_time += elapsed
+        stats.self_time += elapsed - children_time
+        if self.stack:
+            self.stack[-1][1] += elapsed
+
+        if success:
+            stats.successes += 1
+        else:
+            stats.failures += 1
+        if exception is not None:
+            stats.exceptions[type(exception).__name__] += 1
+
+    def call_rule(self, name: str, rule: t.Callable, *args, **kwargs):
+        stats = self.stats(self.rules, name)
+        self.enter(stats)
+        try:
+            result = rule(*args, **kwargs)
+        except BaseException as e:
+            self.exit(stats, False, e)
+            raise
+        self.exit(stats, True)
+        return result
+
+    def instrument_test(self, name: str, test: t.Callable) -> t.Callable:
+        stats = self.stats(self.matchers, name)
+
+        def instrumented_test(node, capturer=None):
+            self.enter(stats)
+            try:
+                success = test(node, capturer)
+            except BaseException as e:
+                self.exit(stats, False, e)
+                raise
+            self.exit(stats, success)
+            return success
+
+        return instrumented_test
+
+    def instrument_diagnose(self, name: str, diagnose: t.Callable) -> t.Callable:
+        stats = self.stats(self.matchers, name)
+
+        def instrumented_diagnose(node, capturer=None):
+            self.enter(stats)
+            try:
+                diagnose(node, capturer)
+            except BaseException as e:
+                self.exit(stats, False, e)
+                raise
+            self.exit(stats, True)
+
+        return instrumented_diagnose
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "rules": [stats.to_dict() for stats in self.rules.values()],
+            "matchers": [stats.to_dict() for stats in self.matchers.values()],
+        }
+
+    def report(self) -> str:
+        header = (
+            f"{'name':<40} {'calls':>8} {'success':>8} {'failure':>8} "
+            f"{'except':>8} {'cumtime':>10} {'selftime':>10}\n"
+        )
+        out = ""
+        for title, table in (("rules", self.rules), ("matchers", self.matchers)):
+            out += f"{title} (sorted by self time):\n" + header
+            for stats in sorted(table.values(), key=lambda s: -s.self_time):
+                out += (
+                    f"{stats.name:<40} {stats.calls:>8} {stats.successes:>8} "
+                    f"{stats.failures:>8} {sum(stats.exceptions.values()):>8} "
+                    f"{stats.cumulative_time:>10.4f} {stats.self_time:>10.4f}\n"
+                )
+            out += "\n"
+        return out
+
+
+# the profile which is currently collected (if any), used by `dusk.grammar.transform`
+active_profile: t.Optional[MatcherProfile] = None
+
+
+@contextmanager
+def profile_matchers() -> t.Iterator[MatcherProfile]:
+    """
+    Collects statistics about grammar rules & compiled matchers.
+
+    Example:
+        with profile_matchers() as profile:
+            pyast_to_sir(stencils)
+        print(profile.report())
+    """
+    global active_profile
+    if active_profile is not None:
+        raise RuntimeError("Matchers are already being profiled!")
+
+    # the grammar's matchers are compiled on import (which is deferred by the clis)
+    import dusk.grammar
+    from dusk.match import compiled_matchers
+
+    profile = MatcherProfile()
+    # compiled matchers are instrumented in place, so there is no overhead otherwise
+    originals = [
+        (matcher, matcher.test, matcher.diagnose) for matcher in compiled_matchers
+    ]
+    for matcher, test, diagnose in originals:
+        name = matcher.name or "<anonymous matcher>"
+        matcher.test = profile.instrument_test(name, test)
+        matcher.diagnose = profile.instrument_diagnose(name, diagnose)
+
+    active_profile = profile
+    try:
+        yield profile
+    finally:
+        active_profile = None
+        for matcher, test, diagnose in originals:
+            matcher.test = test
+            matcher.diagnose = diagnose
+
+
+class Phase:
+    # a (finished) phase of the pipeline, times are in seconds (`perf_counter`),
+    # `thread` is the ident of the thread which ran it
+    def __init__(
+        self, name: str, start: float, end: float, args: t.Dict, thread: int
+    ) -> None:
+        self.name = name
+        self.start = start
+        self.end = end
+        self.args = args
+        self.thread = thread
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class PhaseProfile:
+    """
+    The phases of the pipeline (parsing, translating every stencil, codegen, etc.).
+
+    Use `profile_phases` to collect them.
+    """
+
+    def __init__(self, callback: t.Optional[t.Callable[[Phase], None]] = None) -> None:
+        self.phases: t.List[Phase] = []
+        self.callback = callback
+        self.start = perf_counter()
+
+    def add(self, phase: Phase) -> None:
+        self.phases.append(phase)
+        if self.callback is not None:
+            self.callback(phase)
+
+    def to_chrome_trace(self) -> t.Dict[str, t.Any]:
+        # see the "Trace Event Format" (viewable in `chrome://tracing` or Perfetto)
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": phase.name,
+                    "cat": "dusk",
+                    "ph": "X",
+                    "ts": (phase.start - self.start) * 1e6,
+                    "dur": phase.duration * 1e6,
+                    "pid": pid,
+                    # a track per thread, so concurrent phases don't look nested
+                    "tid": phase.thread,
+                    "args": phase.args,
+                }
+                for phase in self.phases
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as out_file:
+            json.dump(self.to_chrome_trace(), out_file, indent=1)
+
+
+# the phases which are currently collected (if any), see `phase`
+active_phase_profile: t.Optional[PhaseProfile] = None
+
+
+@contextmanager
+def profile_phases(
+    callback: t.Optional[t.Callable[[Phase], None]] = None
+) -> t.Iterator[PhaseProfile]:
+    """
+    Times the phases of the pipeline, `callback` is called after every phase.
+
+    Example:
+        with profile_phases(lambda phase: print(phase.name, phase.duration)) as profile:
+            transpile("stencil.py", None, out_file)
+        profile.write_chrome_trace("profile.json")
+    """
+    global active_phase_profile
+    if active_phase_profile is not None:
+        raise RuntimeError("Phases are already being profiled!")
+
+    profile = PhaseProfile(callback)
+    active_phase_profile = profile
+    try:
+        yield profile
+    finally:
+        active_phase_profile = None
+
+
+@contextmanager
+def phase(name: str, **args) -> t.Iterator[None]:
+    # marks a phase of the pipeline (only recorded while profiling phases)
+    profile = active_phase_profile
+    if profile is None:
+        yield
+        return
+
+    thread = threading.get_ident()
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(Phase(name, start, perf_counter(), args, thread))
@@ -1,5 +1,6 @@
 import typing
 from dusk.script import internal
+from dusk.lazy import LazyStencil
 
 from dusk.script.math import *
 from dusk.script.math import __all__ as __math_all__
@@ -24,8 +25,8 @@ __all__ = [
 ] + __math_all__
 
 
-def stencil(stencil: typing.Callable) -> typing.Callable:
-    return stencil
+def stencil(stencil: typing.Callable) -> LazyStencil:
+    return LazyStencil(stencil)
 
 
 class Edge(metaclass=internal.LocationType):
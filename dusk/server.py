@@ -0,0 +1,427 @@
+"""
+A persistent server which keeps warm worker processes to transpile stencils.
+
+Start it with `dusk-serve`. While it's running, `dusk` & `dusk-front` forward
+their work to it (unless `--no-server` is passed), so they don't pay for importing
+dawn4py & building the grammar on every invocation.
+
+Clients talk to the server over a Unix domain socket with newline-delimited
+JSON (one request & one response per line). Clients only use a server which
+has the same version of dusk & of its grammar as themselves, & whose socket
+belongs to the current user (by default, it's in a directory only they can access).
+"""
+from __future__ import annotations
+import typing as t
+
+import faulthandler
+import json
+import os
+import socket
+import signal
+import socketserver
+import sys
+import tempfile
+import threading
+import traceback
+from argparse import ArgumentParser
+from base64 import b64encode, b64decode
+from multiprocessing import get_context, TimeoutError
+
+from dusk import __version__
+from dusk.cli import FileJob, FileStatus, transpile_file
+from dusk.outputs import default_sir_format
+
+
+def default_socket_path() -> str:
+    if "DUSK_SOCKET" in os.environ:
+        return os.environ["DUSK_SOCKET"]
+    if "XDG_RUNTIME_DIR" in os.environ:
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "dusk.sock")
+    # the temporary directory is shared with other users, so the socket is put in
+    # a private directory (see `make_socket_directory`)
+    directory = os.path.join(tempfile.gettempdir(), f"dusk-{os.getuid()}")
+    return os.path.join(directory, "dusk.sock")
+
+
+def make_socket_directory(socket_path: str) -> None:
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not owned_privately(directory):
+        raise RuntimeError(
+            f"'{directory}' has to belong to the current user & mustn't be "
+            "writable by others!"
+        )
+
+
+def owned_privately(path: str) -> bool:
+    # other users could otherwise have created (or replaced) it
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def socket_in_use(socket_path: str) -> bool:
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except OSError:
+        # e.g., nobody listens on the socket anymore
+        return False
+    finally:
+        connection.close()
+    return True
+
+
+def initialize_worker(max_memory: t.Optional[int]) -> None:
+    if max_memory is not None:
+        import resource
+
+        # requests which need more memory fail with a `MemoryError`
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    # warms up the worker
+    import dusk.transpile
+
+
+# a task which doesn't stop at its timeout (e.g., it's stuck in Dawn's native code)
+# is killed this many seconds later, together with its worker
+kill_delay = 5.0
+
+
+class TaskTimeout(BaseException):
+    # not an `Exception`, so tasks don't handle it like their own errors
+    pass
+
+
+def run_task(
+    timeout: t.Optional[float], in_file: str, function: t.Callable, *args, **kwargs
+) -> FileStatus:
+    # runs in a worker: a task which takes longer than `timeout` is interrupted,
+    # so the worker is free for the next task (if the task can't be interrupted,
+    # the worker exits & the pool replaces it)
+    if timeout is None:
+        return function(*args, **kwargs)
+
+    def interrupt(signum, frame):
+        raise TaskTimeout()
+
+    previous = signal.signal(signal.SIGALRM, interrupt)
+    faulthandler.dump_traceback_later(timeout + kill_delay, exit=True)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except TaskTimeout:
+        return FileStatus(in_file, "failed", "Timed out in the dusk server!")
+    finally:
+        faulthandler.cancel_dump_traceback_later()
+        signal.signal(signal.SIGALRM, previous)
+
+
+def validate_file(in_file: str) -> FileStatus:
+    from dusk.transpile import str_to_pyast, pyast_to_sir, validate
+    from dusk.errors import DuskSyntaxError, DuskStencilErrors
+
+    try:
+        with open(in_file, "r") as file:
+            source = file.read()
+        validate(pyast_to_sir(str_to_pyast(source, in_file), in_file))
+    except (DuskSyntaxError, DuskStencilErrors) as error:
+        return FileStatus(in_file, "failed", str(error))
+    except Exception:
+        return FileStatus(in_file, "failed", traceback.format_exc())
+    return FileStatus(in_file, "ok")
+
+
+def encode_status(status: FileStatus) -> FileStatus:
+    # JSON has no bytes (e.g., binary SIR)
+    if isinstance(status.sir, bytes):
+        return status._replace(sir={"base64": b64encode(status.sir).decode()})
+    return status
+
+
+def decode_status(status: t.List[t.Any]) -> FileStatus:
+    status = FileStatus(*status)
+    if isinstance(status.sir, dict):
+        return status._replace(sir=b64decode(status.sir["base64"]))
+    return status
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception:
+                response = {"status": "error", "message": traceback.format_exc()}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Handles every client in its own thread, the work is done by a pool of worker
+    processes. Workers are replaced after `max_tasks` requests (bounding leaks) &
+    each worker's address space is limited to `max_memory` bytes (if given).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: str,
+        workers: t.Optional[int] = None,
+        max_memory: t.Optional[int] = None,
+        max_tasks: int = 100,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        from dusk.cache import grammar_version, compute_grammar_version
+
+        make_socket_directory(socket_path)
+        if os.path.exists(socket_path):
+            if socket_in_use(socket_path):
+                raise RuntimeError(
+                    f"A dusk server is already running on '{socket_path}'!"
+                )
+            # left behind by a server which didn't shut down cleanly
+            os.remove(socket_path)
+
+        self.grammar_version = grammar_version()
+        self.compute_grammar_version = compute_grammar_version
+        self.timeout = timeout
+        # new workers are spawned (forking a process with threads isn't safe)
+        self.pool = get_context("spawn").Pool(
+            workers,
+            initializer=initialize_worker,
+            initargs=(max_memory,),
+            maxtasksperchild=max_tasks,
+        )
+        # only the current user may connect
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.terminate()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    def submit(self, in_file: str, function: t.Callable, *args, **kwargs):
+        return self.pool.apply_async(
+            run_task, (self.timeout, in_file, function, *args), kwargs
+        )
+
+    def result(self, in_file: str, result) -> FileStatus:
+        # the worker stops the task itself, this only catches killed workers
+        # (whose results never arrive)
+        timeout = None if self.timeout is None else self.timeout + 2 * kill_delay
+        try:
+            return result.get(timeout)
+        except TimeoutError:
+            return FileStatus(in_file, "failed", "Timed out in the dusk server!")
+
+    def dispatch(self, request: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        command = request["command"]
+
+        if command == "ping":
+            # a stale server (e.g., the sources changed) shouldn't be used anymore
+            if self.compute_grammar_version() != self.grammar_version:
+                return {"status": "stale", "version": __version__}
+            # neither should a server of another dusk (e.g., another checkout)
+            if (request.get("version"), request.get("grammar_version")) != (
+                __version__,
+                self.grammar_version,
+            ):
+                return {"status": "mismatch", "version": __version__}
+            return {"status": "ok", "version": __version__}
+
+        elif command == "transpile":
+            options = (request["verbose"], request["cache_dir"], request["optimize"])
+            kwargs = {"sir_format": request["sir_format"]}
+            jobs = [FileJob(*job) for job in request["jobs"]]
+            results = [
+                self.submit(job.in_file, transpile_file, job, *options, **kwargs)
+                for job in jobs
+            ]
+            statuses = [self.result(job.in_file, r) for job, r in zip(jobs, results)]
+            return {"status": "ok", "results": [encode_status(s) for s in statuses]}
+
+        elif command == "validate":
+            in_file = request["in_file"]
+            result = self.submit(in_file, validate_file, in_file)
+            return {"status": "ok", "result": self.result(in_file, result)}
+
+        elif command == "shutdown":
+            threading.Thread(target=self.shutdown).start()
+            return {"status": "ok"}
+
+        else:
+            return {"status": "error", "message": f"Unknown command '{command}'!"}
+
+
+class Client:
+    def __init__(self, connection: socket.socket) -> None:
+        self.connection = connection
+        self.file = connection.makefile("rwb")
+
+    @classmethod
+    def connect(
+        cls,
+        socket_path: t.Optional[str] = None,
+        timeout: float = 1.0,
+        any_version: bool = False,
+    ) -> t.Optional[Client]:
+        # returns `None` if there is no (usable) server, e.g., a server which
+        # translates with another version of dusk or of its grammar (unless
+        # `any_version`), or whose socket doesn't belong to the current user
+        from dusk.cache import grammar_version
+
+        socket_path = socket_path or default_socket_path()
+        if not os.path.exists(socket_path) or not owned_privately(socket_path):
+            return None
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        try:
+            connection.connect(socket_path)
+            client = cls(connection)
+            ping = {
+                "command": "ping",
+                "version": __version__,
+                "grammar_version": grammar_version(),
+            }
+            if client.request(ping)["status"] != "ok" and not any_version:
+                client.close()
+                return None
+        except (OSError, ValueError):
+            connection.close()
+            return None
+        connection.settimeout(None)
+        return client
+
+    def close(self) -> None:
+        self.file.close()
+        self.connection.close()
+
+    def request(self, request: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        self.file.write(json.dumps(request).encode() + b"\n")
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if response["status"] == "error":
+            raise RuntimeError(f"dusk server: {response['message']}")
+        return response
+
+    def transpile(
+        self,
+        jobs: t.List[FileJob],
+        verbose: bool,
+        cache_dir: t.Optional[str],
+        optimize: bool = False,
+        sir_format: str = default_sir_format,
+    ) -> t.List[FileStatus]:
+        # the server might run in another directory
+        jobs = [job._replace(in_file=os.path.abspath(job.in_file)) for job in jobs]
+        response = self.request(
+            {
+                "command": "transpile",
+                "jobs": jobs,
+                "verbose": verbose,
+                "cache_dir": os.path.abspath(cache_dir) if cache_dir else None,
+                "optimize": optimize,
+                "sir_format": sir_format,
+            }
+        )
+        return [
+            decode_status(status)._replace(in_file=job.in_file)
+            for job, status in zip(jobs, response["results"])
+        ]
+
+    def validate(self, in_file: str) -> FileStatus:
+        response = self.request(
+            {"command": "validate", "in_file": os.path.abspath(in_file)}
+        )
+        return decode_status(response["result"])
+
+    def shutdown(self) -> None:
+        self.request({"command": "shutdown"})
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> None:
+    argparser = ArgumentParser(
+        prog="dusk-serve",
+        description="Runs a server which transpiles stencils for dusk & dusk-front.",
+    )
+    argparser.add_argument(
+        "--socket",
+        type=str,
+        dest="socket_path",
+        default=default_socket_path(),
+        help="Unix domain socket (also see $DUSK_SOCKET), default: %(default)s",
+    )
+    argparser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        dest="workers",
+        default=None,
+        help="Number of worker processes, default: number of cores",
+    )
+    argparser.add_argument(
+        "--max-memory",
+        type=int,
+        dest="max_memory",
+        help="Memory limit per worker process (in MiB)",
+    )
+    argparser.add_argument(
+        "--max-tasks",
+        type=int,
+        dest="max_tasks",
+        default=100,
+        help="Replaces worker processes after this many tasks, default: %(default)s",
+    )
+    argparser.add_argument(
+        "--timeout",
+        type=float,
+        dest="timeout",
+        help="Timeout per file (in seconds)",
+    )
+    argparser.add_argument(
+        "--stop",
+        default=False,
+        action="store_true",
+        help="Stops the running server",
+    )
+    args = argparser.parse_args(argv)
+
+    if args.stop:
+        # also stops servers of other versions (which clients don't use)
+        client = Client.connect(args.socket_path, any_version=True)
+        if client is None:
+            argparser.exit(1, "dusk-serve: no server running\n")
+        client.shutdown()
+        return
+
+    # makes sure that the socket is removed again
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    try:
+        server = Server(
+            args.socket_path,
+            workers=args.workers,
+            max_memory=max_memory,
+            max_tasks=args.max_tasks,
+            timeout=args.timeout,
+        )
+    except RuntimeError as error:
+        argparser.exit(1, f"dusk-serve: {error}\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
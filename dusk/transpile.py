@@ -1,29 +1,46 @@
-from typing import Optional, Callable, List
+from typing import (
+    Optional,
+    Callable,
+    List,
+    Tuple,
+    Dict,
+    Union,
+    Iterator,
+    Iterable,
+    Sequence,
+    IO,
+)
 from inspect import getsource
 
 from functools import reduce
 from operator import add
 import ast
-from io import TextIOBase
+from concurrent.futures import ProcessPoolExecutor
 
 from dusk.grammar import Grammar
+from dusk.passes import Pass, run_passes
+from dusk.profiling import phase
+from dusk.cache import StencilCache, CodegenCache
+from dusk.errors import DuskStencilErrors
+from dusk.lazy import LazyStencil
+from dusk.outputs import (
+    backend_map,
+    default_backend,
+    default_sir_format,
+    streaming_sir_formats,
+)
 
-from dawn4py import compile, CodeGenBackend, set_verbosity, LogLevel
+# Dawn's compiler & optimizer are only imported once they are needed,
+# producing SIR only needs the serialization
 from dawn4py.serialization import make_sir, to_json as sir_to_json
-from dawn4py.serialization.SIR import SIR
+from dawn4py.serialization.SIR import SIR, Stencil
 from dawn4py.serialization.AST import GridType
-from dawn4py._dawn4py import run_optimizer_sir
-
-
-backend_map = {
-    "ico-naive": CodeGenBackend.CXXNaiveIco,
-    "ico-cuda": CodeGenBackend.CUDAIco,
-}
-default_backend = "ico-naive"
+from google.protobuf import json_format
 
 
 def str_to_pyast(source: str, filename: str = "<unknown>") -> List[ast.FunctionDef]:
-    source_ast = ast.parse(source, filename=filename, type_comments=True)
+    with phase("ast.parse", filename=filename):
+        source_ast = ast.parse(source, filename=filename, type_comments=True)
     assert isinstance(source_ast, ast.Module)
     return [
         stencil_ast
@@ -35,13 +52,20 @@ def str_to_pyast(source: str, filename: str = "<unknown>") -> List[ast.FunctionD
 def callable_to_pyast(
     stencil: Callable, filename: str = "<unknown>"
 ) -> List[ast.FunctionDef]:
+    # `@stencil` already caches the AST
+    if isinstance(stencil, LazyStencil):
+        return [stencil.pyast]
+    return [source_to_pyast(getsource(stencil), filename=filename)]
+
+
+def source_to_pyast(source: str, filename: str = "<unknown>") -> ast.FunctionDef:
     # TODO: this will give wrong line numbers, there should be a way to fix them
-    source = getsource(stencil)
-    stencil_ast = ast.parse(source, filename=filename, type_comments=True)
+    with phase("ast.parse", filename=filename):
+        stencil_ast = ast.parse(source, filename=filename, type_comments=True)
     assert isinstance(stencil_ast, ast.Module)
     assert len(stencil_ast.body) == 1
     assert Grammar.is_stencil(stencil_ast.body[0])
-    return [stencil_ast.body[0]]
+    return stencil_ast.body[0]
 
 
 def callables_to_pyast(
@@ -52,46 +76,435 @@ def callables_to_pyast(
     )
 
 
-def pyast_to_sir(stencils: List[ast.FunctionDef], filename: str = "<unknown>") -> SIR:
+def translate_stencil(stencil: ast.FunctionDef, passes: Sequence[Pass] = ()) -> Stencil:
+    # every stencil gets a fresh grammar, so errors in one stencil can't affect others
+    with phase("Grammar.stencil", stencil=stencil.name):
+        sir_stencil = Grammar().stencil(stencil)
+    return run_passes(sir_stencil, passes)
+
+
+def translate_stencil_in_worker(
+    stencil: ast.FunctionDef, passes: Sequence[Pass] = ()
+) -> bytes:
+    # runs in a worker process, so the stencil is passed back serialized
+    return translate_stencil(stencil, passes).SerializeToString()
+
+
+def pyast_to_sir(
+    stencils: List[ast.FunctionDef],
+    filename: str = "<unknown>",
+    cache: Optional[StencilCache] = None,
+    jobs: Optional[int] = 1,
+    passes: Sequence[Pass] = (),
+) -> SIR:
+    """
+    Translates the stencils to SIR.
+
+    With `jobs != 1`, the stencils are translated by a pool of `jobs` processes
+    (`None` uses all cores). Every stencil is translated independently: if a single
+    stencil fails, its error is raised, otherwise the errors of all failed stencils
+    are raised together as `DuskStencilErrors`.
+
+    `passes` run over every translated stencil (see `dusk.passes`), by default none.
+    """
+    sir_stencils = list(
+        translate_stencils(stencils, cache=cache, jobs=jobs, passes=passes)
+    )
+    with phase("make_sir", filename=filename):
+        return make_sir(filename, GridType.Value("Unstructured"), sir_stencils)
+
+
+def translate_stencils(
+    stencils: List[ast.FunctionDef],
+    cache: Optional[StencilCache] = None,
+    jobs: Optional[int] = 1,
+    passes: Sequence[Pass] = (),
+) -> Iterator[Stencil]:
+    """
+    Yields the translated stencils in order, as soon as each one is available
+    (see `pyast_to_sir`). Errors are raised once all other stencils are yielded.
+    """
 
-    grammar = Grammar()
     # TODO: should probably throw instead
-    assert all(grammar.is_stencil(stencil) for stencil in stencils)
+    assert all(Grammar.is_stencil(stencil) for stencil in stencils)
+
+    def load(stencil: ast.FunctionDef) -> Tuple[Optional[str], Optional[Stencil]]:
+        if cache is None:
+            return None, None
+        key = cache.key(stencil, passes)
+        with phase("StencilCache.load", stencil=stencil.name):
+            return key, cache.load(key)
+
+    # with a pool, all stencils are looked up first (to submit the missing ones)
+    cached = None
+    if jobs != 1 and 1 < len(stencils):
+        cached = [load(stencil) for stencil in stencils]
+        missing = [
+            i for i, (_, sir_stencil) in enumerate(cached) if sir_stencil is None
+        ]
+
+    errors = []
+    if cached is not None and 1 < len(missing):
+        with phase("ProcessPoolExecutor", jobs=jobs):
+            with ProcessPoolExecutor(jobs) as pool:
+                futures = {
+                    i: pool.submit(translate_stencil_in_worker, stencils[i], passes)
+                    for i in missing
+                }
+                for i, (key, sir_stencil) in enumerate(cached):
+                    if sir_stencil is None:
+                        try:
+                            sir_stencil = Stencil.FromString(futures.pop(i).result())
+                        except Exception as error:
+                            errors.append((stencils[i].name, error))
+                            continue
+                        if cache is not None:
+                            cache.store(key, sir_stencil)
+                    yield sir_stencil
+    else:
+        for i, stencil in enumerate(stencils):
+            key, sir_stencil = cached[i] if cached is not None else load(stencil)
+            if sir_stencil is None:
+                try:
+                    sir_stencil = translate_stencil(stencil, passes)
+                except Exception as error:
+                    errors.append((stencil.name, error))
+                    continue
+                if cache is not None:
+                    cache.store(key, sir_stencil)
+            yield sir_stencil
+
+    if len(errors) == 1:
+        raise errors[0][1]
+    elif errors:
+        raise DuskStencilErrors(errors)
+
 
-    # TODO: handle errors in different stencils separately
-    stencils = [grammar.stencil(stencil) for stencil in stencils]
+def sir_to_binary(sir: SIR) -> bytes:
+    return sir.SerializeToString()
 
-    return make_sir(filename, GridType.Value("Unstructured"), stencils)
+
+def write_sir(out_file: IO, sir: SIR, sir_format: str = default_sir_format) -> None:
+    if sir_format == "json":
+        out_file.write(sir_to_json(sir))
+    elif sir_format == "binary":
+        out_file.write(sir_to_binary(sir))
+    else:
+        # the same records as if the SIR was streamed
+        write_sir_stream(out_file, sir.filename, sir.stencils, sir_format)
+
+
+def write_sir_stream(
+    out_file: IO,
+    filename: str,
+    stencils: Iterable[Stencil],
+    sir_format: str = "jsonl",
+) -> int:
+    """
+    Writes the SIR record by record: first a SIR without any stencils (which has
+    the remaining attributes), then every stencil as soon as it's yielded.
+
+    For `jsonl`, every record is a line of JSON (`out_file` is a text file).
+    For `length-prefixed`, every record is a serialized message which is prefixed
+    by its size as a varint (`out_file` is a binary file), the same framing as
+    protobuf's `writeDelimitedTo`/`parseDelimitedFrom`.
+
+    Returns the number of stencils.
+    """
+
+    def write_record(message) -> None:
+        if sir_format == "jsonl":
+            out_file.write(json_format.MessageToJson(message, indent=None) + "\n")
+        elif sir_format == "length-prefixed":
+            data = message.SerializeToString()
+            out_file.write(encode_varint(len(data)) + data)
+        else:
+            raise ValueError(f"Unknown streaming SIR format '{sir_format}'!")
+        # downstream tools can start consuming early
+        out_file.flush()
+
+    write_record(make_sir(filename, GridType.Value("Unstructured"), []))
+    count = 0
+    for stencil in stencils:
+        with phase("write_sir_record", stencil=stencil.name):
+            write_record(stencil)
+        count += 1
+    return count
+
+
+def read_sir_stream(in_file: IO, sir_format: str = "jsonl") -> SIR:
+    # the inverse of `write_sir_stream`
+    if sir_format == "jsonl":
+        records = (line for line in in_file if line.strip())
+    elif sir_format == "length-prefixed":
+        records = iter_length_prefixed(in_file)
+    else:
+        raise ValueError(f"Unknown streaming SIR format '{sir_format}'!")
+
+    sir = SIR()
+    for i, record in enumerate(records):
+        message = sir if i == 0 else sir.stencils.add()
+        if sir_format == "jsonl":
+            json_format.Parse(record, message)
+        else:
+            message.MergeFromString(record)
+    return sir
+
+
+def encode_varint(value: int) -> bytes:
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def iter_length_prefixed(in_file: IO) -> Iterator[bytes]:
+    while True:
+        size, shift = 0, 0
+        while True:
+            byte = in_file.read(1)
+            if not byte:
+                if shift != 0:
+                    raise ValueError("Truncated length-prefixed record!")
+                return
+            size |= (byte[0] & 0x7F) << shift
+            shift += 7
+            if not byte[0] & 0x80:
+                break
+        data = in_file.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated length-prefixed record!")
+        yield data
 
 
 def sir_to_cpp(
-    sir: SIR, verbose: bool = False, groups: List = [], backend=default_backend
+    sir: SIR,
+    verbose: bool = False,
+    groups: List = [],
+    backend=default_backend,
+    cache: Optional[CodegenCache] = None,
 ) -> str:
+    if cache is not None:
+        key = cache.key(sir, backend, groups)
+        with phase("CodegenCache.load", backend=backend):
+            code = cache.load(key)
+        if code is not None:
+            return code
+
+    from dawn4py import compile, CodeGenBackend, set_verbosity, LogLevel
+
     if verbose:
         set_verbosity(LogLevel.All)
     # TODO: default pass groups are bugged in Dawn, need to pass empty list of groups
-    return compile(sir, groups=groups, backend=backend_map[backend])
+    with phase("dawn4py.compile", backend=backend):
+        code = compile(
+            sir, groups=groups, backend=getattr(CodeGenBackend, backend_map[backend])
+        )
+
+    if cache is not None:
+        cache.store(key, code)
+    return code
 
 
-def validate(sir: SIR) -> None:
-    run_optimizer_sir(sir.SerializeToString())
+def sir_to_cpp_backends(
+    sir: SIR,
+    backends: List[str],
+    verbose: bool = False,
+    groups: List = [],
+    cache: Optional[CodegenCache] = None,
+) -> Dict[str, str]:
+    """
+    Generates code for every backend, but runs Dawn's optimizer only once (instead
+    of once per backend as `sir_to_cpp`). If the code of every backend is cached,
+    the optimizer isn't run at all.
+    """
+
+    codes: Dict[str, str] = {}
+    keys: Dict[str, str] = {}
+    if cache is not None:
+        for backend in backends:
+            keys[backend] = cache.key(sir, backend, groups)
+            with phase("CodegenCache.load", backend=backend):
+                code = cache.load(keys[backend])
+            if code is not None:
+                codes[backend] = code
+
+    missing = [backend for backend in backends if backend not in codes]
+    if missing:
+        iir = sir_to_iir(sir, verbose=verbose, groups=groups)
+        for backend in missing:
+            codes[backend] = iir_to_cpp(iir, backend=backend)
+            if cache is not None:
+                cache.store(keys[backend], codes[backend])
+
+    return {backend: codes[backend] for backend in backends}
+
+
+def sir_to_iir(sir: SIR, verbose: bool = False, groups: List = []) -> Dict[str, str]:
+    # the optimized stencil instantiations (serialized), see `iir_to_cpp`
+    from dawn4py import set_verbosity, LogLevel
+    from dawn4py._dawn4py import run_optimizer_sir
+
+    if verbose:
+        set_verbosity(LogLevel.All)
+    with phase("dawn4py.run_optimizer_sir"):
+        return run_optimizer_sir(sir.SerializeToString(), groups=groups)
+
+
+def iir_to_cpp(iir: Dict[str, str], backend: str = default_backend) -> str:
+    from dawn4py import CodeGenBackend
+    from dawn4py._dawn4py import run_codegen
+
+    with phase("dawn4py.run_codegen", backend=backend):
+        return run_codegen(iir, backend=getattr(CodeGenBackend, backend_map[backend]))
+
+
+def validate(sir: SIR, groups: Optional[List] = None) -> Dict[str, str]:
+    # returns the result of the optimizer, so it can be reused (see `iir_to_cpp`),
+    # runs all of Dawn's default pass groups unless `groups` are given (e.g., the
+    # empty list, which `sir_to_iir` uses by default)
+    from dawn4py._dawn4py import run_optimizer_sir
+
+    if groups is None:
+        return run_optimizer_sir(sir.SerializeToString())
+    return run_optimizer_sir(sir.SerializeToString(), groups=groups)
 
 
 def transpile(
     in_path: str,
-    out_sir_file: Optional[TextIOBase],
-    out_gencode_file: Optional[TextIOBase],
+    out_sir_file: Optional[IO],
+    out_gencode_file: Union[IO, Dict[str, IO], None],
     backend: str = default_backend,
     verbose: bool = False,
-) -> None:
+    stencil_cache: Optional[StencilCache] = None,
+    codegen_cache: Optional[CodegenCache] = None,
+    jobs: Optional[int] = 1,
+    sir_format: str = default_sir_format,
+    passes: Sequence[Pass] = (),
+) -> int:
+    """
+    Returns the number of stencils in `in_path`.
+
+    `out_gencode_file` can also map backends to files (`backend` is ignored then),
+    the SIR is optimized only once for all of them (see `sir_to_cpp_backends`).
+
+    `out_sir_file` has to be a binary file for binary formats of the SIR. With
+    streaming formats, every stencil is written as soon as it's translated (so
+    without generating code, the whole SIR is never kept in memory).
+    """
+
+    with phase("transpile", filename=in_path):
+        pyast = file_to_pyast(in_path)
+
+        if out_sir_file is not None and sir_format in streaming_sir_formats:
+            stencils = translate_stencils(
+                pyast, cache=stencil_cache, jobs=jobs, passes=passes
+            )
+            if not out_gencode_file:
+                return write_sir_stream(out_sir_file, in_path, stencils, sir_format)
+
+            # the stencils are still written as soon as they're translated, but
+            # kept for generating code
+            sir_stencils: List[Stencil] = []
+
+            def keep(stencils: Iterable[Stencil]) -> Iterator[Stencil]:
+                for stencil in stencils:
+                    sir_stencils.append(stencil)
+                    yield stencil
+
+            write_sir_stream(out_sir_file, in_path, keep(stencils), sir_format)
+            with phase("make_sir", filename=in_path):
+                sir = make_sir(in_path, GridType.Value("Unstructured"), sir_stencils)
+
+        else:
+            sir = pyast_to_sir(
+                pyast, filename=in_path, cache=stencil_cache, jobs=jobs, passes=passes
+            )
+
+            if out_sir_file is not None:
+                with phase("write_sir", format=sir_format):
+                    write_sir(out_sir_file, sir, sir_format)
+        # there is nothing to generate for files without stencils
+        if isinstance(out_gencode_file, dict) and sir.stencils:
+            codes = generate_code(
+                sir, list(out_gencode_file), verbose=verbose, cache=codegen_cache
+            )
+            for backend, code in codes.items():
+                out_gencode_file[backend].write(code)
+        elif out_gencode_file is not None and sir.stencils:
+            out_gencode_file.write(
+                sir_to_cpp(sir, backend=backend, verbose=verbose, cache=codegen_cache)
+            )
+
+    return len(sir.stencils)
+
+
+def transpile_per_stencil(
+    in_path: str,
+    out_sir_file: Optional[IO],
+    backends: List[str],
+    verbose: bool = False,
+    stencil_cache: Optional[StencilCache] = None,
+    codegen_cache: Optional[CodegenCache] = None,
+    jobs: Optional[int] = 1,
+    sir_format: str = default_sir_format,
+    passes: Sequence[Pass] = (),
+) -> Dict[str, Dict[str, str]]:
+    """
+    Like `transpile`, but the code of every stencil is generated separately (from
+    a SIR with only this stencil), so it doesn't change if other stencils of the
+    file change. Returns the code per stencil & backend.
+    """
+
+    with phase("transpile", filename=in_path):
+        pyast = file_to_pyast(in_path)
+        sir = pyast_to_sir(
+            pyast, filename=in_path, cache=stencil_cache, jobs=jobs, passes=passes
+        )
+
+        if out_sir_file is not None:
+            with phase("write_sir", format=sir_format):
+                write_sir(out_sir_file, sir, sir_format)
+
+        return {
+            name: generate_code(
+                stencil_sir, backends, verbose=verbose, cache=codegen_cache
+            )
+            for name, stencil_sir in split_sir(sir).items()
+        }
 
-    with open(in_path, "r") as in_file:
-        in_str = in_file.read()
 
-    pyast = str_to_pyast(in_str, filename=in_path)
-    sir = pyast_to_sir(pyast, filename=in_path)
+def file_to_pyast(in_path: str) -> List[ast.FunctionDef]:
+    with phase("read", filename=in_path):
+        with open(in_path, "r") as in_file:
+            in_str = in_file.read()
+    return str_to_pyast(in_str, filename=in_path)
 
-    if out_sir_file is not None:
-        out_sir_file.write(sir_to_json(sir))
-    if out_gencode_file is not None:
-        out_gencode_file.write(sir_to_cpp(sir, backend=backend, verbose=verbose))
+
+def split_sir(sir: SIR) -> Dict[str, SIR]:
+    # a SIR per stencil (with the same attributes otherwise)
+    return {
+        stencil.name: make_sir(sir.filename, sir.gridType, [stencil])
+        for stencil in sir.stencils
+    }
+
+
+def generate_code(
+    sir: SIR,
+    backends: List[str],
+    verbose: bool = False,
+    cache: Optional[CodegenCache] = None,
+) -> Dict[str, str]:
+    # a single backend is generated as before (see `sir_to_cpp_backends`)
+    if len(backends) == 1:
+        return {
+            backends[0]: sir_to_cpp(
+                sir, backend=backends[0], verbose=verbose, cache=cache
+            )
+        }
+    return sir_to_cpp_backends(sir, backends, verbose=verbose, cache=cache)
@@ -1,4 +1,10 @@
-from dusk.transpile import callable_to_pyast, pyast_to_sir, validate
+from dusk.transpile import (
+    callable_to_pyast,
+    pyast_to_sir,
+    validate,
+    sir_to_cpp_backends,
+)
+from dusk.passes import optimization_passes
 
 from laplacian_fd import laplacian_fd
 from laplacian_fvm import laplacian_fvm
@@ -9,3 +15,10 @@ def test_examples():
     validate(pyast_to_sir(callable_to_pyast(laplacian_fd)))
     validate(pyast_to_sir(callable_to_pyast(laplacian_fvm)))
     validate(pyast_to_sir(callable_to_pyast(interpolation_sph)))
+
+
+def test_optimized_examples():
+    # Dawn has to accept what the passes generate (e.g., local variables)
+    for example in (laplacian_fd, laplacian_fvm, interpolation_sph):
+        sir = pyast_to_sir(callable_to_pyast(example), passes=optimization_passes)
+        sir_to_cpp_backends(sir, ["ico-naive", "ico-cuda"])
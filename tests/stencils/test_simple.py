@@ -7,6 +7,7 @@ def test_simple():
     validate(pyast_to_sir(callable_to_pyast(compound_assignment)))
     validate(pyast_to_sir(callable_to_pyast(power_operator)))
     validate(pyast_to_sir(callable_to_pyast(vertical_iteration_variable)))
+    validate(pyast_to_sir(callable_to_pyast(long_expressions)))
 
 
 @stencil
@@ -116,3 +117,23 @@ def power_operator(
 
         # TODO: uncomment when bug fixed in dawn
         # a = min_over(Edge > Cell, pow(d, 5), weights=[b ** 3, -1])
+
+
+@stencil
+def long_expressions(a: Field[Cell], b: Field[Cell], c: Field[Cell]):
+    with levels_upward:
+        # polynomial fit
+        a = (
+            0.5
+            + 1.5 * b
+            - 2.5 * b * b
+            + 3.5 * b * b * b
+            - 4.5 * b * b * b * b
+            + 5.5 * b * b * b * b * b
+            - 6.5 * b * b * b * b * b * b
+            + 7.5 * b * b * b * b * b * b * b
+        )
+        # unrolled sum
+        c = b + b + b + b + b + b + b + b + b + b + b + b + b + b + b + b - a - a
+        if a < b and b < c and c < 1.0 and 0.0 < a or a == b or b == c or c == a:
+            a = b / c / 2.0 / 3.0 / 4.0
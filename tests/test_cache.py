@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from dusk.transpile import str_to_pyast, pyast_to_sir, sir_to_cpp
+from dusk.cache import StencilCache, CodegenCache, DiskCache
+
+
+source = """
+from dusk.script import *
+
+@stencil
+def first(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = b + 1.0
+
+@stencil
+def second(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = b * 2.0
+"""
+
+
+def test_stencil_cache(tmp_path):
+    cache = StencilCache(str(tmp_path))
+    sir = pyast_to_sir(str_to_pyast(source), cache=cache)
+    assert cache.stats() == {"hits": 0, "misses": 2}
+
+    # source locations aren't part of the key
+    cache = StencilCache(str(tmp_path))
+    assert pyast_to_sir(str_to_pyast("\n\n" + source), cache=cache) == sir
+    assert cache.stats() == {"hits": 2, "misses": 0}
+
+    # only the changed stencil is translated again
+    cache = StencilCache(str(tmp_path))
+    changed = pyast_to_sir(str_to_pyast(source.replace("2.0", "3.0")), cache=cache)
+    assert cache.stats() == {"hits": 1, "misses": 1}
+    assert changed.stencils[0] == sir.stencils[0]
+    assert changed.stencils[1] != sir.stencils[1]
+
+    # corrupted entries are ignored
+    key = cache.key(str_to_pyast(source)[0])
+    with open(cache.path(key), "wb") as file:
+        file.write(b"\xff\xff\xff")
+    assert cache.load(key) is None
+    assert not os.path.exists(cache.path(key))
+
+
+def test_codegen_cache(tmp_path):
+    sir = pyast_to_sir(str_to_pyast(source))
+
+    cache = CodegenCache(str(tmp_path))
+    code = sir_to_cpp(sir, backend="ico-naive", cache=cache)
+    assert sir_to_cpp(sir, backend="ico-naive", cache=cache) == code
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+    sir_to_cpp(sir, backend="ico-cuda", cache=cache)
+    sir_to_cpp(pyast_to_sir(str_to_pyast(source), "other.py"), cache=cache)
+    assert cache.stats() == {"hits": 1, "misses": 3}
+
+
+def test_disk_cache_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    os.utime(cache.path("a"), (0, 0))
+    os.utime(cache.path("b"), (1, 1))
+    # the least recently used entry is evicted
+    cache.put("c", b"cccc")
+    assert cache.get("a") is None
+    assert cache.get("b") == b"bbbb"
+    assert cache.get("c") == b"cccc"
+
+
+def test_disk_cache_overwrite(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size=16)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    # overwriting an entry doesn't count its old size (so it doesn't evict early)
+    cache.put("b", b"bbbbbb")
+    cache.put("b", b"bb")
+    assert cache.size == 6
+    cache.evict = lambda: pytest.fail("evicted without exceeding the size")
+    cache.put("b", b"bbbbbbbbbb")
+    assert cache.size == 14
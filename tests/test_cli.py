@@ -0,0 +1,141 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from dusk import cli
+
+
+stencil = """
+from dusk.script import *
+
+@stencil
+def {name}(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = {value}
+"""
+
+
+def run(monkeypatch, *args):
+    # never forwards to a running server
+    monkeypatch.setenv("DUSK_SOCKET", "/nonexistent/dusk.sock")
+    monkeypatch.setattr(sys, "argv", ["dusk", *args])
+    cli.main()
+
+
+def test_batch(tmp_path, monkeypatch, capsys):
+    (tmp_path / "in" / "sub").mkdir(parents=True)
+    (tmp_path / "in" / "first.py").write_text(stencil.format(name="first", value="b"))
+    (tmp_path / "in" / "sub" / "second.py").write_text(
+        stencil.format(name="second", value="2 * b")
+    )
+    (tmp_path / "in" / "none.py").write_text("x = 1\n")
+    (tmp_path / "bad.py").write_text(stencil.format(name="bad", value="c"))
+
+    out_dir = tmp_path / "out"
+    run(monkeypatch, str(tmp_path / "in"), "--out-dir", str(out_dir), "--dump-sir")
+    assert (out_dir / "first_ico-naive.cpp").exists()
+    assert (out_dir / "sub" / "second_ico-naive.cpp").exists()
+    assert (out_dir / "sub" / "second.json").exists()
+    assert not (out_dir / "none_ico-naive.cpp").exists()
+    assert "3 files: 2 ok, 0 failed, 1 skipped" in capsys.readouterr().err
+
+    # failures are reported per file & don't stop the other files
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit):
+        run(monkeypatch, str(tmp_path / "*.py"), str(tmp_path / "in" / "first.py"))
+    err = capsys.readouterr().err
+    assert f"FAILED {tmp_path / 'bad.py'}" in err
+    assert "2 files: 1 ok, 1 failed, 0 skipped" in err
+    assert (tmp_path / "first_ico-naive.cpp").exists()
+    assert not (tmp_path / "bad_ico-naive.cpp").exists()
+
+
+def test_profiling_without_workers(tmp_path, monkeypatch, capsys):
+    # the workers' statistics would be missing
+    (tmp_path / "first.py").write_text(stencil.format(name="first", value="b"))
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit):
+        run(monkeypatch, "first.py", "--profile-matchers", "-j", "2")
+    assert "only supported with -j 1" in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        run(monkeypatch, "first.py", "--profile", "trace.json", "-j", "2")
+    assert "only supported with -j 1" in capsys.readouterr().err
+
+    run(monkeypatch, "first.py", "--profile-matchers", "--profile", "trace.json")
+    assert "Grammar.stencil" in capsys.readouterr().err
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    assert {"stencil": "first"} in [event.get("args") for event in trace["traceEvents"]]
+
+
+def test_light_imports():
+    # forwarding to a server shouldn't need to load dawn4py or the grammar
+    code = (
+        "import sys, dusk.cli, dusk.front, dusk.server; "
+        "print(' '.join(m for m in sys.modules if 'dawn4py' in m or 'grammar' in m))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_sir_format(tmp_path, monkeypatch):
+    (tmp_path / "first.py").write_text(stencil.format(name="first", value="b"))
+    monkeypatch.chdir(tmp_path)
+    run(monkeypatch, "first.py", "--dump-sir", "--sir-format", "binary")
+    assert (tmp_path / "first.pb").read_bytes()
+
+
+@pytest.mark.parametrize("sir_format", ["jsonl", "length-prefixed"])
+def test_streamed_sir(tmp_path, monkeypatch, capsys, sir_format):
+    from dusk.transpile import read_sir_stream
+
+    (tmp_path / "first.py").write_text(stencil.format(name="first", value="b"))
+    monkeypatch.chdir(tmp_path)
+    run(monkeypatch, "first.py", "--dump-sir", "--sir-format", sir_format)
+    sir_file = tmp_path / ("first.jsonl" if sir_format == "jsonl" else "first.pbs")
+    mode = "r" if sir_format == "jsonl" else "rb"
+    with open(sir_file, mode) as file:
+        assert [s.name for s in read_sir_stream(file, sir_format).stencils] == ["first"]
+
+    # a failed file keeps its previous SIR (& no partially written one)
+    contents = sir_file.read_bytes()
+    (tmp_path / "first.py").write_text(stencil.format(name="first", value="c"))
+    with pytest.raises(SystemExit):
+        run(monkeypatch, "first.py", "--dump-sir", "--sir-format", sir_format)
+    assert "FAILED" in capsys.readouterr().err
+    assert sir_file.read_bytes() == contents
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_multiple_backends(tmp_path, monkeypatch):
+    (tmp_path / "first.py").write_text(stencil.format(name="first", value="b"))
+    monkeypatch.chdir(tmp_path)
+    run(monkeypatch, "first.py", "-b", "ico-naive,ico-cuda")
+    assert (tmp_path / "first_ico-naive.cpp").exists()
+    assert (tmp_path / "first_ico-cuda.cpp").exists()
+
+
+def test_per_stencil(tmp_path, monkeypatch):
+    source = stencil.format(name="first", value="b") + stencil.format(
+        name="second", value="2 * b"
+    )
+    (tmp_path / "both.py").write_text(source)
+    monkeypatch.chdir(tmp_path)
+    run(monkeypatch, "both.py", "--per-stencil", "-b", "ico-naive,ico-cuda")
+    first = tmp_path / "both" / "first_ico-naive.cpp"
+    second = tmp_path / "both" / "second_ico-cuda.cpp"
+    assert first.exists() and second.exists()
+
+    # unchanged stencils aren't written again
+    os.utime(first, (0, 0))
+    (tmp_path / "both.py").write_text(
+        source.replace("a = 2 * b", "a = 3 * b")
+        + stencil.format(name="third", value="b")
+    )
+    run(monkeypatch, "both.py", "--per-stencil", "-b", "ico-naive,ico-cuda")
+    assert os.stat(first).st_mtime == 0
+    assert (tmp_path / "both" / "third_ico-naive.cpp").exists()
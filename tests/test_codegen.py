@@ -0,0 +1,60 @@
+import dawn4py._dawn4py
+
+from dusk.transpile import (
+    str_to_pyast,
+    pyast_to_sir,
+    sir_to_cpp_backends,
+    sir_to_iir,
+    validate,
+)
+from dusk.cache import CodegenCache
+
+
+source = """
+from dusk.script import *
+
+@stencil
+def first(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = b + 1.0
+"""
+
+
+def test_multiple_backends(tmp_path, monkeypatch):
+    runs = []
+    run_optimizer_sir = dawn4py._dawn4py.run_optimizer_sir
+    monkeypatch.setattr(
+        dawn4py._dawn4py,
+        "run_optimizer_sir",
+        lambda *args, **kwargs: runs.append(1) or run_optimizer_sir(*args, **kwargs),
+    )
+
+    sir = pyast_to_sir(str_to_pyast(source))
+    cache = CodegenCache(str(tmp_path))
+    codes = sir_to_cpp_backends(sir, ["ico-naive", "ico-cuda"], cache=cache)
+    assert list(codes) == ["ico-naive", "ico-cuda"]
+    assert codes["ico-naive"] != codes["ico-cuda"]
+    # the optimizer only runs once for all backends
+    assert len(runs) == 1
+
+    # & not at all if all backends are cached
+    assert sir_to_cpp_backends(sir, ["ico-cuda", "ico-naive"], cache=cache) == codes
+    assert len(runs) == 1
+
+
+def test_validate_groups(monkeypatch):
+    groups = []
+    monkeypatch.setattr(
+        dawn4py._dawn4py,
+        "run_optimizer_sir",
+        lambda sir, **kwargs: groups.append(kwargs.get("groups", "default")) or {},
+    )
+
+    sir = pyast_to_sir(str_to_pyast(source))
+    # validates with all of Dawn's default pass groups
+    validate(sir)
+    assert groups == ["default"]
+    # unless it's asked for the pass groups which code is generated with
+    validate(sir, groups=[])
+    sir_to_iir(sir)
+    assert groups[1:] == [[], []]
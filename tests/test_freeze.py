@@ -0,0 +1,35 @@
+import ast
+import os
+
+from dusk.freeze import grammar_matchers, freeze, load, store
+
+
+def test_grammar_is_frozen(tmp_path):
+    path = str(tmp_path / "frozen_matchers.bin")
+    store(freeze(grammar_matchers()), path)
+    frozen = load(path)
+
+    stale = [
+        matcher.name
+        for matcher in grammar_matchers()
+        if matcher.name not in frozen
+        or frozen[matcher.name].functions(matcher.matcher, matcher.frame) is None
+    ]
+    assert not stale, "Some of the grammar's matchers can't be frozen"
+
+
+def test_frozen_matchers_match_like_compiled_matchers(tmp_path):
+    path = str(tmp_path / "frozen_matchers.bin")
+    store(freeze(grammar_matchers()), path)
+    frozen = load(path)
+
+    example = os.path.join(os.path.dirname(__file__), "examples", "laplacian_fvm.py")
+    with open(example) as file:
+        nodes = list(ast.walk(ast.parse(file.read())))
+    for matcher in grammar_matchers():
+        test, _ = frozen[matcher.name].functions(matcher.matcher, matcher.frame)
+        for node in nodes:
+            frozen_captures = matcher.frame.new() if matcher.frame else {}
+            captures = matcher.frame.new() if matcher.frame else {}
+            assert test(node, frozen_captures) == matcher.test(node, captures)
+            assert frozen_captures == captures
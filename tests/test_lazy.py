@@ -0,0 +1,63 @@
+import ast
+import importlib.util
+import os
+
+from dusk.transpile import callable_to_pyast, source_to_pyast
+from dusk.lazy import LazyStencil
+from inspect import getsource
+
+
+source = """
+from dusk.script import *
+
+
+@stencil
+def lazy(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = {value}
+"""
+
+
+def load(path):
+    spec = importlib.util.spec_from_file_location("lazy_stencil", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.lazy
+
+
+def test_lazy_stencil(tmp_path):
+    path = tmp_path / "lazy_stencil.py"
+    path.write_text(source.format(value="b"))
+    stencil = load(path)
+    assert isinstance(stencil, LazyStencil)
+    assert not stencil.results
+
+    sir = stencil.sir
+    assert stencil.sir is sir
+    assert stencil.to_json() == stencil.to_json()
+    assert stencil.generate("ico-cuda") is stencil.generate("ico-cuda")
+    assert callable_to_pyast(stencil) == [stencil.pyast]
+
+    # touching the file doesn't invalidate the results
+    os.utime(path, (1, 1))
+    assert stencil.sir is sir
+
+    # changing it does
+    path.write_text(source.format(value="2.0 * b"))
+    os.utime(path, (2, 2))
+    assert stencil.sir is not sir
+    assert stencil.sir != sir
+
+
+def test_redefined_stencil_ast(tmp_path):
+    # a changed stencil is looked up again with the same line numbers as before
+    path = tmp_path / "lazy_stencil.py"
+    path.write_text(source.format(value="b"))
+    stencil = load(path)
+    expected = source_to_pyast(getsource(stencil.__wrapped__))
+
+    path.write_text("\n\n" + source.format(value="b"))
+    os.utime(path, (1, 1))
+    assert ast.dump(stencil.pyast, include_attributes=True) == ast.dump(
+        expected, include_attributes=True
+    )
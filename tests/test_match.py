@@ -0,0 +1,157 @@
+from ast import *
+
+import pytest
+
+from dusk.match import (
+    match,
+    compile_matcher,
+    first_types,
+    TypeIndex,
+    MatchMemo,
+    CaptureFrame,
+    capture_names,
+    Ignore as _,
+    Optional,
+    OneOf,
+    Capture,
+    Repeat,
+    FixedList,
+    DuskSyntaxError,
+)
+from dusk.grammar import transform
+
+
+matchers = [
+    Name(id=Capture(str).to("name"), ctx=OneOf(Load, Store)),
+    BinOp(
+        left=Capture(expr).to("left"),
+        op=Capture(OneOf(Add, Sub)).to("op"),
+        right=Constant(value=Capture(int).to("value"), kind=None),
+    ),
+    Compare(
+        left=OneOf(
+            Name(id=Capture(str).append("names"), ctx=Load),
+            BinOp(
+                left=Name(id=Capture("Origin").to("center"), ctx=Load),
+                op=Add,
+                right=Name(id=Capture(str).append("names"), ctx=Load),
+            ),
+        ),
+        ops=Repeat(Gt),
+        comparators=Repeat(Name(id=Capture(str).append("names"), ctx=Load)),
+    ),
+    Call(
+        func=Name(id="f", ctx=Load),
+        args=FixedList(Capture(expr).to("first"), _),
+        keywords=Repeat(keyword(arg=Capture(str).append("keys"), value=_)),
+    ),
+    Subscript(value=_, slice=Optional(Capture(Index).to("index")), ctx=_),
+    Constant(value=OneOf(1, "one", None), kind=None),
+]
+
+sources = [
+    "x",
+    "x + 1",
+    "x - y",
+    "x * 2",
+    "Edge > Cell > Vertex",
+    "Origin + Edge > Cell",
+    "Other + Edge > Cell",
+    "f(a, b, c=1, d=2)",
+    "f(a)",
+    "g(a, b)",
+    "x[1]",
+    "1",
+    "'one'",
+    "2",
+]
+
+
+def outcome(matcher, node):
+    captures = {}
+    try:
+        match(matcher, node, capturer=captures)
+        return True, captures, None
+    except DuskSyntaxError as e:
+        return False, captures, (e.text, e.node, str(e.loc))
+
+
+@pytest.mark.parametrize("matcher", matchers)
+@pytest.mark.parametrize("source", sources)
+def test_compiled_matcher_is_equivalent(matcher, source):
+    node = parse(source, mode="eval").body
+    compiled = compile_matcher(matcher)
+    assert outcome(compiled, node) == outcome(matcher, node)
+    assert compiled.does_match(node) == outcome(matcher, node)[0]
+
+
+def test_type_index():
+    recognizers = [Constant, expr, BinOp(left=_, op=Add, right=_), Repeat(_), 1, _]
+    index = TypeIndex(
+        [(first_types(recognizer), i) for i, recognizer in enumerate(recognizers)]
+    )
+    assert index[BinOp] == (1, 2, 4, 5)
+    assert index[Constant] == (0, 1, 4, 5)
+    assert index[list] == (3, 4, 5)
+    assert index[str] == (4, 5)
+
+
+def test_match_memo():
+    memo = MatchMemo()
+    matcher = compile_matcher(matchers[0])
+    node = parse("x", mode="eval").body
+
+    captures = memo.captures(matcher, node)
+    assert captures == {"name": "x"}
+    assert memo.captures(matcher, node) is captures
+    assert memo.captures(matcher, parse("1", mode="eval").body) is None
+
+
+def test_capture_frame():
+    matcher = matchers[2]
+    assert capture_names(matcher) == ["names", "center"]
+
+    default = []
+    layout = CaptureFrame(["center", "names"], [None, default])
+    compiled = compile_matcher(matcher, frame=layout)
+
+    frame = layout.new()
+    assert compiled.test(parse("Origin + Edge > Cell", mode="eval").body, frame)
+    assert frame == ["Origin", ["Edge", "Cell"]]
+
+    frame = layout.new()
+    assert compiled.test(parse("Edge > Cell", mode="eval").body, frame)
+    assert frame == [None, ["Edge", "Cell"]]
+    assert default == []
+
+
+class Rules:
+    def __init__(self):
+        self.memo = MatchMemo()
+        self.frames = {}
+
+    @transform(
+        BinOp(left=Capture(expr).to("left"), op=Add, right=Capture(expr).to("right"))
+    )
+    def add(self, left, right, depth=0):
+        # applies itself again while its captures are still in use
+        return [
+            self.add(side, depth=depth + 1) if isinstance(side, BinOp) else side.id
+            for side in (left, right)
+        ] + [depth]
+
+    @transform(Name(id=Capture(str).to("name"), ctx=_))
+    def prefixed(self, prefix, name, suffix=""):
+        return prefix + name + suffix
+
+
+def test_transform():
+    rules = Rules()
+    node = parse("(a + b) + (c + d)", mode="eval").body
+    assert rules.add(node) == [["a", "b", 1], ["c", "d", 1], 0]
+    assert rules.add(node) == [["a", "b", 1], ["c", "d", 1], 0]
+
+    name = parse("x", mode="eval").body
+    assert rules.prefixed(name, "p_", suffix="_s") == "p_x_s"
+    # captures are passed by name, if they can't be passed positionally
+    assert rules.prefixed(name, prefix="p_") == "p_x"
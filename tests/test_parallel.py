@@ -0,0 +1,60 @@
+import pickle
+
+import pytest
+
+from dusk.transpile import str_to_pyast, pyast_to_sir
+from dusk.errors import DuskSyntaxError, DuskStencilErrors
+
+
+source = """
+from dusk.script import *
+
+@stencil
+def first(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = b + 1.0
+
+@stencil
+def second(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = c * 2.0
+
+@stencil
+def third(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = b * 3.0
+
+@stencil
+def fourth(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = b @ 4.0
+"""
+
+
+def test_parallel_translation():
+    stencils = [
+        stencil
+        for stencil in str_to_pyast(source)
+        if stencil.name in ("first", "third")
+    ]
+    assert pyast_to_sir(stencils, jobs=2) == pyast_to_sir(stencils)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_isolated_errors(jobs):
+    with pytest.raises(DuskStencilErrors) as info:
+        pyast_to_sir(str_to_pyast(source), jobs=jobs)
+
+    assert [stencil for stencil, _ in info.value.errors] == ["second", "fourth"]
+    assert all(isinstance(error, DuskSyntaxError) for _, error in info.value.errors)
+    assert "In stencil 'fourth'" in str(info.value)
+
+    # a single error is raised as is
+    with pytest.raises(DuskSyntaxError):
+        pyast_to_sir(str_to_pyast(source)[:2], jobs=jobs)
+
+
+def test_pickle_errors():
+    error = DuskSyntaxError("text", str_to_pyast(source)[0])
+    copy = pickle.loads(pickle.dumps(error))
+    assert (copy.text, str(copy.loc)) == (error.text, str(error.loc))
@@ -0,0 +1,520 @@
+import math
+import operator
+from zlib import crc32
+
+import pytest
+
+from dusk.script import *
+from dusk.grammar import Grammar
+from dusk.transpile import callable_to_pyast, pyast_to_sir, sir_to_cpp_backends
+from dusk.passes import run_passes, optimization_passes
+from dusk.passes.folding import fold_constants
+from dusk.passes.subexpressions import eliminate_common_subexpressions
+from dusk.passes.reductions import fuse_reductions
+from dusk.passes.temporaries import (
+    inline_sparse_temporaries,
+    eliminate_dead_temporaries,
+    demote_temporaries,
+)
+from dusk.passes.traversal import statements, sub_messages
+from dawn4py.serialization.AST import BuiltinType, LocationType, Stmt
+
+
+def translate(stencil, *passes):
+    # only runs the given passes
+    [pyast] = callable_to_pyast(stencil)
+    return run_passes(Grammar().stencil(pyast), list(passes))
+
+
+def kinds(sir_stencil):
+    return [stmt.WhichOneof("stmt") for stmt in statements(sir_stencil.ast)]
+
+
+def assigned(sir_stencil):
+    # the right hand sides of all assignments (in order)
+    return [
+        stmt.expr_stmt.expr.assignment_expr.right
+        for stmt in statements(sir_stencil.ast)
+        if stmt.WhichOneof("stmt") == "expr_stmt"
+    ]
+
+
+def literal(expr):
+    assert expr.WhichOneof("expr") == "literal_access_expr"
+    literal = expr.literal_access_expr
+    return literal.value, BuiltinType.TypeID.Name(literal.type.type_id)
+
+
+class Evaluator:
+    """
+    A reference interpreter for the SIR of the stencils in this file, so passes
+    can be checked numerically (on a small, made up mesh).
+
+    Like in Dawn, every statement of a vertical region is applied to all points
+    of its location type before the next statement. Fields start with pseudo
+    random values, `evaluate` returns the values written to non-temporary fields.
+    """
+
+    levels = 4
+    sizes = {"Edge": 6, "Cell": 4, "Vertex": 5}
+    # the number of neighbors of a location of the first type of the second type
+    valences = {
+        ("Edge", "Cell"): 2,
+        ("Edge", "Vertex"): 2,
+        ("Cell", "Edge"): 3,
+        ("Cell", "Vertex"): 3,
+        ("Vertex", "Edge"): 4,
+        ("Vertex", "Cell"): 4,
+    }
+    binary_operators = {
+        "+": operator.add,
+        "-": operator.sub,
+        "*": operator.mul,
+        "/": operator.truediv,
+        "<": operator.lt,
+        ">": operator.gt,
+        "<=": operator.le,
+        ">=": operator.ge,
+        "==": operator.eq,
+        "!=": operator.ne,
+        "&&": lambda left, right: left and right,
+        "||": lambda left, right: left or right,
+    }
+    reductions = {"+": operator.add, "*": operator.mul, "min": min, "max": max}
+    functions = {"max": max, "min": min, "fabs": abs}
+
+    def __init__(self, sir_stencil):
+        self.chains = {
+            field.name: [
+                LocationType.Name(location)
+                for location in field.field_dimensions.unstructured_horizontal_dimension.iter_space.chain
+            ]
+            for field in sir_stencil.fields
+        }
+        self.temporaries = {
+            field.name for field in sir_stencil.fields if field.is_temporary
+        }
+        self.values = {name: {} for name in self.chains}
+        self.written = set()
+        # variables which are declared without a location have a default
+        self.variables = {}
+        self.defaults = {}
+        self.stencil = sir_stencil
+
+    def evaluate(self):
+        for stmt in self.stencil.ast.root.block_stmt.statements:
+            region = stmt.vertical_region_decl_stmt.vertical_region
+            levels = range(
+                region.interval.lower_offset,
+                self.levels + region.interval.upper_offset,
+            )
+            for k in levels if region.loop_order == 0 else reversed(levels):
+                for stmt in region.ast.root.block_stmt.statements:
+                    location = self.location(stmt)
+                    points = range(self.sizes[location]) if location else [None]
+                    for point in points:
+                        self.execute(stmt, point, k, None)
+        return {
+            (name, *key): value
+            for name, values in self.values.items()
+            if name not in self.temporaries
+            for key, value in values.items()
+            if (name, key) in self.written
+        }
+
+    def neighbors(self, point, chain, include_center=False):
+        points = [point]
+        for source, target in zip(chain, chain[1:]):
+            valence = self.valences[source, target]
+            points = [
+                (point * 7 + i * 3 + crc32(target.encode())) % self.sizes[target]
+                for point in points
+                for i in range(valence)
+            ]
+        return [point] + points if include_center else points
+
+    def location(self, message):
+        # the location type of the first field accessed at the point itself
+        if isinstance(message, Stmt):
+            kind = message.WhichOneof("stmt")
+        else:
+            kind = message.WhichOneof("expr")
+        if kind == "loop_stmt":
+            chain = message.loop_stmt.loop_descriptor.loop_descriptor_chain.chain
+            return LocationType.Name(chain[0])
+        if kind == "reduction_over_neighbor_expr":
+            chain = message.reduction_over_neighbor_expr.iter_space.chain
+            return LocationType.Name(chain[0])
+        if kind == "field_access_expr":
+            return self.chains[message.field_access_expr.name][0]
+        for child in sub_messages(message):
+            location = self.location(child)
+            if location is not None:
+                return location
+        return None
+
+    def execute(self, stmt, point, k, neighbor):
+        kind = stmt.WhichOneof("stmt")
+        if kind == "block_stmt":
+            for nested in stmt.block_stmt.statements:
+                self.execute(nested, point, k, neighbor)
+        elif kind == "expr_stmt":
+            self.expression(stmt.expr_stmt.expr, point, k, neighbor)
+        elif kind == "var_decl_stmt":
+            declaration = stmt.var_decl_stmt
+            value = self.expression(declaration.init_list[0], point, k, neighbor)
+            if point is None:
+                self.variables[declaration.name] = {}
+                self.defaults[declaration.name] = value
+            else:
+                self.variables.setdefault(declaration.name, {})[point] = value
+        elif kind == "if_stmt":
+            if self.expression(
+                stmt.if_stmt.cond_part.expr_stmt.expr, point, k, neighbor
+            ):
+                self.execute(stmt.if_stmt.then_part, point, k, neighbor)
+            elif stmt.if_stmt.HasField("else_part"):
+                self.execute(stmt.if_stmt.else_part, point, k, neighbor)
+        elif kind == "loop_stmt":
+            chain = stmt.loop_stmt.loop_descriptor.loop_descriptor_chain
+            names = [LocationType.Name(location) for location in chain.chain]
+            for neighbor in enumerate(
+                self.neighbors(point, names, chain.include_center)
+            ):
+                for nested in stmt.loop_stmt.statements.statements:
+                    self.execute(nested, point, k, neighbor)
+        else:
+            raise NotImplementedError(kind)
+
+    def key(self, access, point, k, neighbor):
+        k += access.vertical_shift.offset
+        chain = self.chains[access.name]
+        if 1 < len(chain):
+            return point, neighbor[0], k
+        if neighbor is not None and access.unstructured_offset.has_offset:
+            return neighbor[1], k
+        return point, k
+
+    def read(self, name, key):
+        if key not in self.values[name]:
+            seed = crc32(repr((name, key)).encode())
+            self.values[name][key] = seed / 2**31 - 1.0
+        return self.values[name][key]
+
+    def expression(self, expr, point, k, neighbor):
+        kind = expr.WhichOneof("expr")
+        message = getattr(expr, kind)
+        if kind == "literal_access_expr":
+            type_id = BuiltinType.TypeID.Name(message.type.type_id)
+            if type_id == "Boolean":
+                return message.value == "true"
+            return int(message.value) if type_id == "Integer" else float(message.value)
+        elif kind == "field_access_expr":
+            return self.read(message.name, self.key(message, point, k, neighbor))
+        elif kind == "var_access_expr":
+            variables = self.variables[message.name]
+            return variables.get(point, self.defaults.get(message.name))
+        elif kind == "unary_operator":
+            operand = self.expression(message.operand, point, k, neighbor)
+            return {"-": operator.neg, "+": operator.pos, "!": operator.not_}[
+                message.op
+            ](operand)
+        elif kind == "binary_operator":
+            return self.binary_operators[message.op](
+                self.expression(message.left, point, k, neighbor),
+                self.expression(message.right, point, k, neighbor),
+            )
+        elif kind == "ternary_operator":
+            if self.expression(message.cond, point, k, neighbor):
+                return self.expression(message.left, point, k, neighbor)
+            return self.expression(message.right, point, k, neighbor)
+        elif kind == "fun_call_expr":
+            name = message.callee.split("::")[-1]
+            function = self.functions.get(name) or getattr(math, name)
+            return function(
+                *(self.expression(arg, point, k, neighbor) for arg in message.arguments)
+            )
+        elif kind == "reduction_over_neighbor_expr":
+            chain = [
+                LocationType.Name(location) for location in message.iter_space.chain
+            ]
+            reduce = self.reductions[message.op]
+            value = self.expression(message.init, point, k, neighbor)
+            for j, neighbor_ in enumerate(
+                self.neighbors(point, chain, message.iter_space.include_center)
+            ):
+                term = self.expression(message.rhs, point, k, (j, neighbor_))
+                if message.weights:
+                    term *= self.expression(message.weights[j], point, k, neighbor)
+                value = reduce(value, term)
+            return value
+        elif kind == "assignment_expr":
+            value = self.expression(message.right, point, k, neighbor)
+            left = message.left
+            if message.op != "=":
+                current = self.expression(left, point, k, neighbor)
+                value = self.binary_operators[message.op[:-1]](current, value)
+            if left.WhichOneof("expr") == "var_access_expr":
+                self.variables[left.var_access_expr.name][point] = value
+            else:
+                access = left.field_access_expr
+                key = self.key(access, point, k, neighbor)
+                self.values[access.name][key] = value
+                self.written.add((access.name, key))
+            return value
+        raise NotImplementedError(kind)
+
+
+def evaluate(sir_stencil):
+    return Evaluator(sir_stencil).evaluate()
+
+
+def test_fold_constants():
+    folded, truncated, mixed, not_folded, negated, selected = assigned(
+        translate(constants, fold_constants)
+    )
+    assert literal(folded) == ("7.0", "Double")
+    # like in C++
+    assert literal(truncated) == ("-3", "Integer")
+    assert literal(mixed) == ("3.5", "Double")
+    assert not_folded.binary_operator.op == "/"
+    assert literal(negated) == ("-1", "Integer")
+    assert literal(selected.ternary_operator.cond) == ("true", "Boolean")
+
+
+def test_reduce_pow():
+    sir_stencil = translate(powers, fold_constants)
+    square, cube, root, fifth, kept = assigned(sir_stencil)
+    assert square.binary_operator.op == "*"
+    assert square.binary_operator.left.field_access_expr.name == "b"
+    assert cube.binary_operator.left.binary_operator.op == "*"
+    assert root.fun_call_expr.callee == "gridtools::dawn::math::sqrt"
+    # the base is computed once into a variable
+    [declaration] = [
+        stmt.var_decl_stmt
+        for stmt in statements(sir_stencil.ast)
+        if stmt.WhichOneof("stmt") == "var_decl_stmt"
+    ]
+    assert declaration.init_list[0].fun_call_expr.callee == "gridtools::dawn::math::exp"
+    assert fifth.binary_operator.right.var_access_expr.name == declaration.name
+    assert "math::pow" not in str(fifth)
+    # only evaluated conditionally
+    assert kept.ternary_operator.left.fun_call_expr.callee == (
+        "gridtools::dawn::math::pow"
+    )
+
+
+def test_reduced_powers_compute_the_same():
+    expected = evaluate(translate(powers))
+    assert evaluate(translate(powers, fold_constants)) == pytest.approx(expected)
+
+
+def test_eliminate_common_subexpressions():
+    sir_stencil = translate(repeated, eliminate_common_subexpressions)
+    declarations = [
+        stmt.var_decl_stmt
+        for stmt in statements(sir_stencil.ast)
+        if stmt.WhichOneof("stmt") == "var_decl_stmt"
+    ]
+    # `b * c` (until `b` is written) & `d * 2.0` (invariant in the reduction)
+    assert [declaration.name for declaration in declarations] == ["cse_0", "cse_1"]
+    assert declarations[0].init_list[0].binary_operator.op == "*"
+    product, reduction, written, after_write, condition = assigned(sir_stencil)
+    assert product.var_access_expr.name == "cse_0"
+    assert reduction.binary_operator.right.var_access_expr.name == "cse_0"
+    rhs = reduction.binary_operator.left.reduction_over_neighbor_expr.rhs
+    assert rhs.binary_operator.right.var_access_expr.name == "cse_1"
+    assert written.var_access_expr.name == "cse_0"
+    # `b` was written in between
+    assert after_write.binary_operator.left.field_access_expr.name == "b"
+    # booleans aren't stored in variables
+    assert condition.ternary_operator.cond.binary_operator.op == ">"
+
+
+def test_short_circuit_operands_are_kept():
+    sir_stencil = translate(short_circuit, eliminate_common_subexpressions)
+    # `b / c` is only evaluated if `0.0 < c`
+    assert "var_decl_stmt" not in kinds(sir_stencil)
+
+
+def test_fuse_reductions():
+    sir_stencil = translate(siblings, fuse_reductions)
+    loops = [
+        stmt.loop_stmt
+        for stmt in statements(sir_stencil.ast)
+        if stmt.WhichOneof("stmt") == "loop_stmt"
+    ]
+    assert len(loops) == 1
+    updates = [
+        stmt.expr_stmt.expr.assignment_expr for stmt in loops[0].statements.statements
+    ]
+    assert [update.op for update in updates] == ["+=", "="]
+    assert updates[1].right.fun_call_expr.callee == "gridtools::dawn::math::max"
+
+    # the updates in the loop come first
+    _, _, summed, maximum, _, dependent, weighted = assigned(sir_stencil)
+    assert summed.var_access_expr.name == updates[0].left.var_access_expr.name
+    assert maximum.var_access_expr.name == updates[1].left.var_access_expr.name
+    # `c` is written after the loop
+    assert dependent.WhichOneof("expr") == "reduction_over_neighbor_expr"
+    assert weighted.WhichOneof("expr") == "reduction_over_neighbor_expr"
+
+
+@pytest.mark.parametrize("stencil", ["fusable", "sparse_temporaries"])
+def test_fused_reductions_compute_the_same(stencil):
+    stencil = globals()[stencil]
+    expected = evaluate(translate(stencil))
+    fused = evaluate(translate(stencil, inline_sparse_temporaries, fuse_reductions))
+    assert fused == pytest.approx(expected)
+
+
+def test_inline_sparse_temporaries():
+    sir_stencil = translate(sparse_temporaries, inline_sparse_temporaries)
+    # `twice` is read twice & `shifted` is read on another level
+    assert [field.name for field in sir_stencil.fields if field.is_temporary] == [
+        "twice",
+        "shifted",
+    ]
+    twice_definition, shifted_definition, inlined, _, _ = assigned(sir_stencil)
+    assert twice_definition.binary_operator.op == "-"
+    rhs = inlined.reduction_over_neighbor_expr.rhs
+    assert rhs.binary_operator.left.binary_operator.op == "+"
+
+
+def test_eliminate_dead_temporaries():
+    sir_stencil = translate(temporaries, eliminate_dead_temporaries)
+    temporaries_ = [field.name for field in sir_stencil.fields if field.is_temporary]
+    assert temporaries_ == ["local", "shifted", "read_first"]
+    # the (then empty) `if` & sparse loop are removed as well
+    assert "if_stmt" not in kinds(sir_stencil)
+    assert "loop_stmt" not in kinds(sir_stencil)
+
+
+def test_demote_temporaries():
+    sir_stencil = translate(temporaries, eliminate_dead_temporaries, demote_temporaries)
+    temporaries_ = [field.name for field in sir_stencil.fields if field.is_temporary]
+    assert temporaries_ == ["shifted", "read_first"]
+    declaration = next(
+        stmt.var_decl_stmt
+        for stmt in statements(sir_stencil.ast)
+        if stmt.WhichOneof("stmt") == "var_decl_stmt"
+    )
+    assert declaration.name == "local"
+    reduction, shifted, _, _ = assigned(sir_stencil)
+    rhs = reduction.reduction_over_neighbor_expr.rhs
+    assert rhs.binary_operator.right.var_access_expr.name == "local"
+    assert shifted.var_access_expr.name == "local"
+
+
+def test_demoted_temporaries_compute_the_same():
+    expected = evaluate(translate(temporaries))
+    demoted = evaluate(
+        translate(temporaries, eliminate_dead_temporaries, demote_temporaries)
+    )
+    assert demoted == pytest.approx(expected)
+
+
+def test_optimized_code_generation():
+    # Dawn has to accept what the passes generate, e.g., local variables
+    # & accumulators which are assigned in neighbor loops
+    stencils = [powers, repeated, siblings, fusable, sparse_temporaries, temporaries]
+    for stencil in stencils:
+        sir = pyast_to_sir(callable_to_pyast(stencil), passes=optimization_passes)
+        sir_to_cpp_backends(sir, ["ico-naive", "ico-cuda"])
+
+
+@stencil
+def constants(a: Field[Edge], b: Field[Edge], i: Field[Edge], c: Field[Edge]):
+    with levels_upward:
+        a = 1.0 + 2.0 * 3.0
+        i = -7 / 2
+        a = 7 / 2.0
+        i = 1 / 0
+        i = -1
+        c = a if True and not False else b
+
+
+@stencil
+def powers(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = b**2
+        a = b**3
+        a = abs(b) ** 0.5
+        a = exp(a - b) ** 5
+        a = (a + b) ** 2 if 0.0 < b else b
+
+
+@stencil
+def repeated(
+    a: Field[Edge], b: Field[Edge], c: Field[Edge], d: Field[Edge], e: Field[Cell]
+):
+    with levels_upward:
+        a = b * c
+        a = sum_over(Edge > Cell, e * (d * 2.0)) + c * b
+        b = b * c
+        c = b * c
+        d = 1.0 if a > c else 2.0 if a > c else 3.0
+
+
+@stencil
+def short_circuit(a: Field[Edge], b: Field[Edge], c: Field[Edge]):
+    with levels_upward:
+        a = 1.0 if 0.0 < c and 1.0 < b / c and b / c < 2.0 else 2.0
+        a = 1.0 if c == 0.0 or 1.0 < b / c or b / c < 0.5 else 2.0
+
+
+@stencil
+def siblings(a: Field[Edge], b: Field[Edge], c: Field[Cell], d: Field[Cell]):
+    with levels_upward:
+        a = sum_over(Edge > Cell, c)
+        b = max_over(Edge > Cell, d)
+        c = 1.0
+        a = sum_over(Edge > Cell, c)
+        b = sum_over(Edge > Cell, d, weights=[1.0, -1.0])
+
+
+@stencil
+def fusable(a: Field[Edge, K], b: Field[Edge, K], c: Field[Cell, K], d: Field[Cell, K]):
+    with levels_upward as k:
+        a = sum_over(Edge > Cell, c * d, init=1.0)
+        b = max_over(Edge > Cell, d) - min_over(Edge > Cell, c[k - 1])
+
+
+@stencil
+def sparse_temporaries(
+    a: Field[Edge, K], b: Field[Edge, K], c: Field[Cell, K], w: Field[Edge > Cell, K]
+):
+    once: Field[Edge > Cell, K]
+    twice: Field[Edge > Cell, K]
+    shifted: Field[Edge > Cell, K]
+    with levels_upward as k:
+        with sparse[Edge > Cell]:
+            once = c * w + a
+            twice = c - a
+            shifted = c * 2.0
+        a = sum_over(Edge > Cell, once * w)
+        b = sum_over(Edge > Cell, twice) + sum_over(Edge > Cell, twice * w)
+        b = sum_over(Edge > Cell, shifted[k - 1])
+
+
+@stencil
+def temporaries(a: Field[Edge], b: Field[Edge], c: Field[Cell]):
+    unused: Field[Edge]
+    write_only: Field[Edge]
+    feeds_dead: Field[Edge]
+    local: Field[Edge]
+    shifted: Field[Edge, K]
+    read_first: Field[Edge]
+    sparse_write_only: Field[Edge > Cell]
+    with levels_upward as k:
+        feeds_dead = a * 2.0
+        write_only = feeds_dead + 1.0
+        if a > 0.0:
+            write_only = 3.0
+        with sparse[Edge > Cell]:
+            sparse_write_only = c
+        local = a + b
+        b = sum_over(Edge > Cell, c * local)
+        shifted = local
+        a = shifted[k - 1] + read_first
+        read_first = a
@@ -0,0 +1,63 @@
+import threading
+
+from dusk.script import *
+from dusk.transpile import callable_to_pyast, pyast_to_sir
+from dusk.profiling import profile_matchers, profile_phases, phase
+from dusk.passes import optimization_passes
+
+
+def test_profile_matchers():
+    with profile_matchers() as profile:
+        pyast_to_sir(callable_to_pyast(profiled))
+
+    assert profile.rules["Grammar.binop"].calls == 2
+    assert profile.rules["Grammar.stencil"].successes == 1
+    assert profile.matchers["Grammar.expression"].failures == 0
+    assert "Grammar.binop" in profile.report()
+
+    # instrumentation is removed again
+    with profile_matchers() as profile:
+        pass
+    pyast_to_sir(callable_to_pyast(profiled))
+    assert not profile.rules
+
+
+def test_profile_phases():
+    finished = []
+    with profile_phases(lambda phase: finished.append(phase.name)) as profile:
+        # bypasses the AST cached by `@stencil`
+        pyast_to_sir(
+            callable_to_pyast(profiled.__wrapped__), passes=optimization_passes
+        )
+
+    passes = [stencil_pass.__name__ for stencil_pass in optimization_passes]
+    assert finished == ["ast.parse", "Grammar.stencil", *passes, "make_sir"]
+    assert profile.phases[1].args == {"stencil": "profiled"}
+
+    events = profile.to_chrome_trace()["traceEvents"]
+    assert [event["name"] for event in events] == finished
+    assert all(event["ph"] == "X" and 0 <= event["dur"] for event in events)
+
+
+def test_phases_per_thread():
+    def work():
+        with phase("work"):
+            pass
+
+    with profile_phases() as profile:
+        work()
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+    events = profile.to_chrome_trace()["traceEvents"]
+    # every thread has a track of its own
+    assert events[0]["tid"] == threading.get_ident()
+    assert events[1]["tid"] == thread.ident != events[0]["tid"]
+
+
+@stencil
+def profiled(a: Field[Edge], b: Field[Edge], c: Field[Edge > Cell]):
+    with levels_upward:
+        a = a + b * 2
+        b = sum_over(Edge > Cell, c)
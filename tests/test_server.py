@@ -0,0 +1,141 @@
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+from dusk import cli
+from dusk.cli import FileJob
+from dusk.server import Server, Client, run_task, default_socket_path, main
+
+
+stencil = """
+from dusk.script import *
+
+@stencil
+def {name}(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = {value}
+"""
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    socket_path = str(tmp_path / "dusk.sock")
+    monkeypatch.setenv("DUSK_SOCKET", socket_path)
+    server = Server(socket_path, workers=1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_server(tmp_path, socket_path):
+    (tmp_path / "good.py").write_text(stencil.format(name="good", value="b"))
+    (tmp_path / "bad.py").write_text(stencil.format(name="bad", value="c"))
+
+    client = Client.connect(socket_path)
+    assert client is not None
+    try:
+        good, bad = client.transpile(
+            [
+                FileJob(
+                    str(tmp_path / "good.py"), {"ico-naive": "good.cpp"}, "good.json"
+                ),
+                FileJob(str(tmp_path / "bad.py"), {"ico-naive": "bad.cpp"}, None),
+            ],
+            False,
+            None,
+        )
+        assert good.status == "ok" and good.sir and good.code
+        assert bad.status == "failed" and "c" in bad.message
+
+        (binary,) = client.transpile(
+            [FileJob(str(tmp_path / "good.py"), {}, "good.pb")],
+            False,
+            None,
+            sir_format="binary",
+        )
+        assert isinstance(binary.sir, bytes) and binary.sir
+
+        assert client.validate(str(tmp_path / "good.py")).status == "ok"
+        assert client.validate(str(tmp_path / "bad.py")).status == "failed"
+    finally:
+        client.close()
+
+
+def test_forwarding(tmp_path, socket_path, monkeypatch):
+    (tmp_path / "good.py").write_text(stencil.format(name="good", value="b"))
+    monkeypatch.chdir(tmp_path)
+    # the workers of the server aren't affected by this
+    monkeypatch.setattr("dusk.transpile.transpile", None)
+    monkeypatch.setattr(sys, "argv", ["dusk", "good.py", "--dump-sir"])
+    cli.main()
+    assert (tmp_path / "good_ico-naive.cpp").exists()
+    assert (tmp_path / "good.json").exists()
+
+
+def test_no_server(tmp_path):
+    assert Client.connect(str(tmp_path / "none.sock")) is None
+
+
+def test_version_mismatch(socket_path, monkeypatch):
+    # a server of another dusk (e.g., another checkout) isn't used
+    monkeypatch.setattr("dusk.cache._grammar_version", "other")
+    assert Client.connect(socket_path) is None
+
+    # but it's stopped anyway
+    main(["--socket", socket_path, "--stop"])
+
+
+def test_foreign_socket(socket_path):
+    # a socket which others could have created isn't trusted
+    os.chmod(socket_path, 0o666)
+    assert Client.connect(socket_path) is None
+
+
+def test_private_socket_directory(tmp_path, monkeypatch):
+    monkeypatch.delenv("DUSK_SOCKET", raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setenv("TMPDIR", str(tmp_path))
+    monkeypatch.setattr("tempfile.tempdir", None)
+    socket_path = default_socket_path()
+    assert os.path.dirname(os.path.dirname(socket_path)) == str(tmp_path)
+    server = Server(socket_path, workers=1)
+    try:
+        assert os.stat(os.path.dirname(socket_path)).st_mode & 0o777 == 0o700
+    finally:
+        server.server_close()
+
+    # a directory which others can write to isn't used
+    os.chmod(os.path.dirname(socket_path), 0o777)
+    with pytest.raises(RuntimeError, match="writable by others"):
+        Server(socket_path, workers=1)
+
+
+def test_running_server_is_kept(socket_path):
+    with pytest.raises(RuntimeError, match="already running"):
+        Server(socket_path, workers=1)
+    client = Client.connect(socket_path)
+    assert client is not None
+    client.close()
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    socket_path = str(tmp_path / "stale.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    server = Server(socket_path, workers=1)
+    server.server_close()
+
+
+def test_timeout():
+    # the task is interrupted, so its worker is free again
+    status = run_task(0.1, "slow.py", time.sleep, 60)
+    assert status.status == "failed" and "Timed out" in status.message
+    assert run_task(10.0, "fast.py", lambda: "done") == "done"
@@ -0,0 +1,64 @@
+from io import StringIO, BytesIO
+
+import pytest
+
+from dusk.transpile import (
+    str_to_pyast,
+    pyast_to_sir,
+    translate_stencils,
+    write_sir,
+    write_sir_stream,
+    read_sir_stream,
+)
+from dawn4py.serialization.SIR import SIR
+
+
+source = """
+from dusk.script import *
+
+@stencil
+def first(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = b + 1.0
+
+@stencil
+def second(a: Field[Edge], b: Field[Edge]):
+    with levels_upward:
+        a = c * 2.0
+
+@stencil
+def third(a: Field[Cell], b: Field[Cell]):
+    with levels_upward:
+        a = b * 3.0
+"""
+
+
+@pytest.mark.parametrize(
+    "sir_format, stream", [("jsonl", StringIO), ("length-prefixed", BytesIO)]
+)
+def test_streaming_roundtrip(sir_format, stream):
+    stencils = [s for s in str_to_pyast(source) if s.name != "second"]
+    sir = pyast_to_sir(stencils, filename="test.py")
+
+    out_file = stream()
+    count = write_sir_stream(
+        out_file, "test.py", translate_stencils(stencils), sir_format
+    )
+    assert count == 2
+    out_file.seek(0)
+    assert read_sir_stream(out_file, sir_format) == sir
+
+
+def test_binary():
+    sir = pyast_to_sir([s for s in str_to_pyast(source) if s.name != "second"])
+    out_file = BytesIO()
+    write_sir(out_file, sir, "binary")
+    assert SIR.FromString(out_file.getvalue()) == sir
+
+
+def test_streaming_errors():
+    # stencils are written as soon as they are translated, errors are raised last
+    out_file = StringIO()
+    with pytest.raises(Exception):
+        write_sir_stream(out_file, "test.py", translate_stencils(str_to_pyast(source)))
+    assert len(out_file.getvalue().splitlines()) == 3